@@ -1,45 +1,334 @@
-from xetra_jobs.common.constants import MetaFileConfig
 from xetra_jobs.transformers.transformers import ETL
-from xetra_jobs.transformers.config import ETLSourceConfig, ETLTargetConfig
-from xetra_jobs.s3.target_bucket import TargetBucketConnector
-from xetra_jobs.s3.source_bucket import SourceBucketConnector
+from xetra_jobs.meta.meta_file import MetaFile
+from xetra_jobs.common.cache import ResponseCache
+from xetra_jobs.common.constants import ResponseFormat
+from xetra_jobs.common import metrics
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+import atexit
+import hashlib
+import json
+import os
+import threading
 import yaml
-from flask import Flask, Response
+from flask import Flask, Response, current_app, request
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from dateutil.parser import parse
 import logging
 import logging.config
+import pyarrow as pa
 
-app = Flask(__name__)
+# media types of the response formats, the first format accepted by */* is records
+RESPONSE_MIMETYPES = {
+    ResponseFormat.RECORDS.value: 'application/json',
+    ResponseFormat.SPLIT.value: 'application/json',
+    ResponseFormat.ARROW.value: 'application/vnd.apache.arrow.stream',
+    ResponseFormat.PARQUET.value: 'application/vnd.apache.parquet',
+    ResponseFormat.NDJSON.value: 'application/x-ndjson',
+}
+
+
+class AppContext():
+    """
+    objects shared by all requests: configuration, logging, the ETL with its bucket connectors
+    and the response cache
+    the configuration file is only loaded again when it changed on disk
+    """
+
+    def __init__(self, config_path: str):
+        """
+        Constructor for AppContext
+
+        :param config_path: path to the yaml configuration file
+        """
+        self.config_path = config_path
+        self.config = None
+        self.etl = None
+        self.cache = None
+        # rows per chunk of streamed responses
+        self.stream_chunk_rows = 10000
+        self._mtime = None
+        self._lock = threading.Lock()
+        # requests running per ETL, a replaced ETL is closed once its last request finished
+        self._running = {}
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """
+        rebuild logging, configuration and connectors if the configuration file was modified
+
+        returns:
+            True if the configuration was loaded again
+        """
+        mtime = os.path.getmtime(self.config_path)
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            # another request may have reloaded while we waited for the lock
+            if mtime == self._mtime:
+                return False
+            with open(self.config_path) as f:
+                config = yaml.safe_load(f)
+            logging.config.dictConfig(config['logging'])
+            retired = self.etl
+            self.etl = ETL.from_config(config)
+            # requests still running with the old ETL share its parser processes
+            if retired is not None and retired not in self._running:
+                retired.close()
+            if config.get('metrics', {}).get('prometheus'):
+                # served by the /metrics route instead of a separate port
+                metrics.enable_prometheus()
+            # cached responses may depend on the old configuration, the disk tier
+            # only serves entries written under the same configuration
+            api_config = config.get('api', {})
+            self.cache = ResponseCache(max_bytes=api_config.get('cache_max_bytes', 64 * 1024 * 1024),
+                                       cache_dir=api_config.get('cache_dir'),
+                                       max_disk_bytes=api_config.get('cache_max_disk_bytes'),
+                                       namespace=hashlib.sha1(json.dumps(
+                                           config, sort_keys=True, default=str).encode()).hexdigest())
+            self.stream_chunk_rows = api_config.get('stream_chunk_rows', 10000)
+            self.config = config
+            self._mtime = mtime
+            logging.getLogger(__name__).info(
+                f'loaded configuration from {self.config_path}')
+        return True
+
+    def close(self):
+        """
+        stop the parser processes of the shared source connector
+        """
+        if self.etl is not None:
+            self.etl.close()
+
+    @contextmanager
+    def etl_for_date(self, input_date):
+        """
+        new ETL instance for a requested date, sharing the long-lived connectors
+        requests run concurrently, so the per-run state of the ETL is never shared,
+        the connectors stay open until the with block is left even if the configuration is reloaded
+
+        :param input_date: requested date in any format dateutil can parse, None for the configured date
+
+        yields:
+            an ETL instance
+        """
+        self.reload_if_changed()
+        with self._lock:
+            etl = self.etl
+            self._running[etl] = self._running.get(etl, 0) + 1
+        try:
+            yield etl.for_date(self.parse_date(input_date) or etl.input_date)
+        finally:
+            self._release(etl)
+
+    def _release(self, etl: ETL):
+        with self._lock:
+            self._running[etl] -= 1
+            if self._running[etl]:
+                return
+            del self._running[etl]
+            if etl is self.etl:
+                return
+        etl.close()
+
+    def parse_date(self, input_date):
+        """
+        a requested date in the input date format, None if it is missing or can not be parsed
+        """
+        try:
+            return parse(input_date).strftime(self.etl.input_date_format)
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    @staticmethod
+    def is_cacheable(etl: ETL, df):
+        """
+        only past dates that are recorded in the meta file can not change anymore
+        """
+        if df.empty:
+            return False
+        input_date = datetime.strptime(etl.input_date, etl.input_date_format)
+        if input_date.date() >= datetime.today().date():
+            return False
+        return MetaFile.date_in_meta_file(etl.input_date, etl.trg_bucket, etl.trg_args.trg_meta_layout)
+
+
+def negotiate_format(query_format: str = None, accept: str = None):
+    """
+    response format of a request, the format query parameter wins over the Accept header
+
+    :param query_format: value of the format query parameter, see common.constants.ResponseFormat
+    :param accept: Accept header, records if missing
+
+    returns:
+        a ResponseFormat value, None if no supported format is acceptable
+    """
+    if query_format:
+        return query_format if query_format in RESPONSE_MIMETYPES else None
+    if not accept:
+        return ResponseFormat.RECORDS.value
+    ranges = []
+    for position, media_range in enumerate(accept.split(',')):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, position, media_type.lower()))
+    for _, _, media_type in sorted(ranges):
+        for response_format, mimetype in RESPONSE_MIMETYPES.items():
+            if media_type in (mimetype, '*/*', f'{mimetype.split("/")[0]}/*'):
+                return response_format
+    return None
+
+
+def serialize(df, response_format: str):
+    """
+    the body of a dataframe in a response format other than ndjson
+
+    returns:
+        bytes
+    """
+    if response_format == ResponseFormat.SPLIT.value:
+        return df.to_json(orient="split", index=False).encode()
+    if response_format == ResponseFormat.ARROW.value:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    if response_format == ResponseFormat.PARQUET.value:
+        out_buffer = BytesIO()
+        df.to_parquet(out_buffer, index=False)
+        return out_buffer.getvalue()
+    return df.to_json(orient="records").encode()
+
+
+def stream_records(df, chunk_rows: int):
+    """
+    the rows of a dataframe as newline delimited json, one chunk of rows at a time
+    so the whole body is never held in memory
+
+    yields:
+        bytes
+    """
+    for start in range(0, len(df), chunk_rows):
+        lines = df.iloc[start:start + chunk_rows].to_json(orient="records", lines=True)
+        # older pandas versions do not end the last line
+        yield lines.rstrip('\n').encode() + b'\n'
+
+
+def respond(df, response_format: str, chunk_rows: int, headers: dict = None):
+    """
+    a flask response of a dataframe in a response format
+    """
+    headers = {'Vary': 'Accept', **(headers or {})}
+    mimetype = RESPONSE_MIMETYPES[response_format]
+    if response_format == ResponseFormat.NDJSON.value:
+        return Response(stream_records(df, chunk_rows), mimetype=mimetype, headers=headers)
+    return Response(serialize(df, response_format), mimetype=mimetype, headers=headers)
+
+
+def not_acceptable():
+    """
+    406 response listing the supported response formats
+    """
+    return Response(f'supported formats: {", ".join(RESPONSE_MIMETYPES)}', status=406)
 
 
-@app.route('/daily', defaults={'input_date': None})
-@app.route('/daily/<input_date>', methods=["GET"])
 def get_daily(input_date):
-    with open("configs/config.yaml") as f:
-        config = yaml.safe_load(f)
-    try:
-        input_date = parse(input_date).strftime(
-            config["source"]["src_input_date_format"])
-        config["source"]["src_input_date"] = input_date
-    except:
-        pass
-    log_config = config['logging']
-    logging.config.dictConfig(log_config)
+    context = current_app.extensions['xetra']
     logger = logging.getLogger(__name__)
-    s3_config = config['s3']
-    src_bucket = SourceBucketConnector(access_key_name=s3_config['access_key_name'],
-                                       secret_access_key_name=s3_config['secret_access_key_name'],
-                                       endpoint_url=s3_config['src_endpoint_url'],
-                                       bucket_name=s3_config['src_bucket'])
-    trg_bucekt = TargetBucketConnector(access_key_name=s3_config['access_key_name'],
-                                       secret_access_key_name=s3_config['secret_access_key_name'],
-                                       endpoint_url=s3_config['trg_endpoint_url'],
-                                       bucket_name=s3_config['trg_bucket'])
-    src_config = ETLSourceConfig(**config['source'])
-    trg_config = ETLTargetConfig(**config['target'])
-    logger.info(f'xetra job started for {src_config.src_col_date}')
-    etl = ETL(src_bucket, trg_bucekt,
-              MetaFileConfig.META_KEY.value, src_config, trg_config)
-    df = etl.run()
-    logger.info(f'xetra job finished for {src_config.src_col_date}')
-    return Response(df.to_json(orient="records"), mimetype='application/json')
+    response_format = negotiate_format(request.args.get('format'), request.headers.get('Accept'))
+    if response_format is None:
+        return not_acceptable()
+    with context.etl_for_date(input_date) as etl:
+        isin = request.args.get('isin')
+        if isin is not None:
+            return get_daily_isin(etl, isin, response_format)
+        cache = context.cache
+        # streamed responses are never held in memory as a whole, so they are not cached
+        streamed = response_format == ResponseFormat.NDJSON.value
+        cache_key = f'{etl.input_date}.{response_format}'
+        body, tier = cache.get(cache_key) if not streamed else (None, None)
+        if body is not None:
+            return Response(body, mimetype=RESPONSE_MIMETYPES[response_format],
+                            headers={'X-Cache': 'HIT', 'X-Cache-Tier': tier, 'Vary': 'Accept'})
+        logger.info(f'xetra job started for {etl.input_date}')
+        df = etl.run()
+        logger.info(f'xetra job finished for {etl.input_date}')
+        if streamed:
+            return respond(df, response_format, context.stream_chunk_rows, {'X-Cache': 'BYPASS'})
+        body = serialize(df, response_format)
+        if context.is_cacheable(etl, df):
+            cache.put(cache_key, body)
+            status = 'MISS'
+        else:
+            status = 'BYPASS'
+        return Response(body, mimetype=RESPONSE_MIMETYPES[response_format],
+                        headers={'X-Cache': status, 'Vary': 'Accept'})
+
+
+def get_daily_isin(etl: ETL, isin: str, response_format: str):
+    """
+    the records of one ISIN of a date, loaded dates are read through the ISIN index
+    """
+    if etl.index_key() is not None and \
+            MetaFile.date_in_meta_file(etl.input_date, etl.trg_bucket, etl.trg_args.trg_meta_layout):
+        df = etl.lookup(isin, etl.input_date)
+    else:
+        df = etl.run()
+        if not df.empty:
+            df = df[df[etl.trg_args.trg_col_isin] == isin]
+    return respond(df, response_format, current_app.extensions['xetra'].stream_chunk_rows)
+
+
+def get_isin(isin):
+    """
+    the records of one ISIN between the dates of the from and to query parameters,
+    read through the ISIN index, to defaults to from and from to the configured date
+    """
+    context = current_app.extensions['xetra']
+    response_format = negotiate_format(request.args.get('format'), request.headers.get('Accept'))
+    if response_format is None:
+        return not_acceptable()
+    with context.etl_for_date(request.args.get('from')) as etl:
+        end_date = context.parse_date(request.args.get('to')) or etl.input_date
+        try:
+            df = etl.lookup(isin, etl.input_date, end_date)
+        except ValueError as error:
+            return Response(str(error), status=400)
+    return respond(df, response_format, context.stream_chunk_rows)
+
+
+def get_metrics():
+    prometheus = metrics.prometheus_metrics()
+    if prometheus is None:
+        return Response('prometheus metrics are not enabled', status=404)
+    return Response(generate_latest(prometheus.registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def create_app(config_path="configs/config.yaml"):
+    """
+    application factory, picked up by `flask run`
+
+    :param config_path: path to the yaml configuration file
+    """
+    app = Flask(__name__)
+    context = AppContext(config_path)
+    # flask has no shutdown hook, the parser processes are stopped at interpreter exit
+    atexit.register(context.close)
+    app.extensions['xetra'] = context
+    app.add_url_rule('/daily', view_func=get_daily,
+                     defaults={'input_date': None})
+    app.add_url_rule('/daily/<input_date>',
+                     view_func=get_daily, methods=["GET"])
+    app.add_url_rule('/isin/<isin>', view_func=get_isin, methods=["GET"])
+    app.add_url_rule('/metrics', view_func=get_metrics)
+    return app
@@ -0,0 +1,173 @@
+"""
+ASGI version of the /daily and /isin endpoints, a request waits for s3 on the event loop instead of
+blocking a worker thread, run it with any ASGI server, e.g.
+
+    uvicorn --factory asgi:create_app
+"""
+from app import AppContext, RESPONSE_MIMETYPES, negotiate_format, serialize, stream_records
+from xetra_jobs.common.constants import ResponseFormat
+from xetra_jobs.meta.meta_file import MetaFile
+from urllib.parse import parse_qs
+import asyncio
+import logging
+import re
+
+DAILY_PATH = re.compile(r'^/daily(?:/(?P<input_date>[^/]+))?/?$')
+ISIN_PATH = re.compile(r'^/isin/(?P<isin>[^/]+)/?$')
+
+
+class DailyApp():
+    """
+    ASGI application serving /daily and /daily/<input_date> with ETL.arun and /isin/<isin>
+    through the ISIN index, sharing the configuration, connectors and response cache of app.AppContext
+    """
+
+    def __init__(self, config_path="configs/config.yaml"):
+        """
+        Constructor for DailyApp
+
+        :param config_path: path to the yaml configuration file
+        """
+        self.context = AppContext(config_path)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    self.context.close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        match = DAILY_PATH.match(scope['path'])
+        isin_match = ISIN_PATH.match(scope['path'])
+        if (match is None and isin_match is None) or scope['method'] != 'GET':
+            await self.respond(send, 404, b'not found', 'text/plain')
+            return
+        query = parse_qs(scope.get('query_string', b'').decode())
+        accept = dict(scope.get('headers', [])).get(b'accept', b'').decode()
+        response_format = negotiate_format(query.get('format', [None])[0], accept)
+        if response_format is None:
+            await self.respond(send, 406, f'supported formats: {", ".join(RESPONSE_MIMETYPES)}'.encode(),
+                               'text/plain')
+            return
+        if isin_match is not None:
+            await self.get_isin(send, isin_match.group('isin'), query.get('from', [None])[0],
+                                query.get('to', [None])[0], response_format)
+            return
+        isin = query.get('isin', [None])[0]
+        if isin is not None:
+            await self.get_daily_isin(send, match.group('input_date'), isin, response_format)
+            return
+        await self.get_daily(send, match.group('input_date'), response_format)
+
+    async def get_daily(self, send, input_date, response_format: str):
+        """
+        send the records of a date from the response cache or ETL.arun in a response format,
+        ndjson is streamed in chunks and not cached
+        """
+        logger = logging.getLogger(__name__)
+        context = self.context
+        with context.etl_for_date(input_date) as etl:
+            content_type = RESPONSE_MIMETYPES[response_format]
+            streamed = response_format == ResponseFormat.NDJSON.value
+            cache = context.cache
+            cache_key = f'{etl.input_date}.{response_format}'
+            body, tier = cache.get(cache_key) if not streamed else (None, None)
+            if body is not None:
+                await self.respond(send, 200, body, content_type,
+                                   {'X-Cache': 'HIT', 'X-Cache-Tier': tier, 'Vary': 'Accept'})
+                return
+            logger.info(f'xetra job started for {etl.input_date}')
+            df = await etl.arun()
+            logger.info(f'xetra job finished for {etl.input_date}')
+            if streamed:
+                await self.respond_stream(send, stream_records(df, context.stream_chunk_rows), content_type,
+                                          {'X-Cache': 'BYPASS', 'Vary': 'Accept'})
+                return
+            loop = asyncio.get_running_loop()
+            body = await loop.run_in_executor(None, serialize, df, response_format)
+            if await loop.run_in_executor(None, context.is_cacheable, etl, df):
+                cache.put(cache_key, body)
+                status = 'MISS'
+            else:
+                status = 'BYPASS'
+            await self.respond(send, 200, body, content_type, {'X-Cache': status, 'Vary': 'Accept'})
+
+    async def get_daily_isin(self, send, input_date, isin: str, response_format: str):
+        """
+        send the records of one ISIN of a date, loaded dates are read through the ISIN index
+        """
+        loop = asyncio.get_running_loop()
+        with self.context.etl_for_date(input_date) as etl:
+            if etl.index_key() is not None and await loop.run_in_executor(
+                    None, MetaFile.date_in_meta_file, etl.input_date, etl.trg_bucket,
+                    etl.trg_args.trg_meta_layout):
+                df = await loop.run_in_executor(None, etl.lookup, isin, etl.input_date)
+            else:
+                df = await etl.arun()
+                if not df.empty:
+                    df = df[df[etl.trg_args.trg_col_isin] == isin]
+            await self.respond_frame(send, df, response_format)
+
+    async def get_isin(self, send, isin: str, start_date, end_date, response_format: str):
+        """
+        send the records of one ISIN between two dates read through the ISIN index,
+        end_date defaults to start_date and start_date to the configured date
+        """
+        context = self.context
+        loop = asyncio.get_running_loop()
+        with context.etl_for_date(start_date) as etl:
+            end_date = context.parse_date(end_date) or etl.input_date
+            try:
+                df = await loop.run_in_executor(None, etl.lookup, isin, etl.input_date, end_date)
+            except ValueError as error:
+                await self.respond(send, 400, str(error).encode(), 'text/plain')
+                return
+            await self.respond_frame(send, df, response_format)
+
+    async def respond_frame(self, send, df, response_format: str):
+        """
+        send a dataframe in a response format, ndjson is streamed in chunks
+        """
+        content_type = RESPONSE_MIMETYPES[response_format]
+        headers = {'Vary': 'Accept'}
+        if response_format == ResponseFormat.NDJSON.value:
+            await self.respond_stream(send, stream_records(df, self.context.stream_chunk_rows),
+                                      content_type, headers)
+            return
+        body = await asyncio.get_running_loop().run_in_executor(None, serialize, df, response_format)
+        await self.respond(send, 200, body, content_type, headers)
+
+    @staticmethod
+    def _headers(headers: dict):
+        return [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+
+    @classmethod
+    async def respond(cls, send, status: int, body: bytes, content_type: str, headers: dict = None):
+        headers = {'content-type': content_type, 'content-length': str(len(body)), **(headers or {})}
+        await send({'type': 'http.response.start', 'status': status, 'headers': cls._headers(headers)})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @classmethod
+    async def respond_stream(cls, send, chunks, content_type: str, headers: dict = None):
+        """
+        send a body chunk by chunk, without content-length the server uses chunked encoding
+        """
+        headers = {'content-type': content_type, **(headers or {})}
+        await send({'type': 'http.response.start', 'status': 200, 'headers': cls._headers(headers)})
+        for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def create_app(config_path="configs/config.yaml"):
+    """
+    application factory, picked up by `uvicorn --factory`
+
+    :param config_path: path to the yaml configuration file
+    """
+    return DailyApp(config_path)
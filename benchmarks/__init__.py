@@ -0,0 +1 @@
+"""benchmarks for xetra_jobs"""
@@ -0,0 +1,98 @@
+"""
+benchmark SourceBucketConnector.read_objects, serial loop vs thread pool
+
+the source bucket is mocked with moto, an artificial delay is added to every
+GetObject call to stand in for the S3 round trip latency, e.g.
+
+    python -m benchmarks.bench_read_objects --objects 24 --latency 0.05 --max-workers 8
+"""
+import argparse
+import os
+import time
+import boto3
+from moto import mock_s3
+from xetra_jobs.s3.source_bucket import SourceBucketConnector
+
+BUCKET_NAME = "xetra-benchmark"
+ENDPOINT_URL = "https://s3.us-east-1.amazonaws.com"
+HEADER = "ISIN,Mnemonic,SecurityDesc,SecurityType,Currency,SecurityID,Date,Time,StartPrice,MaxPrice,MinPrice,EndPrice,NumberOfTrades\n"
+COLUMNS = ["ISIN", "Date", "Time", "StartPrice",
+           "MaxPrice", "MinPrice", "EndPrice", "NumberOfTrades"]
+
+
+def make_object(date, hour, rows):
+    """
+    a csv body with the same layout as the *_BINS_XETRxx.csv source objects
+    """
+    lines = [HEADER]
+    for i in range(rows):
+        lines.append(
+            f"DE000A0D{i:04d},M{i},DESC,Common stock,EUR,{i},{date},{hour:02d}:{i % 60:02d},"
+            f"10.5,10.7,10.4,10.6,{i % 7 + 1}\n")
+    return "".join(lines)
+
+
+def upload_day(bucket, date, objects, rows):
+    for hour in range(objects):
+        key = f"{date}/{date}_BINS_XETR{hour:02d}.csv"
+        bucket.put_object(Body=make_object(date, hour, rows), Key=key)
+
+
+def add_latency(connector, latency):
+    """
+    sleep before every GetObject request sent by the connector
+    """
+    def sleep(**kwargs):
+        time.sleep(latency)
+    connector.storage.client.meta.events.register(
+        'before-call.s3.GetObject', sleep)
+
+
+def timed(connector, input_date, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = connector.read_objects(input_date, COLUMNS)
+        best = min(best, time.perf_counter() - start)
+    return best, df
+
+
+@mock_s3
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark serial vs concurrent read_objects')
+    parser.add_argument('--objects', type=int, default=24,
+                        help='objects per day')
+    parser.add_argument('--rows', type=int, default=1000,
+                        help='rows per object')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds added to every GetObject call')
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["AWS_ACCESS_KEY"] = "accesskey"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "secretaccesskey"
+    s3 = boto3.resource(service_name='s3', endpoint_url=ENDPOINT_URL)
+    s3.create_bucket(Bucket=BUCKET_NAME)
+    bucket = s3.Bucket(BUCKET_NAME)
+    input_date = "2021-09-17"
+    for date in ["2021-09-16", input_date]:
+        upload_day(bucket, date, args.objects, args.rows)
+
+    connector = SourceBucketConnector("AWS_ACCESS_KEY", "AWS_SECRET_ACCESS_KEY",
+                                      ENDPOINT_URL, BUCKET_NAME)
+    add_latency(connector, args.latency)
+    serial, df_serial = timed(connector, input_date, args.repeat)
+    connector.max_workers = args.max_workers
+    concurrent, df_concurrent = timed(connector, input_date, args.repeat)
+
+    assert df_serial.equals(df_concurrent)
+    print(f"objects: {2 * args.objects}, rows: {len(df_serial)}, latency: {args.latency}s")
+    print(f"serial:              {serial:.3f}s")
+    print(f"max_workers={args.max_workers:<3}      {concurrent:.3f}s")
+    print(f"speedup:             {serial / concurrent:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+benchmark suite of the ETL stages on synthetic xetra days
+
+the days are generated by benchmarks.generator and uploaded into a moto-mocked bucket or a local
+directory. read_objects, transform, write_s3 and the end-to-end ETL.run are timed (best of
+--repeat) and reported as rows/s and MB/s, the peak of python allocations is measured in a
+separate pass with tracemalloc. results can be saved as a baseline and later runs are compared
+against it, e.g.
+
+    python -m benchmarks.bench_suite --instruments 500 --days 2 --save benchmarks/baselines/default.json
+    python -m benchmarks.bench_suite --instruments 500 --days 2 --baseline benchmarks/baselines/default.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+import boto3
+import yaml
+from moto import mock_s3
+from benchmarks.generator import upload_days, workdays
+from xetra_jobs.transformers.transformers import ETL
+
+ENDPOINT_URL = "https://s3.us-east-1.amazonaws.com"
+SRC_BUCKET = "xetra-benchmark-source"
+TRG_BUCKET = "xetra-benchmark-target"
+MB = 1024 * 1024
+
+
+def make_etl(config: dict, backend: str, root: str, max_workers: int, engine: str = None,
+             parse_workers: int = 0):
+    """
+    an ETL instance on the benchmark buckets, without caches so every run reads the source objects
+    """
+    config = dict(config)
+    s3_config = {
+        "src_endpoint_url": ENDPOINT_URL,
+        "src_bucket": SRC_BUCKET,
+        "trg_endpoint_url": ENDPOINT_URL,
+        "trg_bucket": TRG_BUCKET,
+        "access_key_name": "AWS_ACCESS_KEY",
+        "secret_access_key_name": "AWS_SECRET_ACCESS_KEY",
+        "src_max_workers": max_workers,
+        "src_parse_workers": parse_workers
+    }
+    if backend == "local":
+        s3_config["src_local_dir"] = os.path.join(root, SRC_BUCKET)
+        s3_config["trg_local_dir"] = os.path.join(root, TRG_BUCKET)
+    else:
+        os.environ["AWS_ACCESS_KEY"] = "accesskey"
+        os.environ["AWS_SECRET_ACCESS_KEY"] = "secretaccesskey"
+        s3 = boto3.resource(service_name="s3", endpoint_url=ENDPOINT_URL)
+        s3.create_bucket(Bucket=SRC_BUCKET)
+        s3.create_bucket(Bucket=TRG_BUCKET)
+    config["s3"] = s3_config
+    config["source"] = dict(config["source"])
+    if engine is not None:
+        config["source"]["src_engine"] = engine
+    config.pop("metrics", None)
+    return ETL.from_config(config)
+
+
+def clear_target(etl: ETL):
+    keys = [obj.key for obj in etl.trg_bucket.storage.list()]
+    if keys:
+        etl.trg_bucket.storage.delete(keys)
+
+
+def measure(function, repeat: int, setup=None):
+    """
+    best wall time of repeat calls and the tracemalloc peak of one more call
+
+    returns:
+        a tuple of seconds, peak allocated bytes and the result of the last call
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def result(seconds: float, rows: int, size: int, peak: int):
+    return {"seconds": round(seconds, 4),
+            "rows_per_s": round(rows / seconds),
+            "mb_per_s": round(size / MB / seconds, 2),
+            "peak_alloc_mb": round(peak / MB, 1)}
+
+
+def run_suite(etl: ETL, dates: list, repeat: int):
+    """
+    time the stages on the last generated date, its previous workday is read with it
+
+    returns:
+        a dict of benchmark name -> seconds, rows_per_s, mb_per_s, peak_alloc_mb
+    """
+    input_date = dates[-1]
+    etl = etl.for_date(input_date)
+    columns = etl.src_args.src_columns
+    source = etl.src_bucekt
+    keys = [obj for date in dates[-2:] for obj in source.list_objects_by_date_prefix(date)]
+    src_size = sum(obj.size for obj in keys)
+    results = {}
+
+    seconds, peak, df = measure(
+        lambda: source.read_objects(input_date, columns, schema=etl.src_schema), repeat)
+    results["read_objects"] = result(seconds, len(df), src_size, peak)
+
+    seconds, peak, (df_trg, _) = measure(lambda: etl.transform(df), repeat)
+    # the size of the parsed frame is what transform works on
+    results["transform"] = result(seconds, len(df), int(df.memory_usage(deep=True).sum()), peak)
+
+    key = "benchmark/extracted.parquet"
+    seconds, peak, _ = measure(lambda: etl.trg_bucket.write_s3(df, key, "parquet"), repeat)
+    results["write_s3"] = result(seconds, len(df), etl.trg_bucket.storage.head(key).size, peak)
+
+    seconds, peak, _ = measure(etl.run, repeat, setup=lambda: clear_target(etl))
+    results["run"] = result(seconds, len(df), src_size, peak)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    print the results next to the baseline
+
+    returns:
+        False if a benchmark is slower than the baseline by more than tolerance
+    """
+    if baseline["params"] != results["params"]:
+        print(f"warning: baseline parameters differ: {baseline['params']}")
+    ok = True
+    print(f"{'benchmark':<14}{'seconds':>10}{'baseline':>10}{'ratio':>8}{'rows/s':>12}{'MB/s':>9}{'peak MB':>9}")
+    for name, current in results["results"].items():
+        base = baseline["results"].get(name)
+        ratio = current["seconds"] / base["seconds"] if base else float("nan")
+        flag = ""
+        if base and ratio > 1 + tolerance:
+            ok = False
+            flag = "  slower"
+        print(f"{name:<14}{current['seconds']:>10.3f}{base['seconds'] if base else float('nan'):>10.3f}"
+              f"{ratio:>8.2f}{current['rows_per_s']:>12}{current['mb_per_s']:>9}"
+              f"{current['peak_alloc_mb']:>9}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the ETL stages on synthetic xetra days")
+    parser.add_argument("--config", default="configs/config.yaml",
+                        help="configuration of the source and target columns")
+    parser.add_argument("--backend", choices=["moto", "local"], default="local")
+    parser.add_argument("--instruments", type=int, default=500)
+    parser.add_argument("--minutes", type=int, default=510, help="trading minutes per day")
+    parser.add_argument("--days", type=int, default=2, help="workdays to generate, at least 2")
+    parser.add_argument("--start-date", default="2021-09-16")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=["pandas", "arrow"], default=None,
+                        help="src_engine of ETL.run, the configured one if not set")
+    parser.add_argument("--max-workers", type=int, default=1)
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="parser processes of read_objects, 0 parses in the download threads")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write the results as a baseline to this path")
+    parser.add_argument("--baseline", help="compare the results against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline, 0.2 is 20%%")
+    args = parser.parse_args()
+    if args.days < 2:
+        parser.error("--days must be at least 2, the previous workday is read with the input date")
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    params = {"backend": args.backend, "instruments": args.instruments, "minutes": args.minutes,
+              "days": args.days, "seed": args.seed, "engine": args.engine,
+              "max_workers": args.max_workers, "parse_workers": args.parse_workers}
+    with ExitStack() as stack:
+        root = stack.enter_context(tempfile.TemporaryDirectory())
+        if args.backend == "moto":
+            stack.enter_context(mock_s3())
+        etl = make_etl(config, args.backend, root, args.max_workers, args.engine, args.parse_workers)
+        dates = workdays(args.start_date, args.days)
+        rows, size = upload_days(etl.src_bucekt.storage, dates, instruments=args.instruments,
+                                 minutes=args.minutes, seed=args.seed)
+        print(f"generated {len(dates)} days, {rows} rows, {size / MB:.1f} MB ({args.backend})")
+        results = {"params": params,
+                   "platform": {"python": platform.python_version(), "machine": platform.machine(),
+                                "processor": platform.processor()},
+                   "results": run_suite(etl, dates, args.repeat)}
+
+    ok = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            ok = compare(results, json.load(f), args.tolerance)
+    else:
+        print(json.dumps(results["results"], indent=2))
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved baseline to {args.save}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+synthetic xetra days with the layout of the deutsche-boerse-xetra-pds bucket
+
+every day is split into 24 hourly objects {date}/{date}_BINS_XETR{hour}.csv, the hours outside
+of trading only hold the header, like in the real bucket. prices follow a random walk per
+instrument and not every instrument trades in every minute. the data only depends on the seed,
+the date and the parameters, so every run of a benchmark reads the same objects
+"""
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from xetra_jobs.s3.storage import BaseStorage
+
+COLUMNS = ["ISIN", "Mnemonic", "SecurityDesc", "SecurityType", "Currency", "SecurityID",
+           "Date", "Time", "StartPrice", "MaxPrice", "MinPrice", "EndPrice", "TradedVolume",
+           "NumberOfTrades"]
+# xetra trades from 09:00 to 17:30 CET, the bucket uses UTC
+TRADING_START = 8 * 60
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def workdays(start_date: str, days: int):
+    """
+    the first days workdays from start_date on
+    """
+    date = datetime.strptime(start_date, DATE_FORMAT)
+    dates = []
+    while len(dates) < days:
+        if date.weekday() < 5:
+            dates.append(date.strftime(DATE_FORMAT))
+        date += timedelta(days=1)
+    return dates
+
+
+def generate_day(date: str, instruments: int = 3000, minutes: int = 510, activity: float = 0.3,
+                 seed: int = 0):
+    """
+    generate the rows of one trading day
+
+    :param date: date of the day, e.g. '2021-09-17'
+    :param instruments: number of ISINs
+    :param minutes: trading minutes of the day, starting at 08:00 UTC
+    :param activity: probability that an instrument trades in a minute
+    :param seed: seed of the random generator, the date is mixed in
+
+    returns:
+        a dataframe with the source columns, sorted by time
+    """
+    day = datetime.strptime(date, DATE_FORMAT).toordinal()
+    rng = np.random.default_rng([seed, day])
+    # the instruments and their price level are the same on every day
+    base_rng = np.random.default_rng(seed)
+    base_prices = np.round(base_rng.lognormal(3, 1, instruments), 2) + 0.5
+    drift = rng.normal(0, 0.02, (minutes, instruments)).cumsum(axis=0)
+    traded = rng.random((minutes, instruments)) < activity
+    minute_idx, instrument_idx = np.nonzero(traded)
+    start = base_prices[instrument_idx] * np.exp(drift[minute_idx, instrument_idx])
+    end = start * np.exp(rng.normal(0, 0.003, len(start)))
+    spread = np.abs(rng.normal(0, 0.002, len(start))) * start
+    time = TRADING_START + minute_idx
+    df = pd.DataFrame({
+        "ISIN": np.char.add("DE000", np.char.zfill(instrument_idx.astype(str), 7)),
+        "Mnemonic": np.char.add("M", instrument_idx.astype(str)),
+        "SecurityDesc": "SYNTHETIC SE",
+        "SecurityType": "Common stock",
+        "Currency": "EUR",
+        "SecurityID": 2504000 + instrument_idx,
+        "Date": date,
+        "Time": np.char.add(np.char.add(np.char.zfill((time // 60).astype(str), 2), ":"),
+                            np.char.zfill((time % 60).astype(str), 2)),
+        "StartPrice": start.round(2),
+        "MaxPrice": (np.maximum(start, end) + spread).round(2),
+        "MinPrice": (np.minimum(start, end) - spread).round(2),
+        "EndPrice": end.round(2),
+        "TradedVolume": rng.integers(1, 5000, len(start)),
+        "NumberOfTrades": rng.integers(1, 20, len(start))
+    })
+    df["Hour"] = time // 60
+    return df
+
+
+def day_objects(date: str, **params):
+    """
+    the hourly csv objects of a day
+
+    :param date: date of the day
+    :param params: parameters of generate_day
+
+    returns:
+        a dict of object key -> csv bytes
+    """
+    df = generate_day(date, **params)
+    objects = {}
+    hours = df.groupby("Hour")
+    for hour in range(24):
+        key = f"{date}/{date}_BINS_XETR{hour:02d}.csv"
+        rows = hours.get_group(hour) if hour in hours.groups else df.iloc[:0]
+        objects[key] = rows[COLUMNS].to_csv(index=False, float_format="%.2f").encode()
+    return objects
+
+
+def upload_days(storage: BaseStorage, dates: list, **params):
+    """
+    generate days and put their objects into a storage backend, moto s3 or a local directory
+
+    :param storage: storage backend of the source bucket
+    :param dates: dates to generate
+    :param params: parameters of generate_day
+
+    returns:
+        a tuple of the number of rows and the number of bytes uploaded
+    """
+    rows = size = 0
+    for date in dates:
+        for key, data in day_objects(date, **params).items():
+            storage.put(key, data)
+            # every object ends with a newline
+            rows += data.count(b"\n") - 1
+            size += len(data)
+    return rows, size
@@ -3,11 +3,14 @@ import logging
 import logging.config
 import yaml
 import argparse
-from xetra_jobs.common.constants import MetaFileConfig
+from datetime import datetime
 from xetra_jobs.transformers.transformers import ETL
-from xetra_jobs.transformers.config import ETLSourceConfig, ETLTargetConfig
-from xetra_jobs.s3.target_bucket import TargetBucketConnector
-from xetra_jobs.s3.source_bucket import SourceBucketConnector
+from xetra_jobs.transformers.backfill import Backfill
+from xetra_jobs.transformers.analytics import RollingAnalytics
+from xetra_jobs.transformers.config import ETLSourceConfig
+from xetra_jobs.meta.meta_file import MetaFile
+from xetra_jobs.common import metrics
+from xetra_jobs.common.constants import MetaFileLayout
 
 
 def main():
@@ -18,6 +21,14 @@ def main():
     parser = argparse.ArgumentParser(description='run xetra etl job')
     parser.add_argument(
         '--config', help='a yaml configuration file', default="configs/config.yaml")
+    parser.add_argument(
+        '--from', dest='from_date', help='backfill all missing dates starting from this date')
+    parser.add_argument(
+        '--to', dest='to_date', help='last date of the backfill, default to today')
+    parser.add_argument(
+        '--workers', type=int, default=1, help='number of backfill worker processes')
+    parser.add_argument(
+        '--analytics', action='store_true', help='update the rolling analytics after the job')
     args = parser.parse_args()
     with open(args.config) as f:
         config = yaml.safe_load(f)
@@ -29,30 +40,37 @@ def main():
     log_config = config['logging']
     logging.config.dictConfig(log_config)
     logger = logging.getLogger(__name__)
-    # reading s3 configuration
-    s3_config = config['s3']
-    # creating the S3BucketConnector class instances for source and target
-    src_bucket = SourceBucketConnector(access_key_name=s3_config['access_key_name'],
-                                       secret_access_key_name=s3_config['secret_access_key_name'],
-                                       endpoint_url=s3_config['src_endpoint_url'],
-                                       bucket_name=s3_config['src_bucket'])
-    trg_bucekt = TargetBucketConnector(access_key_name=s3_config['access_key_name'],
-                                       secret_access_key_name=s3_config['secret_access_key_name'],
-                                       endpoint_url=s3_config['trg_endpoint_url'],
-                                       bucket_name=s3_config['trg_bucket'])
-    # reading source configuration
+    metrics_config = config.get('metrics', {})
+    if metrics_config.get('prometheus'):
+        metrics.enable_prometheus(metrics_config.get('prometheus_port'))
+    if args.from_date:
+        to_date = args.to_date or datetime.today().strftime(
+            config['source']['src_input_date_format'])
+        logger.info(f'xetra backfill started for {args.from_date} to {to_date}')
+        with ETL.from_config(config) as etl:
+            backfill = Backfill(etl, max_workers=args.workers, config=config)
+            dates = backfill.run(args.from_date, to_date)
+        logger.info(f'xetra backfill finished, {len(dates)} dates processed')
+        if args.analytics:
+            RollingAnalytics(etl.trg_bucket, etl.trg_args).run()
+        return dates
     src_config = ETLSourceConfig(**config['source'])
-    # reading target configuration
-    trg_config = ETLTargetConfig(**config['target'])
-    # creating XetraETL class instance
+    # creating XetraETL class instance with its bucket connectors
     logger.info(f'xetra job started for {src_config.src_col_date}')
-    etl = ETL(src_bucket, trg_bucekt,
-              MetaFileConfig.META_KEY.value, src_config, trg_config)
-    # running etl job for xetra report1
-    df = etl.run()
+    with ETL.from_config(config) as etl:
+        # running etl job for xetra report1
+        df = etl.run()
+        if etl.trg_args.trg_meta_layout == MetaFileLayout.MARKERS.value and \
+                MetaFile.compact_meta_file(etl.trg_bucket, etl.trg_args.trg_meta_compact_markers):
+            logger.info('compacted meta file markers')
+        # a lookup reads one object per month instead of one per loaded date
+        if etl.index_key() is not None:
+            etl.compact_index([etl.input_date])
     logger.info(f'xetra job finished for {src_config.src_col_date}')
+    if args.analytics:
+        RollingAnalytics(etl.trg_bucket, etl.trg_args).run()
     print(
-        f"transformed dataframe saved to target bucket {s3_config['trg_bucket']}, example: ")
+        f"transformed dataframe saved to target bucket {config['s3']['trg_bucket']}, example: ")
     print(df.head())
     return df
 
@@ -0,0 +1 @@
+"""tests for the flask api"""
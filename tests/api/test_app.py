@@ -0,0 +1,212 @@
+"""tests for the flask application in app.py"""
+from tests.transformers.test_base_tranformer import TestBaseETL
+from app import create_app
+from xetra_jobs.transformers.transformers import ETL
+from xetra_jobs.common import metrics
+from prometheus_client import CollectorRegistry
+from dataclasses import asdict
+from io import BytesIO
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import tempfile
+import yaml
+import unittest
+from unittest.mock import patch
+
+
+class TestApp(TestBaseETL):
+    """
+    tests for the /daily endpoint and the long-lived application context
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.config = {
+            's3': {
+                'src_endpoint_url': self.bucket_config['endpoint_url'],
+                'src_bucket': self.bucket_config['bucket_name'],
+                'trg_endpoint_url': self.bucket_config['endpoint_url'],
+                'trg_bucket': self.bucket_config['bucket_name'],
+                'access_key_name': self.bucket_config['access_key_name'],
+                'secret_access_key_name': self.bucket_config['secret_access_key_name']
+            },
+            'source': asdict(self.src_config),
+            'target': asdict(self.trg_config),
+            'logging': {'version': 1, 'disable_existing_loggers': False}
+        }
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmp_dir.name, 'config.yaml')
+        self.write_config()
+        self.app = create_app(self.config_path)
+        self.client = self.app.test_client()
+        self.context = self.app.extensions['xetra']
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def write_config(self, mtime=None):
+        with open(self.config_path, 'w') as f:
+            yaml.safe_dump(self.config, f)
+        if mtime is not None:
+            os.utime(self.config_path, (mtime, mtime))
+
+    def test_get_daily(self):
+        """
+        test /daily/<date> returns the transformed records of the requested date
+        """
+        response = self.client.get('/daily/20210417')
+        self.assertEqual(200, response.status_code)
+        records = response.get_json()
+        self.assertEqual(self.df_trg.to_dict(orient='records'), records)
+
+    def test_get_daily_default_date(self):
+        """
+        test /daily falls back to the configured input date
+        """
+        response = self.client.get('/daily')
+        self.assertEqual(self.df_trg.to_dict(orient='records'), response.get_json())
+
+    def test_connectors_reused(self):
+        """
+        test connectors are created once and shared by requests
+        """
+        etl = self.context.etl
+        self.client.get('/daily/20210417')
+        self.client.get('/daily/20210417')
+        self.assertIs(etl, self.context.etl)
+        # requests get their own ETL instance, so per-run state is not shared
+        with self.context.etl_for_date(None) as request_etl:
+            self.assertIsNot(etl, request_etl)
+            self.assertIs(etl.trg_bucket, request_etl.trg_bucket)
+        self.assertIs(etl.src_bucekt.session, etl.trg_bucket.session)
+
+    def test_get_daily_cache(self):
+        """
+        test responses of processed past dates are served from the cache
+        """
+        first = self.client.get('/daily/20210417')
+        second = self.client.get('/daily/2021-04-17')
+        self.assertEqual('MISS', first.headers['X-Cache'])
+        self.assertEqual('HIT', second.headers['X-Cache'])
+        self.assertEqual('memory', second.headers['X-Cache-Tier'])
+        self.assertEqual(first.data, second.data)
+
+    def test_get_daily_cache_bypass(self):
+        """
+        test empty results are not cached
+        """
+        response = self.client.get('/daily/20210421')
+        self.assertEqual('BYPASS', response.headers['X-Cache'])
+        self.assertEqual([], response.get_json())
+
+    def test_reload_config_disk_cache(self):
+        """
+        test the disk tier survives a restart with the same configuration, but not a changed one
+        """
+        self.config['api'] = {'cache_dir': os.path.join(self.tmp_dir.name, 'responses')}
+        self.write_config(mtime=os.path.getmtime(self.config_path) + 10)
+        self.assertEqual('MISS', self.client.get('/daily/20210417').headers['X-Cache'])
+        restarted = create_app(self.config_path).test_client()
+        self.assertEqual('disk', restarted.get('/daily/20210417').headers['X-Cache-Tier'])
+        self.config['target']['trg_row_group_size'] = 1
+        self.write_config(mtime=os.path.getmtime(self.config_path) + 10)
+        self.assertEqual('MISS', self.client.get('/daily/20210417').headers['X-Cache'])
+
+    def test_reload_config(self):
+        """
+        test the configuration is only loaded again when the file changed
+        """
+        etl = self.context.etl
+        self.assertFalse(self.context.reload_if_changed())
+        self.config['source']['src_input_date'] = '2021-04-16'
+        self.write_config(mtime=os.path.getmtime(self.config_path) + 10)
+        with patch.object(etl, 'close') as close:
+            self.assertTrue(self.context.reload_if_changed())
+        # the parser processes of the replaced connector are stopped
+        close.assert_called_once()
+        self.assertIsNot(etl, self.context.etl)
+        self.assertEqual('2021-04-16', self.context.etl.input_date)
+
+    def test_reload_config_running_request(self):
+        """
+        test a replaced ETL is only closed after the requests using it finished
+        """
+        etl = self.context.etl
+        run = ETL.run
+
+        def reload_during_run(request_etl):
+            self.config['source']['src_input_date'] = '2021-04-16'
+            self.write_config(mtime=os.path.getmtime(self.config_path) + 10)
+            self.assertTrue(self.context.reload_if_changed())
+            close.assert_not_called()
+            return run(request_etl)
+
+        with patch.object(etl, 'close') as close, \
+                patch.object(ETL, 'run', autospec=True, side_effect=reload_during_run):
+            response = self.client.get('/daily/20210417')
+        self.assertEqual(self.df_trg.to_dict(orient='records'), response.get_json())
+        close.assert_called_once()
+        self.assertEqual({}, self.context._running)
+
+    def test_get_daily_formats(self):
+        """
+        test /daily negotiates columnar json, arrow, parquet and streamed ndjson, cached per format
+        """
+        records = self.df_trg.to_dict(orient='records')
+        split = self.client.get('/daily/20210417?format=split')
+        self.assertEqual('MISS', split.headers['X-Cache'])
+        self.assertEqual(list(self.df_trg.columns), split.get_json()['columns'])
+        pd.testing.assert_frame_equal(self.df_trg, pd.DataFrame(**split.get_json()))
+        arrow = self.client.get('/daily/20210417', headers={'Accept': 'application/vnd.apache.arrow.stream'})
+        self.assertEqual('application/vnd.apache.arrow.stream', arrow.mimetype)
+        self.assertEqual('MISS', arrow.headers['X-Cache'])
+        self.assertEqual(records, pa.ipc.open_stream(arrow.data).read_all().to_pylist())
+        parquet = self.client.get('/daily/20210417', headers={
+            'Accept': 'application/json;q=0.5, application/vnd.apache.parquet'})
+        self.assertEqual('application/vnd.apache.parquet', parquet.mimetype)
+        pd.testing.assert_frame_equal(self.df_trg, pd.read_parquet(BytesIO(parquet.data)))
+        self.assertEqual('HIT', self.client.get('/daily/20210417?format=arrow').headers['X-Cache'])
+        self.assertEqual(records, self.client.get('/daily/20210417', headers={'Accept': '*/*'}).get_json())
+        ndjson = self.client.get('/daily/20210417', headers={'Accept': 'application/x-ndjson'})
+        self.assertTrue(ndjson.is_streamed)
+        self.assertEqual(records, [json.loads(line) for line in ndjson.data.splitlines()])
+        self.assertEqual(406, self.client.get('/daily/20210417?format=xml').status_code)
+        self.assertEqual(406, self.client.get('/daily/20210417', headers={'Accept': 'text/csv'}).status_code)
+
+    def test_get_isin(self):
+        """
+        test /daily/<date>?isin= and /isin/<isin> serve the rows of an ISIN, read through the index
+        once the date is loaded
+        """
+        records = self.df_trg.to_dict(orient='records')
+        self.assertEqual(400, self.client.get('/isin/AT0000A0E9W5?from=20210417').status_code)
+        self.config['target']['trg_isin_index'] = True
+        self.write_config(mtime=os.path.getmtime(self.config_path) + 10)
+        self.assertEqual([], self.client.get('/isin/AT0000A0E9W5?from=20210417').get_json())
+        self.assertEqual(records, self.client.get('/daily/20210417?isin=AT0000A0E9W5').get_json())
+        with patch.object(ETL, 'run', side_effect=AssertionError('job started')):
+            self.assertEqual(records, self.client.get('/daily/20210417?isin=AT0000A0E9W5').get_json())
+            self.assertEqual([], self.client.get('/daily/20210417?isin=DE0005190003').get_json())
+            self.assertEqual(records, self.client.get(
+                '/isin/AT0000A0E9W5?from=2021-04-01&to=2021-04-30').get_json())
+
+    def test_get_metrics(self):
+        """
+        test /metrics serves the stage metrics once prometheus is enabled
+        """
+        self.assertEqual(404, self.client.get('/metrics').status_code)
+        metrics.enable_prometheus(registry=CollectorRegistry())
+        try:
+            self.client.get('/daily/20210417')
+            response = self.client.get('/metrics')
+        finally:
+            metrics.disable_prometheus()
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'xetra_stage_seconds_count{stage="extract"} 1.0', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""tests for the ASGI application in asgi.py"""
+from tests.transformers.test_base_tranformer import TestBaseETL
+from asgi import create_app
+from xetra_jobs.transformers.transformers import ETL
+from dataclasses import asdict
+import asyncio
+import json
+import os
+import pyarrow as pa
+import tempfile
+import yaml
+import unittest
+from unittest.mock import patch
+
+
+class TestAsgiApp(TestBaseETL):
+    """
+    tests for the /daily endpoint served by ETL.arun
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.config = {
+            's3': {
+                'src_endpoint_url': self.bucket_config['endpoint_url'],
+                'src_bucket': self.bucket_config['bucket_name'],
+                'trg_endpoint_url': self.bucket_config['endpoint_url'],
+                'trg_bucket': self.bucket_config['bucket_name'],
+                'access_key_name': self.bucket_config['access_key_name'],
+                'secret_access_key_name': self.bucket_config['secret_access_key_name']
+            },
+            'source': asdict(self.src_config),
+            'target': asdict(self.trg_config),
+            'logging': {'version': 1, 'disable_existing_loggers': False}
+        }
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        config_path = os.path.join(self.tmp_dir.name, 'config.yaml')
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(self.config, f)
+        self.config_path = config_path
+        self.app = create_app(config_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def write_config(self, mtime=None):
+        with open(self.config_path, 'w') as f:
+            yaml.safe_dump(self.config, f)
+        if mtime is not None:
+            os.utime(self.config_path, (mtime, mtime))
+
+    def request(self, path, method='GET', query=b'', headers=()):
+        """
+        send a request to the ASGI application
+
+        returns:
+            a tuple of status, headers and body, the chunks of a streamed body are joined
+        """
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.app({'type': 'http', 'method': method, 'path': path, 'query_string': query,
+                              'headers': list(headers)}, receive, send))
+        headers = {name.decode(): value.decode() for name, value in messages[0]['headers']}
+        return messages[0]['status'], headers, b''.join(message['body'] for message in messages[1:])
+
+    def test_asgi_get_daily(self):
+        """
+        test /daily/<date> returns the transformed records and caches them
+        """
+        status, headers, body = self.request('/daily/20210417')
+        self.assertEqual(200, status)
+        self.assertEqual('MISS', headers['x-cache'])
+        self.assertEqual(self.df_trg.to_dict(orient='records'), json.loads(body))
+        status, headers, cached = self.request('/daily/2021-04-17')
+        self.assertEqual('HIT', headers['x-cache'])
+        self.assertEqual(body, cached)
+
+    def test_asgi_get_daily_formats(self):
+        """
+        test /daily negotiates the response format and streams ndjson in chunks
+        """
+        records = self.df_trg.to_dict(orient='records')
+        status, headers, body = self.request('/daily/20210417', query=b'format=arrow')
+        self.assertEqual('application/vnd.apache.arrow.stream', headers['content-type'])
+        self.assertEqual(records, pa.ipc.open_stream(body).read_all().to_pylist())
+        status, headers, body = self.request(
+            '/daily/20210417', headers=[(b'accept', b'application/x-ndjson')])
+        self.assertNotIn('content-length', headers)
+        self.assertEqual(records, [json.loads(line) for line in body.splitlines()])
+        self.assertEqual(406, self.request('/daily/20210417', query=b'format=xml')[0])
+
+    def test_asgi_get_isin(self):
+        """
+        test /daily/<date>?isin= and /isin/<isin> serve the rows of an ISIN, read through the index
+        once the date is loaded
+        """
+        records = self.df_trg.to_dict(orient='records')
+        self.assertEqual(400, self.request('/isin/AT0000A0E9W5', query=b'from=20210417')[0])
+        self.config['target']['trg_isin_index'] = True
+        self.write_config(mtime=os.path.getmtime(self.config_path) + 10)
+        status, _, body = self.request('/isin/AT0000A0E9W5', query=b'from=20210417')
+        self.assertEqual((200, []), (status, json.loads(body)))
+        self.assertEqual(records, json.loads(self.request('/daily/20210417', query=b'isin=AT0000A0E9W5')[2]))
+        with patch.object(ETL, 'arun', side_effect=AssertionError('job started')):
+            self.assertEqual(records, json.loads(
+                self.request('/daily/20210417', query=b'isin=AT0000A0E9W5')[2]))
+            self.assertEqual([], json.loads(self.request('/daily/20210417', query=b'isin=DE0005190003')[2]))
+            status, headers, body = self.request('/isin/AT0000A0E9W5', query=b'from=2021-04-01&to=2021-04-30',
+                                                 headers=[(b'accept', b'application/x-ndjson')])
+            self.assertEqual(records, [json.loads(line) for line in body.splitlines()])
+
+    def test_asgi_not_found(self):
+        """
+        test unknown paths and methods are answered with 404
+        """
+        self.assertEqual(404, self.request('/weekly')[0])
+        self.assertEqual(404, self.request('/daily', method='POST')[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
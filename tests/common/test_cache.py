@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from xetra_jobs.common.cache import ResponseCache, FrameCache
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    test the LRU response cache
+    """
+
+    def test_get_put(self):
+        """
+        a stored value is returned from memory, unknown keys are misses
+        """
+
+        cache = ResponseCache(max_bytes=100)
+        cache.put("2021-09-17", b"[]")
+        self.assertEqual((b"[]", ResponseCache.MEMORY), cache.get("2021-09-17"))
+        self.assertEqual((None, None), cache.get("2021-09-16"))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_lru_eviction(self):
+        """
+        the least recently used entries are evicted once max_bytes is exceeded
+        """
+
+        cache = ResponseCache(max_bytes=10)
+        cache.put("a", b"1234")
+        cache.put("b", b"1234")
+        cache.get("a")
+        cache.put("c", b"1234")
+        self.assertEqual((None, None), cache.get("b"))
+        self.assertEqual(b"1234", cache.get("a")[0])
+        self.assertEqual(b"1234", cache.get("c")[0])
+        self.assertEqual(8, cache.size)
+        # values larger than the cache are not kept in memory
+        cache.put("d", b"12345678901")
+        self.assertEqual((None, None), cache.get("d"))
+
+    def test_disk_tier(self):
+        """
+        values evicted from memory are served from disk and promoted again
+        """
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResponseCache(max_bytes=4, cache_dir=cache_dir)
+            cache.put("a", b"1234")
+            cache.put("b", b"1234")
+            self.assertEqual((b"1234", ResponseCache.DISK), cache.get("a"))
+            self.assertEqual((b"1234", ResponseCache.MEMORY), cache.get("a"))
+            # a new cache instance shares the disk tier
+            cache = ResponseCache(max_bytes=4, cache_dir=cache_dir)
+            self.assertEqual((b"1234", ResponseCache.DISK), cache.get("b"))
+
+    def test_disk_eviction(self):
+        """
+        the disk tier removes the least recently used files over max_disk_bytes
+        """
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResponseCache(max_bytes=0, cache_dir=cache_dir, max_disk_bytes=8)
+            cache.put("a", b"1234")
+            os.utime(cache._path("a"), (0, 0))
+            cache.put("b", b"1234")
+            cache.put("c", b"1234")
+            self.assertEqual((None, None), cache.get("a"))
+            self.assertEqual(b"1234", cache.get("b")[0])
+            self.assertEqual(b"1234", cache.get("c")[0])
+
+    def test_disk_eviction_startup_scan(self):
+        """
+        the disk tier lists its directory only once, files of a previous run are evicted by age
+        """
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            previous = ResponseCache(max_bytes=0, cache_dir=cache_dir)
+            previous.put("a", b"1234")
+            previous.put("b", b"1234")
+            os.utime(previous._path("a"), (0, 0))
+            cache = ResponseCache(max_bytes=0, cache_dir=cache_dir, max_disk_bytes=8)
+            with mock.patch("os.listdir", side_effect=AssertionError) as listdir, \
+                    mock.patch("os.stat", side_effect=AssertionError):
+                cache.put("c", b"1234")
+                self.assertEqual((None, None), cache.get("a"))
+                self.assertEqual(b"1234", cache.get("b")[0])
+                cache.put("d", b"1234")
+                listdir.assert_not_called()
+            self.assertEqual((None, None), cache.get("c"))
+            self.assertEqual(8, cache._disk.size)
+
+
+class TestFrameCache(unittest.TestCase):
+    """
+    test the on-disk dataframe cache
+    """
+
+    def test_get_put(self):
+        """
+        a stored dataframe keeps its column types, unknown keys are misses
+        """
+
+        df = pd.DataFrame({"isin": pd.Categorical(["A", "B"]),
+                           "time": pd.Series([540, 600], dtype="int16")}, index=[5, 6])
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = FrameCache(cache_dir)
+            key = cache.make_key("bucket", "2021-09-17/a.csv", '"etag"')
+            self.assertIsNone(cache.get(key))
+            cache.put(key, df)
+            pd.testing.assert_frame_equal(df.reset_index(drop=True), cache.get(key))
+            self.assertEqual(1, cache.hits)
+            self.assertEqual(1, cache.misses)
+            self.assertNotEqual(key, cache.make_key("bucket", "2021-09-17/a.csv", '"etag2"'))
+
+    def test_eviction(self):
+        """
+        the least recently used files are removed over max_bytes
+        """
+
+        df = pd.DataFrame({"col": range(1000)})
+        with tempfile.TemporaryDirectory() as cache_dir:
+            FrameCache(cache_dir).put("a", df)
+            size = os.path.getsize(os.path.join(cache_dir, "a.feather"))
+            os.utime(os.path.join(cache_dir, "a.feather"), (0, 0))
+            cache = FrameCache(cache_dir, max_bytes=2 * size)
+            cache.put("b", df)
+            cache.put("c", df)
+            self.assertIsNone(cache.get("a"))
+            self.assertIsNotNone(cache.get("b"))
+            self.assertIsNotNone(cache.get("c"))
+
+
+if __name__ == '__main__':
+    unittest.main()
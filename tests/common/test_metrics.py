@@ -0,0 +1,137 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from prometheus_client import CollectorRegistry
+from xetra_jobs.common import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    test the stage instrumentation
+    """
+
+    def tearDown(self):
+        metrics.disable_prometheus()
+
+    def test_stage_without_report(self):
+        """
+        stages outside of a run report are not measured
+        """
+
+        with metrics.stage('extract') as current:
+            current.rows_out = 3
+        self.assertIsNone(current.wall_seconds)
+
+    def test_run_report(self):
+        """
+        stages are recorded with wall time and memory, and summed up by name
+        """
+
+        with metrics.run_report(input_date='2021-09-17') as report:
+            with metrics.stage('read_object', key='a') as current:
+                current.bytes = 10
+                current.rows_out = 2
+            with metrics.stage('read_object', key='b') as current:
+                current.bytes = 5
+                current.rows_out = 1
+        self.assertEqual(2, len(report.stages))
+        self.assertEqual({'count': 2, 'bytes': 15, 'rows_in': 0, 'rows_out': 3},
+                         {name: value for name, value in report.totals()['read_object'].items()
+                          if name != 'wall_seconds'})
+        self.assertGreater(report.stages[0].peak_rss_bytes, 0)
+        self.assertGreaterEqual(report.wall_seconds, report.totals()['read_object']['wall_seconds'])
+        # stages after the report are not recorded
+        with metrics.stage('read_object'):
+            pass
+        self.assertEqual(2, len(report.stages))
+
+    def test_stage_peak_rss(self):
+        """
+        the peak RSS of a stage is sampled while it runs, not the lifetime high-water mark
+        """
+
+        with metrics.run_report() as report:
+            with metrics.stage('transform') as current:
+                rss_before = current.peak_rss_bytes
+                data = bytearray(200 * 1024 * 1024)
+                data[::4096] = b'x' * len(data[::4096])
+                time.sleep(0.1)
+                del data
+            with metrics.stage('load') as current:
+                pass
+        transform, load = report.stages
+        self.assertGreater(transform.peak_rss_bytes, rss_before + 150 * 1024 * 1024)
+        self.assertLess(transform.rss_bytes, transform.peak_rss_bytes - 150 * 1024 * 1024)
+        self.assertLess(load.peak_rss_bytes, transform.peak_rss_bytes - 150 * 1024 * 1024)
+        self.assertEqual(transform.peak_rss_bytes, report.to_dict()['peak_rss_bytes'])
+
+    def test_bind_report(self):
+        """
+        stages of worker threads are recorded in the report of the caller
+        """
+
+        def work():
+            with metrics.stage('read_object'):
+                pass
+
+        with metrics.run_report() as report:
+            thread = threading.Thread(target=metrics.bind_report(work))
+            thread.start()
+            thread.join()
+            # without binding the thread has no report
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        self.assertEqual(['read_object'], [stage.name for stage in report.stages])
+
+    def test_write(self):
+        """
+        the report is written as json
+        """
+
+        with metrics.run_report(input_date='2021-09-17') as report:
+            with metrics.stage('load', key='daily/20210917.parquet') as current:
+                current.rows_in = 4
+        with tempfile.TemporaryDirectory() as report_dir:
+            path = report.write(report_dir)
+            self.assertTrue(os.path.basename(path).startswith('run_2021-09-17_'))
+            with open(path) as f:
+                content = json.load(f)
+        self.assertEqual('2021-09-17', content['input_date'])
+        self.assertEqual(4, content['totals']['load']['rows_in'])
+        self.assertEqual('daily/20210917.parquet', content['stages'][0]['key'])
+
+    def test_prometheus(self):
+        """
+        stages are exported to prometheus also without a run report
+        """
+
+        registry = CollectorRegistry()
+        metrics.enable_prometheus(registry=registry)
+        with metrics.stage('write_s3') as current:
+            current.bytes = 100
+            current.rows_in = 7
+        self.assertEqual(100, registry.get_sample_value(
+            'xetra_stage_bytes_total', {'stage': 'write_s3'}))
+        self.assertEqual(7, registry.get_sample_value(
+            'xetra_stage_rows_total', {'stage': 'write_s3', 'direction': 'in'}))
+        self.assertEqual(1, registry.get_sample_value(
+            'xetra_stage_seconds_count', {'stage': 'write_s3'}))
+
+    def test_counting_reader(self):
+        """
+        the bytes read through the reader are counted
+        """
+
+        reader = metrics.CountingReader(io.BytesIO(b'a,b\n1,2\n'))
+        reader.read(3)
+        reader.read()
+        self.assertEqual(8, reader.bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
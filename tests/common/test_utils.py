@@ -1,5 +1,6 @@
 import unittest
-from xetra_jobs.common.utils import list_dates
+import pandas as pd
+from xetra_jobs.common.utils import list_dates, concat_frames
 
 
 class TestUtils(unittest.TestCase):
@@ -22,6 +23,29 @@ class TestUtils(unittest.TestCase):
         self.assertEqual([friday, sunday], list_dates(sunday, date_format))
         self.assertEqual([friday, saturday], list_dates(saturday, date_format))
 
+    def test_list_dates_end_date(self):
+        """
+        list_dates should list workdays up to end_date when single_day is false
+        """
+
+        date_format = "%Y-%m-%d"
+        result = list_dates("2021-09-13", date_format,
+                            single_day=False, end_date="2021-09-21")
+        self.assertEqual(["2021-09-10", "2021-09-13", "2021-09-14", "2021-09-15",
+                          "2021-09-16", "2021-09-17", "2021-09-20", "2021-09-21"], result)
+
+    def test_concat_frames(self):
+        """
+        concat_frames should keep categorical columns with different categories categorical
+        """
+
+        df1 = pd.DataFrame({"isin": pd.Categorical(["A", "B"]), "price": [1.0, 2.0]})
+        df2 = pd.DataFrame({"isin": pd.Categorical(["C"]), "price": [3.0]})
+        result = concat_frames([df1, pd.DataFrame(), df2])
+        self.assertIsInstance(result["isin"].dtype, pd.CategoricalDtype)
+        self.assertEqual(["A", "B", "C"], result["isin"].tolist())
+        self.assertEqual([0, 1, 2], result.index.tolist())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -110,6 +110,76 @@ class TestMetaFile(TestBaseBucketConnector):
         self.assertTrue(result1)
         self.assertFalse(result2)
 
+    def test_update_meta_file_markers(self):
+        """
+        test update_meta_file writes one marker per date without touching meta.csv
+        """
+        MetaFile.update_meta_file(
+            ['2021-09-13', '2021-09-14'], self.trg_bucket_connector, layout='markers')
+        keys = [obj.key for obj in self.bucket.objects.all()]
+        self.assertEqual(['meta/dates/2021-09-13', 'meta/dates/2021-09-14'], sorted(keys))
+        self.assertTrue(MetaFile.date_in_meta_file(
+            '2021-09-13', self.trg_bucket_connector, layout='markers'))
+        self.assertFalse(MetaFile.date_in_meta_file(
+            '2021-09-15', self.trg_bucket_connector, layout='markers'))
+
+    def test_compact_meta_file(self):
+        """
+        test compact_meta_file merges markers into the snapshot and deletes them
+        """
+        MetaFile.mark_date('2021-09-13', self.trg_bucket_connector)
+        MetaFile.mark_date('2021-09-14', self.trg_bucket_connector)
+        self.assertTrue(MetaFile.compact_meta_file(self.trg_bucket_connector))
+        MetaFile.mark_date('2021-09-15', self.trg_bucket_connector)
+        self.assertTrue(MetaFile.compact_meta_file(self.trg_bucket_connector))
+        # nothing left to compact
+        self.assertFalse(MetaFile.compact_meta_file(self.trg_bucket_connector))
+
+        keys = [obj.key for obj in self.bucket.objects.all()]
+        self.assertEqual([MetaFile.snapshot_key], keys)
+        df_snapshot = MetaFile.read_snapshot(self.trg_bucket_connector)
+        self.assertEqual(['2021-09-13', '2021-09-14', '2021-09-15'],
+                         df_snapshot[self.meta_date_col].tolist())
+        self.assertTrue(MetaFile.date_in_meta_file(
+            '2021-09-14', self.trg_bucket_connector, layout='markers'))
+
+    def test_compact_meta_file_min_markers(self):
+        """
+        test compact_meta_file waits for min_markers markers
+        """
+        MetaFile.mark_date('2021-09-13', self.trg_bucket_connector)
+        self.assertFalse(MetaFile.compact_meta_file(self.trg_bucket_connector, min_markers=2))
+        MetaFile.mark_date('2021-09-14', self.trg_bucket_connector)
+        self.assertTrue(MetaFile.compact_meta_file(self.trg_bucket_connector, min_markers=2))
+        self.assertEqual([MetaFile.snapshot_key], [obj.key for obj in self.bucket.objects.all()])
+
+    def test_date_in_meta_file_snapshot_cache(self):
+        """
+        test a date missing from the markers layout revalidates the cached snapshot instead of reading it
+        """
+        MetaFile.mark_date('2021-09-13', self.trg_bucket_connector)
+        MetaFile.compact_meta_file(self.trg_bucket_connector)
+        for _ in range(3):
+            self.assertFalse(MetaFile.date_in_meta_file(
+                '2021-09-15', self.trg_bucket_connector, layout='markers'))
+        self.assertEqual(1, self.trg_bucket_connector.meta_cache_misses)
+        self.assertEqual(2, self.trg_bucket_connector.meta_cache_hits)
+        # a new snapshot is downloaded again
+        MetaFile.mark_date('2021-09-15', self.trg_bucket_connector)
+        MetaFile.compact_meta_file(self.trg_bucket_connector)
+        self.assertTrue(MetaFile.date_in_meta_file(
+            '2021-09-15', self.trg_bucket_connector, layout='markers'))
+
+    def test_meta_dates_markers(self):
+        """
+        test meta_dates combines the snapshot and markers that are not compacted yet
+        """
+        MetaFile.mark_date('2021-09-13', self.trg_bucket_connector)
+        MetaFile.compact_meta_file(self.trg_bucket_connector)
+        MetaFile.mark_date('2021-09-14', self.trg_bucket_connector)
+        self.assertEqual({'2021-09-13', '2021-09-14'},
+                         MetaFile.meta_dates(self.trg_bucket_connector, layout='markers'))
+
 
 if __name__ == '__main__':
     unittest.main()
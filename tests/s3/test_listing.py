@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from xetra_jobs.s3.listing import ListingCache, ObjectInfo
+
+
+class TestListingCache(unittest.TestCase):
+    """
+    test the listing cache and its persisted index
+    """
+
+    objects = [ObjectInfo("2021-09-17/a.csv", '"etag"', 136),
+               ObjectInfo("2021-09-17/b.csv", '"etag"', 2000)]
+
+    def test_ttl(self):
+        """
+        listings of dates that can still change expire after ttl seconds
+        """
+
+        cache = ListingCache(ttl=10)
+        self.assertIsNone(cache.get("2021-09-17"))
+        cache.put("2021-09-17", self.objects)
+        self.assertEqual(self.objects, cache.get("2021-09-17"))
+        with patch("xetra_jobs.s3.listing.time.monotonic", return_value=float("inf")):
+            self.assertIsNone(cache.get("2021-09-17"))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    def test_index(self):
+        """
+        listings of published dates never expire and are saved sorted by date
+        """
+
+        with tempfile.TemporaryDirectory() as index_dir:
+            index_path = os.path.join(index_dir, "listing.json")
+            cache = ListingCache(ttl=0, index_path=index_path)
+            cache.put("2021-09-17", self.objects, published=True)
+            cache.put("2021-09-16", [], published=True)
+            self.assertEqual(self.objects, cache.get("2021-09-17"))
+            self.assertTrue(cache.save())
+            cache = ListingCache(ttl=0, index_path=index_path)
+            self.assertEqual(["2021-09-16", "2021-09-17"], cache.dates())
+            self.assertEqual(self.objects, cache.get("2021-09-17"))
+            self.assertEqual(2136, cache.size("2021-09-17"))
+            self.assertIsNone(cache.size("2021-09-20"))
+
+
+if __name__ == '__main__':
+    unittest.main()
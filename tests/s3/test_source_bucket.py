@@ -1,9 +1,15 @@
 """ Test SourceBucketConnector Methods"""
 
 from io import StringIO
+from unittest.mock import patch
+import tempfile
 import unittest
 import pandas as pd
+import pyarrow as pa
 from tests.s3.test_base_bucket import TestBaseBucketConnector
+from xetra_jobs.common.cache import FrameCache
+from xetra_jobs.s3.listing import ListingCache
+from xetra_jobs.common.exceptions import WrongSourceSchemaException
 
 
 class TestSourceBucketConnector(TestBaseBucketConnector):
@@ -58,6 +64,47 @@ class TestSourceBucketConnector(TestBaseBucketConnector):
             self.test_csv_key, columns=["col1"])
         self.assertTrue(result.equals(result_expected))
 
+    def test_read_object_chunks(self):
+        """
+        test reading an s3 object in chunks keeps all rows and only the selected columns
+        """
+
+        csv_content = "col1,col2\n" + "".join(f"val{i},{i}\n" for i in range(5))
+        self.bucket.put_object(Body=csv_content, Key=self.test_csv_key)
+        self.src_bucket_connector.chunksize = 2
+        chunks = list(self.src_bucket_connector.iter_object(
+            self.test_csv_key, columns=["col2"]))
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        df_result = self.src_bucket_connector.read_object(
+            self.test_csv_key, columns=["col2"])
+        self.assertEqual(["col2"], list(df_result.columns))
+        self.assertEqual(list(range(5)), df_result["col2"].tolist())
+
+    def test_read_object_empty(self):
+        """
+        test reading an empty or missing s3 object returns None
+        """
+
+        self.bucket.put_object(Body="", Key=self.test_csv_key)
+        self.assertIsNone(self.src_bucket_connector.read_object(
+            self.test_csv_key, columns="all"))
+        self.assertIsNone(self.src_bucket_connector.read_object(
+            "missing.csv", columns="all"))
+
+    def test_read_tables(self):
+        """
+        test reading objects of several dates into one arrow table skips empty and missing objects
+        """
+
+        self.bucket.put_object(Body="col1,col2\nvalA,1\n", Key="2021-09-16/a.csv")
+        self.bucket.put_object(Body="", Key="2021-09-17/a.csv")
+        self.bucket.put_object(Body="col1,col2\nNA,2\n", Key="2021-09-17/b.csv")
+        table = self.src_bucket_connector.read_tables(
+            ["2021-09-16", "2021-09-17"], ["col1", "col2"], {"col1": pa.string()})
+        self.assertEqual({"col1": ["valA", None], "col2": [1, 2]}, table.to_pydict())
+        self.assertIsNone(self.src_bucket_connector.read_tables(["2021-09-18"]))
+        self.assertIsNone(self.src_bucket_connector.read_table("missing.csv", "all"))
+
     def test_read_objects(self):
         """
         test reading all objects with specific date prefix and concat them into a dataframe works
@@ -84,6 +131,153 @@ class TestSourceBucketConnector(TestBaseBucketConnector):
             "2021-09-17", "all")).to_csv(index=False)
         self.assertEqual(csv_expected, csv_result)
 
+    def test_read_objects_concurrent(self):
+        """
+        test reading objects in a thread pool keeps the same row order as the serial loop
+        """
+
+        dates = ["2021-09-16", "2021-09-17"]
+        for date in dates:
+            for hour in range(12):
+                key = f"{date}/{date}_BINS_XETR{hour:02d}.csv"
+                self.bucket.put_object(
+                    Body=f"col1,col2\n{key},{hour}\n", Key=key)
+        df_expected = self.src_bucket_connector.read_objects(
+            "2021-09-17", "all")
+        self.src_bucket_connector.max_workers = 4
+        df_result = self.src_bucket_connector.read_objects(
+            "2021-09-17", "all")
+        self.assertEqual(24, len(df_result))
+        self.assertTrue(df_result.equals(df_expected))
+
+    def test_read_objects_pipelined(self):
+        """
+        test parser processes fed by a bounded queue keep the row order, skip empty objects
+        and give up on a failed download instead of waiting for it
+        """
+
+        dates = ["2021-09-16", "2021-09-17"]
+        for date in dates:
+            for hour in range(6):
+                key = f"{date}/{date}_BINS_XETR{hour:02d}.csv"
+                body = f"col1,col2\n{key},{hour}\n" if hour != 3 else ""
+                self.bucket.put_object(Body=body, Key=key)
+        df_expected = self.src_bucket_connector.read_objects(
+            "2021-09-17", "all")
+        self.src_bucket_connector.max_workers = 4
+        self.src_bucket_connector.parse_workers = 2
+        self.src_bucket_connector.queue_size = 1
+        with self.src_bucket_connector:
+            df_result = self.src_bucket_connector.read_objects(
+                "2021-09-17", "all")
+            self.assertEqual(10, len(df_result))
+            pd.testing.assert_frame_equal(df_expected, df_result)
+            with patch.object(self.src_bucket_connector.storage, "get", side_effect=OSError("timeout")):
+                with self.assertRaises(OSError):
+                    self.src_bucket_connector.read_objects("2021-09-17", "all")
+        # the parser processes are stopped when the connector is closed
+        self.assertIsNone(self.src_bucket_connector._parse_pool)
+
+    def test_read_objects_skip_header_only(self):
+        """
+        test header-only and empty objects are skipped by their listed size,
+        the header is read once per date and checked against the columns
+        """
+
+        header = "col1,col2\n"
+        date = "2021-09-17"
+        for hour in range(6):
+            key = f"{date}/{date}_BINS_XETR{hour:02d}.csv"
+            body = f"{header}{key},{hour}\n" if hour % 2 else header
+            self.bucket.put_object(Body=body, Key=key)
+        self.bucket.put_object(Body="", Key=f"{date}/{date}_BINS_XETR06.csv")
+        storage = self.src_bucket_connector.storage
+        with patch.object(storage, "get_range", wraps=storage.get_range) as get_range, \
+                patch.object(storage, "open", wraps=storage.open) as open_object:
+            df_result = self.src_bucket_connector.read_day(date, ["col1", "col2"])
+            self.src_bucket_connector.read_day(date, ["col1", "col2"])
+        self.assertEqual([1, 3, 5], df_result["col2"].tolist())
+        # one header read, then only the three objects with rows on each read
+        self.assertEqual(1, get_range.call_count)
+        self.assertEqual(6, open_object.call_count)
+        with self.assertRaises(WrongSourceSchemaException):
+            self.src_bucket_connector.read_day(date, ["col1", "col3"])
+
+    def test_read_header(self):
+        """
+        test the header is read with bounded ranges and only the headers of the last dates are kept
+        """
+
+        header = ",".join(f"column{i}" for i in range(20)) + "\n"
+        self.src_bucket_connector.header_read_bytes = 16
+        self.src_bucket_connector.header_cache_dates = 2
+        for date in ["2021-09-15", "2021-09-16", "2021-09-17"]:
+            self.bucket.put_object(Body=header + "x," * 10000, Key=f"{date}/{date}_BINS_XETR08.csv")
+        storage = self.src_bucket_connector.storage
+        with patch.object(storage, "get_range", wraps=storage.get_range) as get_range:
+            for date in ["2021-09-15", "2021-09-16", "2021-09-17"]:
+                self.assertEqual(1, len(self.src_bucket_connector.list_data_keys(date, ["column19"])))
+        # 16, 32, 64, 128 and 256 bytes until the end of the header
+        self.assertEqual([16, 32, 64, 128, 256], [call.args[2] for call in get_range.call_args_list[:5]])
+        self.assertEqual(["2021-09-16", "2021-09-17"], list(self.src_bucket_connector._headers))
+
+    def test_read_objects_cache(self):
+        """
+        test parsed objects are served from the local cache until their ETag changes
+        """
+
+        key = "2021-09-17/2021-09-17_BINS_XETR08.csv"
+        self.bucket.put_object(Body="col1,col2\nvalA,1\n", Key=key)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.src_bucket_connector.cache = FrameCache(cache_dir)
+            df_expected = self.src_bucket_connector.read_objects("2021-09-17", "all")
+            with patch.object(self.src_bucket_connector, "_iter_csv") as iter_csv:
+                df_result = self.src_bucket_connector.read_objects("2021-09-17", "all")
+                iter_csv.assert_not_called()
+            self.assertTrue(df_result.equals(df_expected))
+            # objects read without listing are addressed with a HEAD request
+            self.assertTrue(self.src_bucket_connector.read_object(
+                key, "all").equals(df_expected))
+            self.assertEqual(2, self.src_bucket_connector.cache.hits)
+            # a replaced object has a new ETag
+            self.bucket.put_object(Body="col1,col2\nvalB,2\n", Key=key)
+            df_result = self.src_bucket_connector.read_objects("2021-09-17", "all")
+            self.assertEqual(["valB"], df_result["col1"].tolist())
+            self.assertIsNone(self.src_bucket_connector.read_object("missing.csv", "all"))
+
+    def test_list_dates_range(self):
+        """
+        test a date range is listed at once and later listings of its dates are served from the cache
+        """
+
+        for date in ["2021-09-15", "2021-09-16", "2021-09-17", "2021-09-20"]:
+            for hour in range(2):
+                self.bucket.put_object(Body=self.test_csv_content,
+                                       Key=f"{date}/{date}_BINS_XETR{hour:02d}.csv")
+        self.src_bucket_connector.listing = ListingCache(ttl=300)
+        result = self.src_bucket_connector.list_dates_range("2021-09-16", "2021-09-17")
+        self.assertEqual(["2021-09-16", "2021-09-17"], list(result))
+        self.assertEqual(["2021-09-17/2021-09-17_BINS_XETR00.csv", "2021-09-17/2021-09-17_BINS_XETR01.csv"],
+                         [obj.key for obj in result["2021-09-17"]])
+        with patch.object(self.src_bucket_connector.storage, "list") as list_filter:
+            keys = self.src_bucket_connector.list_keys_by_date_prefix("2021-09-16")
+            list_filter.assert_not_called()
+        self.assertEqual(2, len(keys))
+        self.assertEqual(["2021-09-15", "2021-09-16", "2021-09-17", "2021-09-20"],
+                         self.src_bucket_connector.list_available_dates())
+
+    def test_list_dates_range_published_late(self):
+        """
+        test empty past dates of a range are not kept as published, their objects are found once uploaded
+        """
+
+        self.src_bucket_connector.listing = ListingCache(ttl=0)
+        self.assertEqual({}, self.src_bucket_connector.list_dates_range("2021-09-16", "2021-09-17"))
+        self.assertEqual([], self.src_bucket_connector.listing.dates())
+        self.bucket.put_object(Body=self.test_csv_content, Key="2021-09-17/2021-09-17_BINS_XETR00.csv")
+        self.assertEqual(["2021-09-17/2021-09-17_BINS_XETR00.csv"],
+                         self.src_bucket_connector.list_keys_by_date_prefix("2021-09-17"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from xetra_jobs.common.exceptions import ObjectNotFoundException
+from xetra_jobs.s3.source_bucket import SourceBucketConnector
+from xetra_jobs.s3.storage import LocalStorage, RangeReader
+from xetra_jobs.s3.target_bucket import TargetBucketConnector
+
+
+class TestLocalStorage(unittest.TestCase):
+    """
+    test the local directory storage backend and the connectors running on it
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_list(self):
+        """
+        test listings are sorted by key and support prefixes, start_after and delimiters
+        """
+
+        for key in ["2021-09-17/b.csv", "2021-09-16/a.csv", "2021-09-17/a.csv", "meta.csv"]:
+            self.storage.put(key, "col1\nvalA\n")
+        self.assertEqual(["2021-09-17/a.csv", "2021-09-17/b.csv"],
+                         [obj.key for obj in self.storage.list("2021-09-17")])
+        self.assertEqual(["2021-09-17/a.csv", "2021-09-17/b.csv", "meta.csv"],
+                         [obj.key for obj in self.storage.list(start_after="2021-09-17")])
+        self.assertEqual(["2021-09-16/", "2021-09-17/"], self.storage.list_prefixes())
+        self.assertEqual(10, self.storage.head("meta.csv").size)
+
+    def test_list_subtree(self):
+        """
+        test listings only scan the directories that can hold the prefix
+        """
+
+        for key in ["2021-09-16/a.csv", "2021-09-17/a.csv", "daily/year=2021/month=09/20210917.parquet"]:
+            self.storage.put(key, "col1\nvalA\n")
+        os.makedirs(os.path.join(self.tmp_dir.name, "daily", "empty"))
+        scanned = []
+        walk = os.walk
+
+        def walk_spy(top, *args, **kwargs):
+            for dirpath, dirnames, filenames in walk(top, *args, **kwargs):
+                scanned.append(os.path.relpath(dirpath, self.tmp_dir.name))
+                yield dirpath, dirnames, filenames
+
+        with patch("os.walk", walk_spy):
+            self.assertEqual(["2021-09-17/a.csv"], [obj.key for obj in self.storage.list("2021-09-17/")])
+            self.assertEqual(["2021-09-17"], scanned)
+            scanned.clear()
+            self.assertEqual(["daily/year=2021/month=09/20210917.parquet"],
+                             [obj.key for obj in self.storage.list(start_after="2021-09-17/a.csv")])
+            self.assertNotIn("2021-09-16", scanned)
+            self.assertEqual(["daily/year=2021/"], self.storage.list_prefixes("daily/"))
+            self.assertEqual(["daily/year=2021/month=09/"], self.storage.list_prefixes("daily/year=2021/mon"))
+            self.assertEqual([], self.storage.list_prefixes("weekly/"))
+
+    def test_get_put(self):
+        """
+        test reads are memory-mapped and revalidated with the ETag, writes leave no temporary files
+        """
+
+        self.storage.put("daily/meta.csv", b"date\n2021-09-17\n")
+        data, etag = self.storage.get("daily/meta.csv")
+        self.assertEqual(b"date\n2021-09-17\n", bytes(data))
+        self.assertEqual((None, etag), self.storage.get("daily/meta.csv", if_none_match=etag))
+        self.assertEqual(["meta.csv"], os.listdir(os.path.join(self.tmp_dir.name, "daily")))
+        body = self.storage.open("daily/meta.csv")
+        self.assertEqual(b"date", body.read(4))
+        body.close()
+        self.storage.put("empty.csv", b"")
+        self.assertEqual(b"", self.storage.open("empty.csv").read())
+        self.storage.delete(["daily/meta.csv", "missing.csv"])
+        for method in [self.storage.head, self.storage.open, self.storage.get]:
+            with self.assertRaises(ObjectNotFoundException):
+                method("daily/meta.csv")
+
+    def test_get_range(self):
+        """
+        test ranged reads and a RangeReader serving reads from prefetched ranges
+        """
+
+        self.storage.put("data.bin", bytes(range(100)))
+        self.assertEqual(bytes(range(10, 20)), self.storage.get_range("data.bin", 10, 20))
+        self.assertEqual(bytes(range(95, 100)), self.storage.get_range("data.bin", 95, 120))
+        with self.assertRaises(ObjectNotFoundException):
+            self.storage.get_range("missing.bin", 0, 10)
+        reader = RangeReader(self.storage, "data.bin", 100, hole_size=5)
+        # the first two ranges are merged into one request
+        reader.prefetch([(10, 20), (22, 30), (60, 70)])
+        self.assertEqual(2, reader.requests)
+        reader.seek(12)
+        self.assertEqual(bytes(range(12, 28)), reader.read(16))
+        reader.seek(-5, 2)
+        self.assertEqual(bytes(range(95, 100)), reader.read())
+        self.assertEqual(3, reader.requests)
+
+    def test_open_write(self):
+        """
+        test streaming writes become visible on close and are discarded on errors
+        """
+
+        with self.storage.open_write("daily/20210917.csv") as out_stream:
+            out_stream.write(b"col1\n")
+            self.assertEqual([], list(self.storage.list("daily/")))
+            out_stream.write(b"valA\n")
+        self.assertEqual(b"col1\nvalA\n", bytes(self.storage.get("daily/20210917.csv")[0]))
+        with self.assertRaises(ValueError):
+            with self.storage.open_write("daily/20210916.csv") as out_stream:
+                out_stream.write(b"col1\n")
+                raise ValueError("serialization failed")
+        self.assertEqual(["20210917.csv"], os.listdir(os.path.join(self.tmp_dir.name, "daily")))
+
+    def test_connectors(self):
+        """
+        test the bucket connectors work on a local directory without s3 credentials
+        """
+
+        self.storage.put("2021-09-17/2021-09-17_BINS_XETR08.csv", "col1,col2\nvalA,1\n")
+        src_bucket_connector = SourceBucketConnector(None, None, "local", "src", storage=self.storage)
+        df_result = src_bucket_connector.read_objects("2021-09-17", "all")
+        self.assertEqual(["valA"], df_result["col1"].tolist())
+        self.assertIsNone(src_bucket_connector.read_object("missing.csv", "all"))
+
+        trg_bucket_connector = TargetBucketConnector(None, None, "local", "trg", storage=self.storage)
+        df = pd.DataFrame({"col1": ["valA", "valB"]})
+        trg_bucket_connector.write_s3(df, "daily/20210917.parquet", "parquet")
+        self.assertTrue(df.equals(trg_bucket_connector.read_object("daily/20210917.parquet", "parquet")))
+        self.assertEqual(["2021-09-17"], trg_bucket_connector.list_existing_dates())
+        self.assertTrue(trg_bucket_connector.read_meta_file().empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
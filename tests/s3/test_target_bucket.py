@@ -2,8 +2,11 @@ from tests.s3.test_base_bucket import TestBaseBucketConnector
 from xetra_jobs.common.exceptions import WrongFileFormatException
 from xetra_jobs.common.constants import MetaFileConfig
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
 from io import StringIO, BytesIO
+from unittest.mock import patch
 import unittest
 
 
@@ -79,6 +82,75 @@ class TestTargetBucketConnector(TestBaseBucketConnector):
         df_result = pd.read_parquet(out_buffer)
         self.assertTrue(df_result.equals(df_expected))
 
+    def test_read_row_groups(self):
+        """
+        test write_s3 indexes the row groups of the values and read_row_groups reads
+        only the row groups of a value with ranged GETs
+        """
+
+        df = pd.DataFrame({'isin': [f'DE{i:03d}' for i in range(100) for _ in range(10)],
+                           'price': range(1000)})
+        self.trg_bucket_connector.write_s3(df, 'daily/20210917.parquet', 'parquet', row_group_size=100,
+                                           index_column='isin', index_key='index/2021-09/20210917.parquet')
+        index = self.trg_bucket_connector.read_index('index/2021-09/')
+        self.assertEqual(100, len(index))
+        self.assertEqual(list(range(10)), sorted(index['row_group'].unique()))
+        entries = index[index['isin'] == 'DE042']
+        self.assertEqual([4], list(entries['row_group']))
+        with patch.object(self.trg_bucket_connector.storage, 'get',
+                          side_effect=AssertionError('whole object downloaded')), \
+                patch.object(self.trg_bucket_connector.storage, 'get_range',
+                             wraps=self.trg_bucket_connector.storage.get_range) as get_range:
+            df_result = self.trg_bucket_connector.read_row_groups(entries, columns=['isin', 'price'])
+        # the footer and the row group, fetched together when they are close
+        self.assertLessEqual(get_range.call_count, 2)
+        self.assertLess(sum(end - start for _, start, end in
+                            (call.args for call in get_range.call_args_list)),
+                        self.bucket.Object('daily/20210917.parquet').content_length)
+        pd.testing.assert_frame_equal(df.iloc[400:500].reset_index(drop=True), df_result)
+
+    def test_read_partitioned(self):
+        """
+        test read_partitioned only downloads the footers and the row groups matching the filter
+        """
+
+        df = pd.DataFrame({'isin': [f'DE{i:03d}' for i in range(1000) for _ in range(100)],
+                           'price': np.random.default_rng(0).random(100000)})
+        self.trg_bucket_connector.write_s3(df, 'daily/20210917.parquet', 'parquet', row_group_size=10000)
+        filter_expression = ds.scalar(False) | (ds.field('isin') == 'DE420') | (ds.field('isin') == 'DE421')
+        with patch.object(self.trg_bucket_connector.storage, 'get',
+                          side_effect=AssertionError('whole object downloaded')), \
+                patch.object(self.trg_bucket_connector.storage, 'get_range',
+                             wraps=self.trg_bucket_connector.storage.get_range) as get_range:
+            df_result = self.trg_bucket_connector.read_partitioned(
+                ['daily/20210917.parquet'], filter_expression, columns=['price'])
+        self.assertEqual(df['price'][42000:42200].tolist(), df_result['price'].tolist())
+        # the tail with the footer and one of the ten row groups
+        self.assertEqual(2, get_range.call_count)
+        size = self.bucket.Object('daily/20210917.parquet').content_length
+        self.assertLess(sum(end - start for _, start, end in
+                            (call.args for call in get_range.call_args_list)), size / 5)
+
+    def test_compact_index(self):
+        """
+        test the indexes of a month are merged into one object and a rewritten object replaces its rows
+        """
+
+        df = pd.DataFrame({'isin': ['DE001', 'DE002'], 'price': [1, 2]})
+        for day in ['20210916', '20210917']:
+            self.trg_bucket_connector.write_s3(df, f'daily/{day}.parquet', 'parquet', index_column='isin',
+                                               index_key=f'index/2021-09/{day}.parquet')
+        self.assertTrue(self.trg_bucket_connector.compact_index('index/2021-09/'))
+        self.assertFalse(self.trg_bucket_connector.compact_index('index/2021-09/'))
+        self.assertEqual(['index/2021-09.parquet'], [key for key, _ in self.trg_bucket_connector.list_objects('index/')])
+        self.trg_bucket_connector.write_s3(df.iloc[:1], 'daily/20210917.parquet', 'parquet', index_column='isin',
+                                           index_key='index/2021-09/20210917.parquet')
+        index = self.trg_bucket_connector.read_index('index/2021-09/')
+        self.assertEqual([('DE001', 'daily/20210916.parquet'), ('DE002', 'daily/20210916.parquet'),
+                          ('DE001', 'daily/20210917.parquet')], list(zip(index['isin'], index['key'])))
+        df_result = self.trg_bucket_connector.read_row_groups(index[index['isin'] == 'DE001'])
+        self.assertEqual(['DE001', 'DE002', 'DE001'], list(df_result['isin']))
+
     def test_write_s3_wrong_format(self):
         """
         test write_s3 generates expected error and logs when given unsupported file formats
@@ -95,6 +167,63 @@ class TestTargetBucketConnector(TestBaseBucketConnector):
             # log test after method execution
             self.assertIn(log_expected, log.output[0])
 
+    def test_write_s3_multipart(self):
+        """
+        test objects larger than one part are streamed as a multipart upload in parallel parts
+        """
+
+        storage = self.trg_bucket_connector.storage
+        storage.part_size = 1024
+        storage.upload_workers = 2
+        df_expected = pd.DataFrame({'col1': [f'val{i}' for i in range(2000)], 'col2': range(2000)})
+        # moto enforces the 5 MiB minimum size of s3 parts
+        with patch('moto.s3.models.S3_UPLOAD_PART_MIN_SIZE', 0), \
+                patch.object(storage.client, 'create_multipart_upload',
+                             wraps=storage.client.create_multipart_upload) as create_upload:
+            self.trg_bucket_connector.write_s3(
+                df_expected, self.test_parquet_key, self.test_parquet_format, row_group_size=100)
+            self.trg_bucket_connector.write_s3(
+                df_expected, self.test_csv_key, self.test_csv_format)
+            self.assertEqual(2, create_upload.call_count)
+        df_result = self.trg_bucket_connector.read_object(
+            self.test_parquet_key, self.test_parquet_format)
+        self.assertTrue(df_result.equals(df_expected))
+        df_result = self.trg_bucket_connector.read_object(
+            self.test_csv_key, self.test_csv_format)
+        self.assertTrue(df_result.equals(df_expected))
+
+    def test_open_write_parts(self):
+        """
+        test a streaming write is cut into parts of part_size whatever the size of the writes
+        """
+
+        storage = self.trg_bucket_connector.storage
+        storage.part_size = 1024
+        data = bytes(range(256)) * 10
+        with patch('moto.s3.models.S3_UPLOAD_PART_MIN_SIZE', 0), \
+                patch.object(storage.client, 'upload_part', wraps=storage.client.upload_part) as upload_part:
+            with storage.open_write(self.test_csv_key) as out_stream:
+                for start in range(0, len(data), 700):
+                    out_stream.write(memoryview(data)[start:start + 700])
+                self.assertEqual(len(data), out_stream.tell())
+        self.assertEqual([1024, 1024, 512], [len(call.kwargs['Body']) for call in upload_part.call_args_list])
+        self.assertEqual(data, storage.get(self.test_csv_key)[0])
+
+    def test_open_write_abort(self):
+        """
+        test a failed streaming write leaves neither an object nor an unfinished upload
+        """
+
+        storage = self.trg_bucket_connector.storage
+        storage.part_size = 1024
+        with self.assertRaises(ValueError):
+            with storage.open_write(self.test_csv_key) as out_stream:
+                out_stream.write(b'x' * 3000)
+                raise ValueError('serialization failed')
+        self.assertFalse(self.trg_bucket_connector.object_exists(self.test_csv_key))
+        uploads = storage.client.list_multipart_uploads(Bucket=self.bucket.name)
+        self.assertEqual([], uploads.get('Uploads', []))
+
     def test_list_existing_dates(self):
         """
         test list_existing_dates returns correct date list
@@ -110,6 +239,17 @@ class TestTargetBucketConnector(TestBaseBucketConnector):
         dates_result = self.trg_bucket_connector.list_existing_dates()
         self.assertEqual(set([date1, date2]), set(dates_result))
 
+    def test_list_existing_dates_key_date_format(self):
+        """
+        test list_existing_dates reads dates of keys in the configured key date format
+        """
+
+        for key in ["daily/20210917.parquet", "daily/year=2021/month=09/20210916.parquet",
+                    "daily/20210917.csv", "daily/readme.txt"]:
+            self.bucket.put_object(Body=self.test_csv_content, Key=key)
+        self.assertEqual(["2021-09-16", "2021-09-17"],
+                         self.trg_bucket_connector.list_existing_dates())
+
     def test_read_meta_file(self):
         """
         test read_meta_file works when there is one
@@ -139,6 +279,35 @@ class TestTargetBucketConnector(TestBaseBucketConnector):
         df_result = self.trg_bucket_connector.read_meta_file()
         self.assertTrue(df_result.equals(df_expcted))
 
+    def test_read_meta_file_cache(self):
+        """
+        test read_meta_file only downloads the meta file again when its ETag changed
+        """
+
+        date_new = '2021-09-14'
+        csv_content = f"{self.date_col},{self.timestamp_col}\n{self.test_date},2021-09-20 20:37:33"
+        self.bucket.put_object(Body=csv_content, Key=self.meta_key)
+        df_first = self.trg_bucket_connector.read_meta_file()
+        df_second = self.trg_bucket_connector.read_meta_file()
+        self.assertTrue(df_first.equals(df_second))
+        self.assertEqual(1, self.trg_bucket_connector.meta_cache_misses)
+        self.assertEqual(1, self.trg_bucket_connector.meta_cache_hits)
+        self.assertEqual({self.test_date}, self.trg_bucket_connector.meta_dates())
+        # the meta file changed in s3
+        self.bucket.put_object(
+            Body=f"{csv_content}\n{date_new},2021-09-20 20:37:33", Key=self.meta_key)
+        self.assertEqual({self.test_date, date_new},
+                         self.trg_bucket_connector.meta_dates())
+        self.assertEqual(2, self.trg_bucket_connector.meta_cache_misses)
+        self.assertEqual(2, self.trg_bucket_connector.meta_cache_hits)
+
+    def test_meta_dates_none(self):
+        """
+        test meta_dates is empty when there is no meta file
+        """
+
+        self.assertEqual(set(), self.trg_bucket_connector.meta_dates())
+
 
 if __name__ == '__main__':
     unittest.main()
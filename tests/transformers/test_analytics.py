@@ -0,0 +1,86 @@
+from tests.transformers.test_base_tranformer import TestBaseETL
+from xetra_jobs.transformers.analytics import RollingAnalytics
+from dataclasses import replace
+import unittest
+import numpy as np
+import pandas as pd
+
+
+class TestRollingAnalytics(TestBaseETL):
+    """
+    tests for the rolling analytics of the daily dataset
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.trg_config = replace(self.trg_config, trg_analytics_windows=(2, 3))
+        rng = np.random.default_rng(0)
+        dates = pd.bdate_range('2021-04-01', periods=8).strftime('%Y-%m-%d')
+        rows = []
+        for i, date in enumerate(dates):
+            for isin in ['AT0000A0E9W5', 'DE000A0D6554', 'DE0005190003']:
+                # the second ISIN does not trade on every day
+                if isin == 'DE000A0D6554' and i % 3 == 1:
+                    continue
+                close = rng.uniform(10, 20)
+                rows.append([isin, date, close, close, close - 1, close + 1,
+                             int(rng.integers(1, 1000)), None])
+        self.df_daily = pd.DataFrame(rows, columns=self.df_trg.columns)
+
+    def expected(self, df):
+        """
+        the metrics computed with pandas rolling windows over the rows of each ISIN
+        """
+        args = self.trg_config
+        df = df.sort_values([args.trg_col_isin, args.trg_col_date])
+        close = df.groupby(args.trg_col_isin)[args.trg_col_clos_price]
+        turnover = (df[args.trg_col_max_price] + df[args.trg_col_min_price] +
+                    df[args.trg_col_clos_price]) / 3 * df[args.trg_col_dail_trad_vol]
+        result = df[[args.trg_col_isin, args.trg_col_date]].copy()
+        for n in (2, 3):
+            result[f'return_{n}d'] = close.pct_change(n) * 100
+            result[f'volatility_{n}d'] = close.pct_change().groupby(df[args.trg_col_isin]) \
+                .rolling(n).std().reset_index(level=0, drop=True) * 100
+            result[f'ma_{n}d'] = close.rolling(n).mean().reset_index(level=0, drop=True)
+            result[f'vwap_{n}d'] = turnover.groupby(df[args.trg_col_isin]).rolling(n).sum() \
+                .reset_index(level=0, drop=True) / df.groupby(args.trg_col_isin)[
+                    args.trg_col_dail_trad_vol].rolling(n).sum().reset_index(level=0, drop=True)
+        return result.round(2).sort_values([args.trg_col_date, args.trg_col_isin]).reset_index(drop=True)
+
+    def test_update(self):
+        """
+        test the incremental metrics equal rolling windows over the whole history
+        """
+        analytics = RollingAnalytics(None, self.trg_config)
+        result = pd.concat([analytics.update(day) for _, day in
+                            self.df_daily.groupby(self.trg_config.trg_col_date)], ignore_index=True)
+        result = result.sort_values([self.trg_config.trg_col_date, self.trg_config.trg_col_isin]) \
+            .reset_index(drop=True)
+        pd.testing.assert_frame_equal(self.expected(self.df_daily), result)
+
+    def test_run_incremental(self):
+        """
+        test run only computes new dates from the stored state, with the same result as a rebuild
+        """
+        dates = sorted(self.df_daily[self.trg_config.trg_col_date].unique())
+        for date in dates[:5]:
+            self.etl.for_date(date).load(self.df_daily[self.df_daily['date'] == date])
+        analytics = RollingAnalytics(self.trg_bucket_connector, self.trg_config)
+        self.assertEqual(dates[:5], analytics.run())
+        for date in dates[5:]:
+            self.etl.for_date(date).load(self.df_daily[self.df_daily['date'] == date])
+        analytics = RollingAnalytics(self.trg_bucket_connector, self.trg_config)
+        self.assertEqual(dates[5:], analytics.run())
+        self.assertEqual([], analytics.run())
+        key = 'analytics/' + dates[-1].replace('-', '') + '.parquet'
+        df_incremental = self.trg_bucket_connector.read_object(key, 'parquet')
+        self.assertEqual(dates, analytics.run(rebuild=True))
+        df_rebuilt = self.trg_bucket_connector.read_object(key, 'parquet')
+        pd.testing.assert_frame_equal(df_rebuilt, df_incremental)
+        expected = self.expected(self.df_daily)
+        pd.testing.assert_frame_equal(
+            expected[expected['date'] == dates[-1]].reset_index(drop=True), df_incremental)
+
+
+if __name__ == "__main__":
+    unittest.main()
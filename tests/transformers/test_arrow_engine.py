@@ -0,0 +1,99 @@
+from tests.transformers.test_base_tranformer import TestBaseETL
+from xetra_jobs.transformers.arrow_engine import source_column_types, aggregate_daily, aggregate_bars
+from xetra_jobs.transformers.bars import resample_bars
+from xetra_jobs.transformers.transformers import ETL
+from dataclasses import replace
+import pandas as pd
+import pyarrow as pa
+import unittest
+
+
+class TestArrowEngine(TestBaseETL):
+    """
+    test the arrow engine produces the same output as the pandas engine
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.etl_arrow = ETL(self.src_bucket_connector, self.trg_bucket_connector, self.meta_key,
+                             replace(self.src_config, src_engine='arrow'), self.trg_config)
+
+    def test_aggregate_daily(self):
+        """
+        test the arrow aggregation matches transform for several ISINs
+        """
+        df_src = pd.DataFrame([['B', 'SANT', '2021-04-17', '14:00', 11.0, 11.0, 10.5, 11.5, 5],
+                               ['A', 'SANT', '2021-04-17', '15:00', 3.0, 3.0, 2.0, 3.5, 2],
+                               ['B', 'SANT', '2021-04-16', '09:00', 10.0, 10.0, 9.5, 10.5, 1],
+                               ['A', 'SANT', '2021-04-17', '09:00', 2.0, 2.0, 1.5, 2.5, 3],
+                               ['B', 'SANT', '2021-04-17', '09:00', 12.0, 12.0, 11.0, 12.5, 4],
+                               ['A', 'SANT', '2021-04-17', '09:00', 2.1, 2.1, 1.5, 2.5, 3],
+                               ['A', 'SANT', '2021-04-17', '12:00', None, 2.5, 2.2, 2.7, 9],
+                               ], columns=self.df_src.columns)
+        df_expected, _ = self.etl.transform(df_src)
+        table = pa.Table.from_pandas(df_src, preserve_index=False)
+        table = aggregate_daily(table, self.src_config, self.trg_config, self.input_date)
+        pd.testing.assert_frame_equal(df_expected, table.to_pandas(), check_exact=True)
+
+    def test_aggregate_daily_missing_volume(self):
+        """
+        test a missing volume gives an int64 daily volume with both engines
+        """
+        df_src = pd.DataFrame([['A', 'SANT', '2021-04-17', '09:00', 2.0, 2.0, 1.5, 2.5, 3],
+                               ['A', 'SANT', '2021-04-17', '12:00', 2.5, 2.5, 2.2, 2.7, None],
+                               ], columns=self.df_src.columns)
+        self.assertEqual('float64', df_src['TradedVolume'].dtype)
+        df_expected, _ = self.etl.transform(df_src)
+        self.assertEqual('int64', df_expected[self.trg_config.trg_col_dail_trad_vol].dtype)
+        table = pa.Table.from_pandas(df_src, preserve_index=False)
+        table = aggregate_daily(table, self.src_config, self.trg_config, self.input_date)
+        pd.testing.assert_frame_equal(df_expected, table.to_pandas(), check_exact=True)
+
+    def test_aggregate_bars(self):
+        """
+        test the arrow bars match the pandas bars
+        """
+        df_src = pd.DataFrame([['B', 'SANT', '2021-04-17', '09:14', 11.0, 11.2, 10.5, 11.5, 5],
+                               ['A', 'SANT', '2021-04-17', '09:20', 3.0, 3.1, 2.0, 3.5, 2],
+                               ['B', 'SANT', '2021-04-16', '09:00', 10.0, 10.0, 9.5, 10.5, 1],
+                               ['B', 'SANT', '2021-04-17', '09:01', 12.0, 12.1, 11.0, 12.5, 4],
+                               ['A', 'SANT', '2021-04-17', '10:05', 2.1, 2.2, 1.5, 2.5, 3],
+                               ], columns=self.df_src.columns)
+        df_sorted = df_src.sort_values(by='Time', kind='mergesort')
+        expected = resample_bars(df_sorted, self.src_config, self.trg_config, self.input_date, [15, 60])
+        result = aggregate_bars(pa.Table.from_pandas(df_src, preserve_index=False),
+                                self.src_config, self.trg_config, self.input_date, [15, 60])
+        for interval in [15, 60]:
+            pd.testing.assert_frame_equal(expected[interval], result[interval].to_pandas())
+        self.assertEqual(['09:00', '10:00', '09:00'], expected[60]['time'].tolist())
+        self.assertEqual([3.0, 2.1, 12.0], expected[60]['opening_price'].tolist())
+        self.assertEqual([3.1, 2.2, 11.2], expected[60]['closing_price'].tolist())
+        self.assertEqual(['09:15', '10:00', '09:00'], expected[15]['time'].tolist())
+
+    def test_run(self):
+        """
+        test a run with the arrow engine loads the same data as the pandas engine
+        """
+        df_result = self.etl_arrow.run()
+        pd.testing.assert_frame_equal(self.df_trg, df_result)
+        df_saved = self.trg_bucket_connector.read_object(self.trg_key, self.trg_config.trg_format)
+        pd.testing.assert_frame_equal(self.df_trg, df_saved)
+        # the second run reads the loaded date from the target bucket
+        pd.testing.assert_frame_equal(self.df_trg, self.etl_arrow.run())
+
+    def test_run_no_source_data(self):
+        """
+        test a run without source objects returns an empty dataframe
+        """
+        self.assertTrue(self.etl_arrow.for_date('2021-04-21').run().empty)
+
+    def test_source_column_types(self):
+        """
+        test only the configured columns get a type
+        """
+        types = source_column_types(replace(self.src_config, src_columns=['ISIN', 'TradedVolume']))
+        self.assertEqual({'ISIN': pa.string(), 'TradedVolume': pa.int64()}, types)
+
+
+if __name__ == '__main__':
+    unittest.main()
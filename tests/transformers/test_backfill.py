@@ -0,0 +1,104 @@
+from tests.transformers.test_base_tranformer import TestBaseETL
+from xetra_jobs.transformers.backfill import Backfill
+from xetra_jobs.meta.meta_file import MetaFile
+from dataclasses import replace
+import pandas as pd
+import unittest
+
+
+class TestBackfill(TestBaseETL):
+    """
+    tests for running the ETL job over a range of dates
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.df_backfill = pd.DataFrame([['AT0000A0E9W5', 'SANT', '2021-04-19',
+                                          '09:00', 20.00, 20.10, 19.90, 20.20, 100],
+                                         ['AT0000A0E9W5', 'SANT', '2021-04-20',
+                                          '09:00', 22.00, 22.10, 21.90, 22.20, 200],
+                                         ], columns=self.df_src.columns)
+        self.trg_bucket_connector.write_s3(self.df_backfill.loc[0:0],
+                                           '2021-04-19/2021-04-19_BINS_XETR09.csv', 'csv')
+        self.trg_bucket_connector.write_s3(self.df_backfill.loc[1:1],
+                                           '2021-04-20/2021-04-20_BINS_XETR09.csv', 'csv')
+        self.backfill = Backfill(self.etl)
+
+    def test_missing_dates(self):
+        """
+        test missing_dates lists workdays of the range that are not in the meta file
+        """
+        MetaFile.update_meta_file('2021-04-19', self.trg_bucket_connector)
+        result = self.backfill.missing_dates('2021-04-16', '2021-04-21')
+        self.assertEqual(['2021-04-16', '2021-04-20', '2021-04-21'], result)
+
+    def test_split_dates(self):
+        """
+        test dates are split into chunks of neighbouring dates
+        """
+        self.backfill.max_workers = 2
+        chunks = self.backfill.split_dates(['a', 'b', 'c'])
+        self.assertEqual([['a', 'b'], ['c']], chunks)
+
+    def test_run(self):
+        """
+        test run loads every missing date, reads each source day once and updates the meta file once
+        """
+        read_day = self.src_bucket_connector.read_day
+        days_read = []
+
+        def read_day_spy(date, columns, schema=None):
+            days_read.append(date)
+            return read_day(date, columns, schema)
+
+        self.src_bucket_connector.read_day = read_day_spy
+        result = self.backfill.run('2021-04-19', '2021-04-20')
+
+        self.assertEqual(['2021-04-19', '2021-04-20'], result)
+        self.assertEqual(['2021-04-16', '2021-04-19', '2021-04-20'], days_read)
+        df_result = self.trg_bucket_connector.read_object(
+            'daily/20210420.parquet', self.trg_config.trg_format)
+        self.assertEqual([10.0], df_result['pct'].tolist())
+        meta_df = self.trg_bucket_connector.read_meta_file()
+        self.assertEqual(result, meta_df[self.meta_date_col].tolist())
+
+    def test_run_gap(self):
+        """
+        test a date after a date already in the meta file is compared with that date, not the date read before
+        """
+        # all prices of 2021-04-21 are twice the prices of 2021-04-20
+        self.trg_bucket_connector.write_s3(pd.DataFrame([['AT0000A0E9W5', 'SANT', '2021-04-21',
+                                                          '09:00', 44.00, 44.20, 43.80, 44.40, 300]],
+                                                        columns=self.df_src.columns),
+                                           '2021-04-21/2021-04-21_BINS_XETR09.csv', 'csv')
+        MetaFile.update_meta_file('2021-04-20', self.trg_bucket_connector)
+        self.backfill.max_workers = 1
+        self.assertEqual(['2021-04-19', '2021-04-21'], self.backfill.run('2021-04-19', '2021-04-21'))
+        df_result = self.trg_bucket_connector.read_object(
+            'daily/20210421.parquet', self.trg_config.trg_format)
+        self.assertEqual([100.0], df_result['pct'].tolist())
+
+    def test_run_markers(self):
+        """
+        test run marks dates one by one and compacts the markers at the end with the markers layout
+        """
+        self.etl.trg_args = replace(self.trg_config, trg_meta_layout='markers')
+        result = self.backfill.run('2021-04-19', '2021-04-20')
+        self.assertEqual(['2021-04-19', '2021-04-20'], result)
+        self.assertEqual([], self.trg_bucket_connector.list_objects(MetaFile.marker_prefix))
+        self.assertEqual({'2021-04-19', '2021-04-20'},
+                         MetaFile.meta_dates(self.trg_bucket_connector, layout='markers'))
+        self.assertEqual(['2021-04-16', '2021-04-21'],
+                         self.backfill.missing_dates('2021-04-16', '2021-04-21'))
+
+    def test_run_nothing_missing(self):
+        """
+        test run does nothing when all dates are in the meta file
+        """
+        MetaFile.update_meta_file(
+            ['2021-04-19', '2021-04-20'], self.trg_bucket_connector)
+        self.assertEqual([], self.backfill.run('2021-04-19', '2021-04-20'))
+
+
+if __name__ == '__main__':
+    unittest.main()
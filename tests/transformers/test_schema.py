@@ -0,0 +1,76 @@
+from tests.transformers.test_base_tranformer import TestBaseETL
+from xetra_jobs.transformers.schema import SourceSchema
+from xetra_jobs.transformers.transformers import ETL
+from dataclasses import replace
+import pandas as pd
+import unittest
+
+
+class TestSourceSchema(TestBaseETL):
+    """
+    tests for compact column types of the source data
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.src_config = replace(self.src_config, src_compact_dtypes=True)
+        self.etl = ETL(self.src_bucket_connector, self.trg_bucket_connector,
+                       self.meta_key, self.src_config, self.trg_config)
+
+    def test_from_config(self):
+        """
+        test the schema only types columns listed in src_columns
+        """
+        src_config = replace(self.src_config, src_columns=['ISIN', 'Date', 'TradedVolume'])
+        schema = SourceSchema.from_config(src_config)
+        self.assertEqual({'ISIN': 'category', 'TradedVolume': 'UInt32'}, schema.dtypes)
+        self.assertEqual({'Date': '%Y-%m-%d'}, schema.date_columns)
+        self.assertEqual([], schema.time_columns)
+
+    def test_float32_prices(self):
+        """
+        test prices are float32 only when src_float32_prices is set
+        """
+        self.assertEqual('float64', SourceSchema.from_config(
+            self.src_config).dtypes['StartPrice'])
+        src_config = replace(self.src_config, src_float32_prices=True)
+        self.assertEqual('float32', SourceSchema.from_config(
+            src_config).dtypes['StartPrice'])
+
+    def test_extract(self):
+        """
+        test extract parses source columns into compact types
+        """
+        df_result, _ = self.etl.extract()
+        self.assertEqual(len(self.df_src), len(df_result))
+        self.assertIsInstance(df_result['ISIN'].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(df_result['Mnemonic'].dtype, pd.CategoricalDtype)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df_result['Date']))
+        self.assertEqual('int16', df_result['Time'].dtype)
+        self.assertEqual([900, 780, 840], df_result['Time'].tolist())
+        self.assertEqual('UInt32', df_result['TradedVolume'].dtype)
+
+    def test_transform(self):
+        """
+        test the transformed dataframe is the same as with default types
+        """
+        df_extracted, _ = self.etl.extract()
+        df_result, _ = self.etl.transform(df_extracted)
+        pd.testing.assert_frame_equal(self.df_trg, df_result)
+
+    def test_missing_volume(self):
+        """
+        test a row without traded volume is parsed and dropped in transform
+        """
+        self.trg_bucket_connector.write_s3(pd.DataFrame([['AT0000A0E9W5', 'SANT', '2021-04-17', '16:00',
+                                                          30.00, 30.10, 29.90, 30.20, None]],
+                                                        columns=self.df_src.columns),
+                                           '2021-04-17/2021-04-17_BINS_XETR16.csv', 'csv')
+        df_extracted, _ = self.etl.extract()
+        self.assertEqual(1, df_extracted['TradedVolume'].isna().sum())
+        df_result, _ = self.etl.transform(df_extracted)
+        pd.testing.assert_frame_equal(self.df_trg, df_result)
+
+
+if __name__ == '__main__':
+    unittest.main()
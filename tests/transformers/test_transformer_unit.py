@@ -1,5 +1,13 @@
 from tests.transformers.test_base_tranformer import TestBaseETL
+from xetra_jobs.transformers.transformers import ETL
+from xetra_jobs.meta.meta_file import MetaFile
 import unittest
+import asyncio
+import os
+import tempfile
+import pandas as pd
+import pyarrow as pa
+from dataclasses import replace
 from unittest.mock import patch
 
 
@@ -12,7 +20,7 @@ class UnitTestETL(TestBaseETL):
         """
         test extract returns empty dataframe for non-existing date in source bucket
         """
-        with patch.object(self.src_bucket_connector, "list_keys_by_date_prefix", return_value=[]):
+        with patch.object(self.src_bucket_connector, "list_objects_by_date_prefix", return_value=[]):
             df, _ = self.etl.extract()
         self.assertTrue(df.empty)
 
@@ -24,6 +32,22 @@ class UnitTestETL(TestBaseETL):
         self.assertTrue(df_result.equals(self.df_src))
         self.assertFalse(transformed)
 
+    def test_extract_transform_previous_day_in_meta(self):
+        """
+        test only the input date is read from the source bucket when the previous workday
+        was loaded already, and the change in % uses its opening prices
+        """
+        df_prev = pd.DataFrame([['AT0000A0E9W5', '2021-04-16', 18.27, 18.27, 18.27, 21.34, 987, None]],
+                               columns=self.df_trg.columns)
+        self.etl.for_date('2021-04-16').load(df_prev)
+        df_src, transformed = self.etl.extract()
+        self.assertFalse(transformed)
+        self.assertEqual(['2021-04-17'], df_src['Date'].unique().tolist())
+        pd.testing.assert_frame_equal(
+            df_prev[['isin', 'opening_price']], self.etl.prev_day)
+        df_result, _ = self.etl.transform(df_src)
+        pd.testing.assert_frame_equal(self.df_trg, df_result)
+
     def test_transform_transformed_empty(self):
         """
         test transform is skipped when receiving transformed=True or an empty dataframe
@@ -44,6 +68,25 @@ class UnitTestETL(TestBaseETL):
             self.assertTrue(loaded)
             self.assertIn(log_expected_transformed, log.output[0])
 
+    def test_transform_multiple_isins(self):
+        """
+        test transform aggregates every ISIN of the day independently of the row order
+        """
+        df_src = pd.DataFrame([['B', 'SANT', '2021-04-17', '14:00', 11.0, 11.0, 10.5, 11.5, 5],
+                               ['A', 'SANT', '2021-04-17', '15:00', 3.0, 3.0, 2.0, 3.5, 2],
+                               ['B', 'SANT', '2021-04-16', '09:00', 10.0, 10.0, 9.5, 10.5, 1],
+                               ['A', 'SANT', '2021-04-17', '09:00', 2.0, 2.0, 1.5, 2.5, 3],
+                               ['B', 'SANT', '2021-04-17', '09:00', 12.0, 12.0, 11.0, 12.5, 4],
+                               ['A', 'SANT', '2021-04-17', '12:00', None, 2.5, 2.2, 2.7, 9],
+                               ], columns=self.df_src.columns)
+        df_expected = pd.DataFrame([['A', '2021-04-17', 2.0, 3.0, 1.5, 3.5, 5, None],
+                                    ['B', '2021-04-17', 12.0, 11.0, 10.5, 12.5, 9, 20.0],
+                                    ], columns=self.df_trg.columns)
+        df_expected['pct'] = df_expected['pct'].astype(float)
+        df_result, loaded = self.etl.transform(df_src)
+        self.assertFalse(loaded)
+        pd.testing.assert_frame_equal(df_expected, df_result)
+
     def test_load_loaded(self):
         """
         test load is skipped when receiving loaded=True
@@ -88,6 +131,145 @@ class UnitTestETL(TestBaseETL):
         meta_df = self.trg_bucket_connector.read_meta_file()
         self.assertIn(self.input_date, meta_df[self.meta_date_col].tolist())
 
+    def test_load_query_hive(self):
+        """
+        test load writes the hive layout and query reads it back filtered by date range and ISIN
+        """
+        etl = ETL(self.src_bucket_connector, self.trg_bucket_connector, self.meta_key,
+                  self.src_config, replace(self.trg_config, trg_layout='hive', trg_row_group_size=1))
+        dates = ['2021-04-16', '2021-04-19', '2021-05-03']
+        df_trg = pd.DataFrame([['B', 10.0], ['A', 20.0]], columns=['isin', 'opening_price'])
+        for date in dates:
+            df_date = df_trg.assign(date=date)
+            etl.for_date(date).load(df_date, update_meta=False)
+        keys = [obj.key for obj in self.bucket.objects.filter(Prefix='daily/')]
+        self.assertEqual(['daily/year=2021/month=04/20210416.parquet',
+                          'daily/year=2021/month=04/20210419.parquet',
+                          'daily/year=2021/month=05/20210503.parquet'], keys)
+        # files are sorted by ISIN
+        df_saved = self.trg_bucket_connector.read_object(keys[0], 'parquet')
+        self.assertEqual(['A', 'B'], df_saved['isin'].tolist())
+
+        df_result = etl.query('2021-04-17', '2021-05-03', isins=['B'],
+                              columns=['date', 'opening_price'])
+        df_expected = pd.DataFrame([['2021-04-19', 10.0], ['2021-05-03', 10.0]],
+                                   columns=['date', 'opening_price'])
+        pd.testing.assert_frame_equal(df_expected, df_result)
+        self.assertTrue(etl.query('2021-06-01', '2021-06-30').empty)
+
+    def test_query_flat(self):
+        """
+        test query is only supported for the hive layout
+        """
+        with self.assertRaises(ValueError):
+            self.etl.query('2021-04-16', '2021-04-19')
+
+    def test_arun(self):
+        """
+        test arun loads the same data as run, also when the previous workday
+        and then the input date are read from the target bucket
+        """
+        df_result = asyncio.run(self.etl.arun())
+        pd.testing.assert_frame_equal(self.df_trg, df_result)
+        self.assertEqual(3, self.etl.last_report.totals()['extract']['rows_out'])
+        self.assertIn(self.input_date, self.trg_bucket_connector.meta_dates())
+        # the input date is in the meta file now
+        df_result = asyncio.run(self.etl.arun())
+        pd.testing.assert_frame_equal(self.df_trg, df_result)
+        self.assertNotIn('write_s3', self.etl.last_report.totals())
+
+    def test_arun_previous_day_in_meta(self):
+        """
+        test arun reads only the input date from the source when the previous workday was loaded
+        """
+        df_prev = pd.DataFrame([['AT0000A0E9W5', '2021-04-16', 18.27, 18.27, 18.27, 21.34, 987, None]],
+                               columns=self.df_trg.columns)
+        self.etl.for_date('2021-04-16').load(df_prev)
+        for engine in ['pandas', 'arrow']:
+            etl = ETL(self.src_bucket_connector, self.trg_bucket_connector, self.meta_key,
+                      replace(self.src_config, src_engine=engine), self.trg_config)
+            self.trg_bucket_connector.delete_objects([self.trg_key])
+            with patch.object(MetaFile, 'date_in_meta_file',
+                              side_effect=lambda date, *args: date == '2021-04-16'), \
+                    patch.object(self.src_bucket_connector, 'list_data_keys',
+                                 wraps=self.src_bucket_connector.list_data_keys) as list_data_keys:
+                df_result = asyncio.run(etl.arun())
+            # the previous workday is not listed
+            self.assertEqual(['2021-04-17'], [call.args[0] for call in list_data_keys.call_args_list])
+            pd.testing.assert_frame_equal(self.df_trg, df_result, check_dtype=False)
+            self.assertEqual(2, etl.last_report.totals()['extract']['rows_out'])
+
+    def test_load_bars(self):
+        """
+        test transform computes the bars of the input date and load writes them next to the daily data
+        """
+        trg_config = replace(self.trg_config, trg_bar_intervals=(60,))
+        for engine in ['pandas', 'arrow']:
+            etl = ETL(self.src_bucket_connector, self.trg_bucket_connector, self.meta_key,
+                      replace(self.src_config, src_engine=engine), trg_config)
+            self.trg_bucket_connector.delete_objects([self.trg_key])
+            with patch.object(MetaFile, 'date_in_meta_file', return_value=False):
+                etl.run()
+            self.assertEqual({}, etl.bars)
+            df_bars = self.trg_bucket_connector.read_object('bars/60m/20210417.parquet', 'parquet')
+            df_expected = pd.DataFrame([['AT0000A0E9W5', '2021-04-17', '13:00', 20.21, 20.42, 18.21, 18.27, 633],
+                                        ['AT0000A0E9W5', '2021-04-17', '14:00', 18.27, 21.34, 18.27, 21.19, 455]],
+                                       columns=['isin', 'date', 'time', 'opening_price', 'max_price',
+                                                'min_price', 'closing_price', 'daily_traded_volume'])
+            pd.testing.assert_frame_equal(df_expected, df_bars)
+
+    def test_lookup(self):
+        """
+        test load indexes the ISINs of the daily data and lookup reads the rows of an ISIN
+        in a date range, for both engines
+        """
+        trg_config = replace(self.trg_config, trg_isin_index=True, trg_row_group_size=2)
+        dates = ['2021-04-15', '2021-04-16', '2021-05-03']
+        df_days = {date: pd.DataFrame([[isin, date, 1.0, 2.0, 0.5, 2.5, 10, None]
+                                       for isin in ['AT0000A0E9W5', 'DE000A0D6554', 'DE0005190003']],
+                                      columns=self.df_trg.columns) for date in dates}
+        for engine, date in zip(['pandas', 'arrow', 'pandas'], dates):
+            etl = ETL(self.src_bucket_connector, self.trg_bucket_connector, self.meta_key,
+                      replace(self.src_config, src_engine=engine, src_input_date=date), trg_config)
+            if engine == 'arrow':
+                etl.load_table(pa.Table.from_pandas(df_days[date]), update_meta=False)
+            else:
+                etl.load(df_days[date], update_meta=False)
+        self.assertEqual(['index/2021-04/20210415.parquet', 'index/2021-04/20210416.parquet',
+                          'index/2021-05/20210503.parquet'],
+                         [key for key, _ in self.trg_bucket_connector.list_objects('index/')])
+        etl.compact_index(dates)
+        self.assertEqual(['index/2021-04.parquet', 'index/2021-05.parquet'],
+                         [key for key, _ in self.trg_bucket_connector.list_objects('index/')])
+        df_result = etl.lookup('DE000A0D6554', '2021-04-16', '2021-05-31')
+        expected = pd.concat([df_days['2021-04-16'].iloc[1:2], df_days['2021-05-03'].iloc[1:2]],
+                             ignore_index=True)
+        pd.testing.assert_frame_equal(expected, df_result)
+        df_result = etl.lookup('DE000A0D6554', '2021-04-15', columns=['date', 'closing_price'])
+        self.assertEqual([['2021-04-15', 2.0]], df_result.values.tolist())
+        self.assertTrue(etl.lookup('DE000A0D6554', '2021-06-01').empty)
+        with self.assertRaises(ValueError):
+            self.etl.lookup('DE000A0D6554', '2021-04-15')
+
+    def test_run_report(self):
+        """
+        test run records the stages with rows and bytes and writes the json report
+        """
+        with tempfile.TemporaryDirectory() as report_dir:
+            self.etl.report_dir = report_dir
+            self.etl.run()
+            self.assertEqual(1, len(os.listdir(report_dir)))
+        totals = self.etl.last_report.totals()
+        self.assertEqual(['read_object', 'extract', 'transform', 'write_s3', 'load'], list(totals))
+        self.assertEqual(3, totals['extract']['rows_out'])
+        self.assertEqual(3, totals['transform']['rows_in'])
+        self.assertEqual(1, totals['transform']['rows_out'])
+        self.assertEqual(1, totals['load']['rows_in'])
+        self.assertGreater(totals['read_object']['bytes'], 0)
+        # the data and the meta file are written
+        self.assertEqual(2, totals['write_s3']['count'])
+        self.assertGreater(totals['write_s3']['bytes'], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
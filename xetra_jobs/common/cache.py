@@ -0,0 +1,264 @@
+"""
+size bounded LRU caches for serialized responses and parsed source objects
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import threading
+import pandas as pd
+import pyarrow.feather as feather
+
+
+class ResponseCache():
+    """
+    in-memory LRU cache of bytes values with an optional on-disk second tier
+
+    entries are evicted from memory when the total size exceeds max_bytes,
+    the disk tier evicts the least recently used files when it exceeds max_disk_bytes
+    """
+
+    MEMORY = 'memory'
+    DISK = 'disk'
+
+    def __init__(self, max_bytes: int, cache_dir: str = None, max_disk_bytes: int = None,
+                 namespace: str = ''):
+        """
+        Constructor for ResponseCache
+
+        :param max_bytes: maximum total size of the values kept in memory
+        :param cache_dir: directory of the on-disk tier, no disk tier if None
+        :param max_disk_bytes: maximum total size of the disk tier, unbounded if None
+        :param namespace: prefix of the keys in the disk tier, e.g. a hash of the configuration,
+            entries written under another namespace are never served and age out by LRU
+        """
+        self._logger = logging.getLogger(__name__)
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.namespace = namespace
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            if max_disk_bytes is not None:
+                self._disk = _DiskLRU(cache_dir, max_disk_bytes, self._logger)
+
+    def get(self, key: str):
+        """
+        look up a key, a disk hit is promoted to memory
+
+        returns:
+            a tuple of the value and the tier it was found in, (None, None) on a miss
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key], self.MEMORY
+        value = self._read_disk(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+        with self._lock:
+            self.hits += 1
+            self._put_memory(key, value)
+        return value, self.DISK
+
+    def put(self, key: str, value: bytes):
+        """
+        store a value in memory and, if configured, on disk
+        """
+        with self._lock:
+            self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    def clear(self):
+        """
+        drop all in-memory entries, the disk tier is kept
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _put_memory(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self.size -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(f'{self.namespace}/{key}'.encode()).hexdigest())
+
+    def _read_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            # the modification time orders files for eviction after a restart
+            os.utime(path)
+        except FileNotFoundError:
+            if self._disk is not None:
+                self._disk.discard(path)
+            return None
+        if self._disk is not None:
+            self._disk.touch(path)
+        return value
+
+    def _write_disk(self, key, value):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+        if self._disk is not None:
+            self._disk.add(path, len(value))
+
+
+class FrameCache():
+    """
+    on-disk LRU cache of dataframes stored as uncompressed feather files
+
+    hits are read with a memory map instead of being downloaded and parsed again,
+    the least recently used files are evicted when the total size exceeds max_bytes
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = None):
+        """
+        Constructor for FrameCache
+
+        :param cache_dir: directory of the feather files
+        :param max_bytes: maximum total size of the cache directory, unbounded if None
+        """
+        self._logger = logging.getLogger(__name__)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._disk = _DiskLRU(cache_dir, max_bytes, self._logger) if max_bytes is not None else None
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        content address of an entry, e.g. from bucket, key, ETag and parse options
+        """
+        return hashlib.sha1('/'.join(str(part) for part in parts).encode()).hexdigest()
+
+    def get(self, key: str):
+        """
+        look up a key
+
+        returns:
+            the cached dataframe, None on a miss
+        """
+        path = os.path.join(self.cache_dir, f'{key}.feather')
+        try:
+            table = feather.read_table(path, memory_map=True)
+            # the modification time orders files for eviction after a restart
+            os.utime(path)
+        except FileNotFoundError:
+            if self._disk is not None:
+                self._disk.discard(path)
+            with self._lock:
+                self.misses += 1
+            return None
+        if self._disk is not None:
+            self._disk.touch(path)
+        with self._lock:
+            self.hits += 1
+        return table.to_pandas()
+
+    def put(self, key: str, df: pd.DataFrame):
+        """
+        store a dataframe, its index is not kept
+        """
+        path = os.path.join(self.cache_dir, f'{key}.feather')
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        # uncompressed files can be memory-mapped without decoding
+        feather.write_feather(df.reset_index(drop=True), tmp_path,
+                              compression='uncompressed')
+        os.replace(tmp_path, path)
+        if self._disk is not None:
+            self._disk.add(path, os.path.getsize(path))
+
+
+class _DiskLRU():
+    """
+    sizes and recency of the files of a cache directory, kept in memory
+
+    the directory is listed once when the cache is created, ordered by modification time,
+    afterwards puts and hits update the order without touching the file system,
+    files written by other processes sharing the directory are only seen by the next startup scan
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, logger: logging.Logger):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._logger = logger
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        files = []
+        for name in os.listdir(cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            # removed by another process in the meantime
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        for _, size, path in sorted(files):
+            self._files[path] = size
+            self.size += size
+        self._evict()
+
+    def touch(self, path: str):
+        """
+        mark a file as most recently used
+        """
+        with self._lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+
+    def discard(self, path: str):
+        """
+        forget a file removed outside of this cache
+        """
+        with self._lock:
+            self.size -= self._files.pop(path, 0)
+
+    def add(self, path: str, size: int):
+        """
+        record a written file and remove the least recently used files over max_bytes
+        """
+        with self._lock:
+            self.size += size - self._files.pop(path, 0)
+            self._files[path] = size
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._files:
+            path, size = self._files.popitem(last=False)
+            self.size -= size
+            self._logger.info(f'evicting {path} from the cache')
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
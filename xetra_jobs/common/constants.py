@@ -9,6 +9,19 @@ class S3SourceConfig(Enum):
     configuration for source bucket
     """
     INPUT_DATE_FORMAT = "%Y-%m-%d"
+    CSV_CHUNKSIZE = 100000
+    # bytes of the first ranged GET of a csv header, longer headers are read in doubling ranges
+    HEADER_READ_BYTES = 4096
+    # dates whose csv header is kept in memory
+    HEADER_CACHE_DATES = 64
+
+
+class S3TargetConfig(Enum):
+    """
+    configuration for writing to the target bucket
+    """
+    MULTIPART_PART_SIZE = 8 * 1024 * 1024
+    MULTIPART_UPLOAD_WORKERS = 4
 
 
 class S3FileFormats(Enum):
@@ -29,3 +42,51 @@ class MetaFileConfig(Enum):
     META_TIMESTAMP_COL = 'processing_time'
     META_FILE_FORMAT = 'csv'
     META_KEY = "meta.csv"
+    META_MARKER_PREFIX = "meta/dates/"
+    META_SNAPSHOT_KEY = "meta/snapshot.parquet"
+
+
+class MetaFileLayout(Enum):
+    """
+    storage layouts of the meta file
+    csv: a single meta.csv rewritten on every update
+    markers: one marker object per processed date, compacted into a parquet snapshot
+    """
+    CSV = 'csv'
+    MARKERS = 'markers'
+
+
+class TargetLayout(Enum):
+    """
+    key layouts of the transformed data in the target bucket
+    flat: one <prefix><date>.<format> object per day
+    hive: <prefix>year=YYYY/month=MM/<date>.<format>, rows sorted by ISIN
+    """
+    FLAT = 'flat'
+    HIVE = 'hive'
+
+
+class PipelineEngine(Enum):
+    """
+    libraries the ETL job runs on
+    pandas: csv parsed into dataframes, aggregated and written with pandas
+    arrow: csv parsed, aggregated and written as pyarrow tables
+    """
+    PANDAS = 'pandas'
+    ARROW = 'arrow'
+
+
+class ResponseFormat(Enum):
+    """
+    response formats of the /daily endpoint
+    records: json list of row objects
+    split: columnar json of pandas orient=split, column names are sent once
+    arrow: arrow IPC stream
+    parquet: parquet file
+    ndjson: json object per line, streamed in chunks of rows
+    """
+    RECORDS = 'records'
+    SPLIT = 'split'
+    ARROW = 'arrow'
+    PARQUET = 'parquet'
+    NDJSON = 'ndjson'
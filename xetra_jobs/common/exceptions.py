@@ -37,3 +37,29 @@ class WrongMetaFileException(BaseXetraException):
     exception that can be raised when the meta file
     format is not correct.
     """
+
+
+class ObjectNotFoundException(BaseXetraException):
+    """
+    exception that can be raised when an object does not exist in a storage backend
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def __repr__(self):
+        return f"object {self.key} not found"
+
+
+class WrongSourceSchemaException(BaseXetraException):
+    """
+    exception that can be raised when the header of the source objects
+    of a day misses requested columns
+    """
+
+    def __init__(self, date, columns):
+        self.date = date
+        self.columns = columns
+
+    def __repr__(self):
+        return f"source objects of {self.date} have no columns {self.columns}"
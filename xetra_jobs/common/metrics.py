@@ -0,0 +1,302 @@
+"""
+stage-level timing, transfer and memory instrumentation of ETL runs
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+import time
+import psutil
+
+_current_report = ContextVar('xetra_run_report', default=None)
+_prometheus = None
+# seconds between two RSS samples while a stage is running
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+class Stage():
+    """
+    measurements of one stage, bytes and rows are filled in by the instrumented code
+    """
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.bytes = 0
+        self.rows_in = None
+        self.rows_out = None
+        self.wall_seconds = None
+        self.rss_bytes = None
+        self.peak_rss_bytes = None
+
+    def to_dict(self):
+        return {'stage': self.name, **self.labels, 'wall_seconds': self.wall_seconds,
+                'bytes': self.bytes, 'rows_in': self.rows_in, 'rows_out': self.rows_out,
+                'rss_bytes': self.rss_bytes, 'peak_rss_bytes': self.peak_rss_bytes}
+
+
+class RunReport():
+    """
+    stages recorded during one ETL run, can be written as a json report
+    """
+
+    def __init__(self, **labels):
+        """
+        Constructor for RunReport
+
+        :param labels: attributes of the run, e.g. input_date and engine
+        """
+        self.labels = labels
+        self.started_at = datetime.now()
+        self.wall_seconds = None
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: Stage):
+        with self._lock:
+            self.stages.append(stage)
+
+    def totals(self):
+        """
+        stages of the same name summed up, e.g. all read_object calls
+
+        returns:
+            a dict of stage name -> count, wall_seconds, bytes, rows_in, rows_out
+        """
+        totals = {}
+        for stage in self.stages:
+            total = totals.setdefault(stage.name, {
+                'count': 0, 'wall_seconds': 0.0, 'bytes': 0, 'rows_in': 0, 'rows_out': 0})
+            total['count'] += 1
+            total['wall_seconds'] += stage.wall_seconds
+            total['bytes'] += stage.bytes
+            total['rows_in'] += stage.rows_in or 0
+            total['rows_out'] += stage.rows_out or 0
+        return totals
+
+    def to_dict(self):
+        return {**self.labels,
+                'started_at': self.started_at.isoformat(),
+                'wall_seconds': self.wall_seconds,
+                'peak_rss_bytes': max((stage.peak_rss_bytes for stage in self.stages), default=None),
+                'totals': self.totals(),
+                'stages': [stage.to_dict() for stage in self.stages]}
+
+    def write(self, report_dir: str):
+        """
+        write the report as json to report_dir
+
+        returns:
+            the path of the report
+        """
+        os.makedirs(report_dir, exist_ok=True)
+        name = '_'.join(str(value) for value in self.labels.values())
+        path = os.path.join(report_dir, f'run_{name}_{self.started_at:%Y%m%d%H%M%S%f}.json')
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        return path
+
+
+@contextmanager
+def run_report(**labels):
+    """
+    collect the stages of the code in the with block, including worker threads started with bind_report
+
+    yields:
+        a RunReport
+    """
+    report = RunReport(**labels)
+    token = _current_report.set(report)
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        report.wall_seconds = time.perf_counter() - start
+        _current_report.reset(token)
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """
+    measure a stage and add it to the current run report and the prometheus metrics,
+    without a report or prometheus only the Stage object is returned
+
+    :param name: stage name, e.g. extract or read_object
+    :param labels: further attributes of the stage, e.g. the object key
+
+    yields:
+        a Stage, set its bytes and rows in the with block
+    """
+    report = _current_report.get()
+    current = Stage(name, labels)
+    if report is None and _prometheus is None:
+        yield current
+        return
+    _sampler.start(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.wall_seconds = time.perf_counter() - start
+        _sampler.stop(current)
+        if report is not None:
+            report.add(current)
+        if _prometheus is not None:
+            _prometheus.observe(current)
+
+
+def bind_report(function):
+    """
+    wrap a function so it records into the current run report when called from another thread
+    """
+    report = _current_report.get()
+
+    def run(*args, **kwargs):
+        token = _current_report.set(report)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_report.reset(token)
+    return run
+
+
+class _RssSampler():
+    """
+    samples the process RSS in a daemon thread while stages are running
+
+    every running stage keeps the largest sample taken between its start and end,
+    so nested and concurrent stages each get their own peak, memory allocated and freed
+    within less than the sampling interval may be missed
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._reset()
+
+    def _reset(self):
+        self._process = psutil.Process()
+        self._stages = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self, current: Stage):
+        current.peak_rss_bytes = self._process.memory_info().rss
+        with self._condition:
+            self._stages.add(current)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='xetra-rss-sampler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def stop(self, current: Stage):
+        rss = self._process.memory_info().rss
+        with self._condition:
+            self._stages.discard(current)
+            current.rss_bytes = rss
+            current.peak_rss_bytes = max(current.peak_rss_bytes, rss)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stages:
+                    self._condition.wait()
+            rss = self._process.memory_info().rss
+            with self._condition:
+                for current in self._stages:
+                    current.peak_rss_bytes = max(current.peak_rss_bytes, rss)
+            time.sleep(self.interval)
+
+
+_sampler = _RssSampler(RSS_SAMPLE_INTERVAL)
+# the sampler thread does not survive a fork, e.g. into backfill worker processes
+os.register_at_fork(after_in_child=_sampler._reset)
+
+
+class PrometheusMetrics():
+    """
+    prometheus metrics of the stages
+    """
+
+    def __init__(self, registry=None):
+        """
+        Constructor for PrometheusMetrics
+
+        :param registry: prometheus registry, the default registry if None
+        """
+        from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+        registry = registry if registry is not None else REGISTRY
+        self.registry = registry
+        self.seconds = Histogram('xetra_stage_seconds', 'wall time of ETL stages',
+                                 ['stage'], registry=registry)
+        self.bytes = Counter('xetra_stage_bytes', 'bytes read or written by ETL stages',
+                             ['stage'], registry=registry)
+        self.rows = Counter('xetra_stage_rows', 'rows going into and out of ETL stages',
+                            ['stage', 'direction'], registry=registry)
+        self.peak_rss = Gauge('xetra_peak_rss_bytes', 'peak RSS of the process during the last stage',
+                              registry=registry)
+
+    def observe(self, current: Stage):
+        self.seconds.labels(current.name).observe(current.wall_seconds)
+        self.bytes.labels(current.name).inc(current.bytes)
+        if current.rows_in is not None:
+            self.rows.labels(current.name, 'in').inc(current.rows_in)
+        if current.rows_out is not None:
+            self.rows.labels(current.name, 'out').inc(current.rows_out)
+        self.peak_rss.set(current.peak_rss_bytes)
+
+
+def enable_prometheus(port: int = None, registry=None):
+    """
+    export stage metrics to prometheus, only the first call creates the metrics
+
+    :param port: port of the prometheus http endpoint, no endpoint is started if None
+    :param registry: prometheus registry, the default registry if None
+
+    returns:
+        the PrometheusMetrics
+    """
+    global _prometheus
+    if _prometheus is None:
+        _prometheus = PrometheusMetrics(registry)
+        if port is not None:
+            from prometheus_client import start_http_server
+            start_http_server(port, registry=_prometheus.registry)
+            logging.getLogger(__name__).info(
+                f'serving prometheus metrics on port {port}')
+    return _prometheus
+
+
+def prometheus_metrics():
+    """
+    the PrometheusMetrics, None if prometheus is not enabled
+    """
+    return _prometheus
+
+
+def disable_prometheus():
+    """
+    stop recording prometheus metrics
+    """
+    global _prometheus
+    _prometheus = None
+
+
+class CountingReader():
+    """
+    file-like wrapper counting the bytes read from a stream
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes += len(data)
+        return data
+
+    def close(self):
+        self.raw.close()
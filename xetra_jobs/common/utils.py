@@ -1,4 +1,6 @@
 from datetime import datetime, timedelta
+from pandas.api.types import union_categoricals
+import pandas as pd
 
 
 def is_weekday(date, date_format):
@@ -16,12 +18,13 @@ def dates_to_strs(dates, date_format):
     return list(map(lambda d: d.strftime(date_format), dates))
 
 
-def list_dates(input_date, date_format, single_day=True):
+def list_dates(input_date, date_format, single_day=True, end_date=None):
     """list a series of workdays after an input date
 
     :param input_date: target date
     :param date_format: date format codes
     :param: if true, only return the previous workday and the start date
+    :param end_date: last date to list when single_day is false, default to today
 
     returns:
         a list of all workdays after the start date, the day prior to start date will also be included to calculate growth
@@ -40,7 +43,30 @@ def list_dates(input_date, date_format, single_day=True):
     if single_day:
         return dates_to_strs([prev_input_date, input_date], date_format)
     else:
-        today = datetime.today()
-        dates = [(prev_input_date + timedelta(days=x)) for x in range(0, (today -
-                                                                          prev_input_date).days + 1) if is_weekday((prev_input_date + timedelta(days=x)))]
+        last_date = datetime.today() if end_date is None else str_to_date(end_date, date_format)
+        dates = [(prev_input_date + timedelta(days=x)) for x in range(0, (last_date -
+                                                                          prev_input_date).days + 1) if is_weekday((prev_input_date + timedelta(days=x)), date_format)]
         return dates_to_strs(dates, date_format)
+
+
+def concat_frames(frames: list):
+    """
+    concat dataframes like pd.concat(ignore_index=True), but keep categorical
+    columns categorical when the frames have different categories
+
+    :param frames: dataframes with the same columns
+    """
+    # frames without columns come from days without source objects
+    frames = [frame for frame in frames if frame is not None and len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    categorical = [col for col in frames[0].columns
+                   if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames)]
+    if categorical:
+        frames = [frame.copy(deep=False) for frame in frames]
+        for col in categorical:
+            categories = union_categoricals(
+                [frame[col] for frame in frames]).categories
+            for frame in frames:
+                frame[col] = frame[col].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
@@ -6,8 +6,8 @@ from datetime import datetime
 from io import StringIO
 import pandas as pd
 from xetra_jobs.s3.target_bucket import TargetBucketConnector
-from xetra_jobs.common.constants import MetaFileConfig
-from xetra_jobs.common.exceptions import WrongMetaFileException
+from xetra_jobs.common.constants import MetaFileConfig, MetaFileLayout, S3FileFormats
+from xetra_jobs.common.exceptions import WrongMetaFileException, ObjectNotFoundException
 
 
 class MetaFile():
@@ -15,6 +15,10 @@ class MetaFile():
     class for working with the meta file
     """
     meta_key = MetaFileConfig.META_KEY.value
+    marker_prefix = MetaFileConfig.META_MARKER_PREFIX.value
+    snapshot_key = MetaFileConfig.META_SNAPSHOT_KEY.value
+    csv_layout = MetaFileLayout.CSV.value
+    markers_layout = MetaFileLayout.MARKERS.value
 
     @staticmethod
     def create_meta_file(bucket_connector: TargetBucketConnector):
@@ -33,32 +37,37 @@ class MetaFile():
         df[MetaFileConfig.META_DATE_COL.value] = existing_dates
         df[MetaFileConfig.META_TIMESTAMP_COL.value] = \
             datetime.today().strftime(MetaFileConfig.META_TIMESTAMP_FORMAT.value)
-        out_buffer = StringIO()
-        df.to_csv(out_buffer, index=False)
-        bucket_connector._put_object(out_buffer, key=MetaFile.meta_key)
+        bucket_connector.write_s3(
+            df, key=MetaFile.meta_key, file_format=MetaFileConfig.META_FILE_FORMAT.value)
         return True
 
     @staticmethod
-    def update_meta_file(input_date: str,  bucket_connector: TargetBucketConnector):
+    def update_meta_file(input_date: str,  bucket_connector: TargetBucketConnector, layout=csv_layout):
         """
         update the meta file with the processed date and datetime.now() as processing time
 
-        :param input_date: the processed date
+        :param input_date: the processed date, or a list of processed dates committed in one write
         :param bucket_connector: a TargetBucketConnector instance in which the meta file will be updated
+        :param layout: meta file layout, see MetaFileLayout
         """
+        dates = [input_date] if isinstance(input_date, str) else list(input_date)
+        if layout == MetaFile.markers_layout:
+            for date in dates:
+                MetaFile.mark_date(date, bucket_connector)
+            return True
         # Creating an empty DataFrame using the meta file column names
         df_new = pd.DataFrame(columns=[
                               MetaFileConfig.META_DATE_COL.value, MetaFileConfig.META_TIMESTAMP_COL.value])
-        df_new[MetaFileConfig.META_DATE_COL.value] = [input_date]
-        df_new[MetaFileConfig.META_TIMESTAMP_COL.value] = [
-            datetime.today().strftime(MetaFileConfig.META_TIMESTAMP_FORMAT.value)]
+        df_new[MetaFileConfig.META_DATE_COL.value] = dates
+        df_new[MetaFileConfig.META_TIMESTAMP_COL.value] = \
+            datetime.today().strftime(MetaFileConfig.META_TIMESTAMP_FORMAT.value)
         try:
             # If meta file exists -> union DataFrame of old and new meta data is created
             df_old = bucket_connector.read_meta_file()
             if collections.Counter(df_old.columns) != collections.Counter(df_new.columns):
                 raise WrongMetaFileException
             df_all = pd.concat([df_old, df_new])
-        except bucket_connector.session.client('s3').exceptions.NoSuchKey:
+        except ObjectNotFoundException:
             # No meta file exists -> only the new data is used
             df_all = df_new
         # Writing to S3
@@ -67,11 +76,91 @@ class MetaFile():
         return True
 
     @staticmethod
-    def date_in_meta_file(date: str, bucket_connector: TargetBucketConnector):
+    def date_in_meta_file(date: str, bucket_connector: TargetBucketConnector, layout=csv_layout):
         """
         if a date has been stored in the metafile
+        with the markers layout this is a HEAD request, the snapshot is only checked if there is no marker
+        and is downloaded again only when its ETag changed
+        """
+        if layout == MetaFile.markers_layout:
+            if bucket_connector.object_exists(MetaFile.marker_prefix + date):
+                return True
+            return date in bucket_connector.snapshot_dates()
+        return date in bucket_connector.meta_dates()
+
+    @staticmethod
+    def meta_dates(bucket_connector: TargetBucketConnector, layout=csv_layout):
+        """
+        all dates stored in the meta file
+
+        :param bucket_connector: a TargetBucketConnector instance
+        :param layout: meta file layout, see MetaFileLayout
+
+        returns:
+            a set of dates
+        """
+        if layout == MetaFile.markers_layout:
+            return set(MetaFile.read_markers(bucket_connector)[MetaFileConfig.META_DATE_COL.value]) | \
+                bucket_connector.snapshot_dates()
+        return bucket_connector.meta_dates()
+
+    @staticmethod
+    def mark_date(input_date: str, bucket_connector: TargetBucketConnector):
+        """
+        record a processed date with its own marker object
+        a single put without reading anything, so concurrent workers can not overwrite each other
+
+        :param input_date: the processed date
+        :param bucket_connector: a TargetBucketConnector instance
+        """
+        out_buffer = StringIO(datetime.today().strftime(
+            MetaFileConfig.META_TIMESTAMP_FORMAT.value))
+        return bucket_connector._put_object(out_buffer, key=MetaFile.marker_prefix + input_date)
+
+    @staticmethod
+    def read_markers(bucket_connector: TargetBucketConnector):
+        """
+        list marker objects, their modification time is used as processing time
+
+        returns:
+            a dataframe with the meta file columns
+        """
+        markers = bucket_connector.list_objects(MetaFile.marker_prefix)
+        return pd.DataFrame({
+            MetaFileConfig.META_DATE_COL.value: [key[len(MetaFile.marker_prefix):] for key, _ in markers],
+            MetaFileConfig.META_TIMESTAMP_COL.value: [
+                modified.strftime(MetaFileConfig.META_TIMESTAMP_FORMAT.value) for _, modified in markers]
+        }, columns=[MetaFileConfig.META_DATE_COL.value, MetaFileConfig.META_TIMESTAMP_COL.value])
+
+    @staticmethod
+    def read_snapshot(bucket_connector: TargetBucketConnector):
+        """
+        read the compacted parquet snapshot of marker objects
+
+        returns:
+            a dataframe with the meta file columns, empty if there is no snapshot yet
+        """
+        return bucket_connector.read_meta_snapshot()
+
+    @staticmethod
+    def compact_meta_file(bucket_connector: TargetBucketConnector, min_markers: int = 1):
         """
-        meta_df = bucket_connector.read_meta_file()
-        existing_dates = (
-            meta_df[MetaFileConfig.META_DATE_COL.value]).tolist()
-        return date in existing_dates
+        merge marker objects into the parquet snapshot and delete them
+        only markers listed before writing the snapshot are deleted, so dates marked
+        in the meantime are kept, but compaction itself must run from a single process
+
+        :param bucket_connector: a TargetBucketConnector instance
+        :param min_markers: nothing is compacted while there are fewer markers
+        """
+        df_markers = MetaFile.read_markers(bucket_connector)
+        if df_markers.empty or len(df_markers) < min_markers:
+            return False
+        df_all = pd.concat([MetaFile.read_snapshot(bucket_connector), df_markers])\
+            .drop_duplicates(subset=[MetaFileConfig.META_DATE_COL.value], keep='last')\
+            .sort_values(by=[MetaFileConfig.META_DATE_COL.value])\
+            .reset_index(drop=True)
+        bucket_connector.write_s3(
+            df_all, key=MetaFile.snapshot_key, file_format=S3FileFormats.PARQUET.value)
+        bucket_connector.delete_objects(
+            [MetaFile.marker_prefix + date for date in df_markers[MetaFileConfig.META_DATE_COL.value]])
+        return True
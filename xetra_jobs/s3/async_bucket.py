@@ -0,0 +1,52 @@
+"""
+asyncio interface to the bucket connectors
+"""
+from xetra_jobs.s3.base_bucket import BaseBucketConnector
+from contextvars import copy_context
+from functools import partial
+import asyncio
+
+
+class AsyncBucket():
+    """
+    runs the blocking calls of a bucket connector on the event loop's thread pool,
+    so they can overlap with each other and with the rest of the event loop
+
+    the connectors share one pooled boto3 client, which is thread safe, concurrency is
+    bounded to the size of the connection pool. create one AsyncBucket per event loop
+    """
+
+    def __init__(self, connector: BaseBucketConnector, max_concurrency: int = 10):
+        """
+        Constructor for AsyncBucket
+
+        :param connector: source or target bucket connector
+        :param max_concurrency: number of calls running at the same time
+        """
+        self.connector = connector
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, function, *args, **kwargs):
+        """
+        await a blocking call, run with the context of the caller so metrics stages are recorded
+
+        :param function: a method of the connector or any blocking function
+        """
+        call = partial(copy_context().run, function, *args, **kwargs)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    async def map(self, function, keys: list, *args, **kwargs):
+        """
+        call function(key, *args, **kwargs) for every key concurrently
+
+        returns:
+            the results in the order of keys
+        """
+        return await asyncio.gather(*(self.run(function, key, *args, **kwargs) for key in keys))
+
+    async def list_data_keys(self, date_prefix: str, columns="all"):
+        return await self.run(self.connector.list_data_keys, date_prefix, columns)
+
+    async def read_object(self, key: str, *args, **kwargs):
+        return await self.run(self.connector.read_object, key, *args, **kwargs)
@@ -1,15 +1,18 @@
+"""interface to s3 buckets"""
 import logging
 import boto3
 import os
-import unittest
+from xetra_jobs.s3.storage import BaseStorage, S3Storage
 
 
-class BaseBucketConnector(unittest.TestCase):
+class BaseBucketConnector():
     """
     base class for source and target bucket
     """
 
-    def __init__(self, access_key_name: str, secret_access_key_name: str, endpoint_url: str, bucket_name: str):
+    def __init__(self, access_key_name: str, secret_access_key_name: str, endpoint_url: str, bucket_name: str,
+                 session: boto3.Session = None, max_pool_connections: int = 10, storage: BaseStorage = None,
+                 **s3_options):
         """
         Constructor for S3BucketConnector
 
@@ -17,12 +20,30 @@ class BaseBucketConnector(unittest.TestCase):
         :param secret_key: secret key for accessing S3
         :param endpoint_url: s3 endpoint url
         :param bucket: s3 bucket name
+        :param session: a boto3 session shared with other connectors, created from the access keys if not given
+        :param max_pool_connections: size of the http connection pool of the s3 client
+        :param storage: storage backend, e.g. a LocalStorage mirror of the bucket, s3 if not given
+        :param s3_options: further arguments of S3Storage, e.g. part_size
         """
         self._logger = logging.getLogger(__name__)
         self.endpoint_url = endpoint_url
-        self.session = boto3.Session(aws_access_key_id=os.environ[access_key_name],
-                                     aws_secret_access_key=os.environ[secret_access_key_name])
+        self.bucket_name = bucket_name
+        if storage is None:
+            self.session = session if session is not None else \
+                self.create_session(access_key_name, secret_access_key_name)
+            storage = S3Storage(self.session, endpoint_url, bucket_name,
+                                max_pool_connections=max_pool_connections, **s3_options)
+        else:
+            self.session = session
+        self.storage = storage
 
-        self._s3_client = self.session.resource(
-            service_name='s3', endpoint_url=endpoint_url)
-        self._bucket = self._s3_client.Bucket(bucket_name)
+    @staticmethod
+    def create_session(access_key_name: str, secret_access_key_name: str):
+        """
+        create a boto3 session from access keys stored in environment variables
+
+        :param access_key_name: name of the environment variable of the access key
+        :param secret_access_key_name: name of the environment variable of the secret access key
+        """
+        return boto3.Session(aws_access_key_id=os.environ[access_key_name],
+                             aws_secret_access_key=os.environ[secret_access_key_name])
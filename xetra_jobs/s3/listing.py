@@ -0,0 +1,108 @@
+"""
+cache of object listings, published days are kept in a persisted index
+"""
+from collections import namedtuple
+import json
+import logging
+import os
+import threading
+import time
+
+ObjectInfo = namedtuple('ObjectInfo', ['key', 'etag', 'size'])
+
+
+class ListingCache():
+    """
+    listings of date prefixes, e.g. '2021-09-17'
+
+    listings of days that are published for good are kept in a sorted index of dates
+    that never expires and can be saved to disk, all other listings expire after ttl seconds
+    """
+
+    def __init__(self, ttl: float = 300, index_path: str = None):
+        """
+        Constructor for ListingCache
+
+        :param ttl: seconds a listing of a day that can still change is reused
+        :param index_path: json file of the index of published days, not persisted if None
+        """
+        self._logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self.index_path = index_path
+        self.hits = 0
+        self.misses = 0
+        # date prefix -> list of ObjectInfo, only for published days
+        self.index = {}
+        # date prefix -> (expiry time, list of ObjectInfo)
+        self._entries = {}
+        self._lock = threading.Lock()
+        if index_path is not None and os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = {date: [ObjectInfo(*obj) for obj in objects]
+                              for date, objects in json.load(f).items()}
+
+    def get(self, prefix: str):
+        """
+        look up the listing of a prefix
+
+        returns:
+            a list of ObjectInfo, None if the prefix is not cached or expired
+        """
+        with self._lock:
+            if prefix in self.index:
+                self.hits += 1
+                return self.index[prefix]
+            entry = self._entries.get(prefix)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, prefix: str, objects: list, published=False):
+        """
+        store the listing of a prefix
+
+        :param prefix: date prefix
+        :param objects: list of ObjectInfo
+        :param published: if the listing can not change anymore, it is added to the index
+        """
+        with self._lock:
+            if published:
+                self.index[prefix] = objects
+                self._entries.pop(prefix, None)
+            else:
+                self._entries[prefix] = (time.monotonic() + self.ttl, objects)
+
+    def dates(self):
+        """
+        sorted dates of the index
+        """
+        with self._lock:
+            return sorted(self.index)
+
+    def size(self, prefix: str):
+        """
+        total size in bytes of the indexed objects of a date, None if not indexed
+        """
+        with self._lock:
+            if prefix not in self.index:
+                return None
+            return sum(obj.size for obj in self.index[prefix])
+
+    def save(self):
+        """
+        write the index sorted by date to index_path
+        """
+        if self.index_path is None:
+            return False
+        with self._lock:
+            index = {date: [list(obj) for obj in self.index[date]]
+                     for date in sorted(self.index)}
+        tmp_path = f'{self.index_path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        self._logger.info(
+            f'saved listing index of {len(index)} dates to {self.index_path}')
+        return True
@@ -1,8 +1,24 @@
 from xetra_jobs.common.constants import S3SourceConfig
 from xetra_jobs.s3.base_bucket import BaseBucketConnector
-from xetra_jobs.common.utils import list_dates
+from xetra_jobs.common.utils import list_dates, concat_frames
+from xetra_jobs.common.cache import FrameCache
+from xetra_jobs.s3.listing import ListingCache, ObjectInfo
+from xetra_jobs.s3.storage import BaseStorage
+from xetra_jobs.common.exceptions import ObjectNotFoundException, WrongSourceSchemaException
+from xetra_jobs.common import metrics
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from io import BytesIO
+import csv
+import multiprocessing
+import queue
+import threading
+from pandas.errors import EmptyDataError
+from pandas._libs.parsers import STR_NA_VALUES
 import pandas as pd
-from io import StringIO
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 
 
 class SourceBucketConnector(BaseBucketConnector):
@@ -11,9 +27,44 @@ class SourceBucketConnector(BaseBucketConnector):
     """
 
     date_format = S3SourceConfig.INPUT_DATE_FORMAT.value
+    header_read_bytes = S3SourceConfig.HEADER_READ_BYTES.value
+    header_cache_dates = S3SourceConfig.HEADER_CACHE_DATES.value
 
-    def __init__(self, access_key_name, secret_access_key_name, endpoint_url, bucket_name):
-        super().__init__(access_key_name, secret_access_key_name, endpoint_url, bucket_name)
+    def __init__(self, access_key_name, secret_access_key_name, endpoint_url, bucket_name,
+                 max_workers=1, chunksize=S3SourceConfig.CSV_CHUNKSIZE.value, session=None,
+                 cache: FrameCache = None, listing: ListingCache = None, storage: BaseStorage = None,
+                 parse_workers=0, queue_size=None):
+        """
+        Constructor for SourceBucketConnector
+
+        :param max_workers: number of objects fetched in parallel by read_objects, 1 reads them one by one
+        :param chunksize: number of csv rows parsed at a time from an object stream
+        :param session: a boto3 session shared with other connectors
+        :param cache: local cache of parsed objects, published source objects never change
+        :param listing: cache of date prefix listings, every listing is sent to s3 if None
+        :param storage: storage backend, e.g. a LocalStorage mirror of the bucket, s3 if not given
+        :param parse_workers: number of processes parsing the objects downloaded by max_workers threads,
+            0 parses every object in the thread that downloads it
+        :param queue_size: downloaded objects waiting for a parser, downloads pause when the queue is full,
+            defaults to twice the number of parse workers
+        """
+        # every worker thread needs its own connection
+        super().__init__(access_key_name, secret_access_key_name, endpoint_url, bucket_name,
+                         session=session, max_pool_connections=max(10, max_workers), storage=storage)
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+        self.cache = cache
+        self.listing = listing
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size or 2 * parse_workers
+        # ETags seen while listing, they address the cached objects without a HEAD request
+        self._etags = {}
+        # started by the first pipelined read, see close()
+        self._parse_pool = None
+        # date prefix -> (header columns, header size in bytes) of the last header_cache_dates dates,
+        # all objects of a day share the header
+        self._headers = OrderedDict()
+        self._headers_lock = threading.Lock()
 
     def list_keys_by_date_prefix(self, date_prefix):
         """
@@ -24,49 +75,240 @@ class SourceBucketConnector(BaseBucketConnector):
         returns:
             a list of object keys that match the date prefix
         """
-        keys = [obj.key for obj in self._bucket.objects.filter(
-            Prefix=date_prefix)]
-        return keys
+        return [obj.key for obj in self.list_objects_by_date_prefix(date_prefix)]
 
-    def read_object(self, key, columns, decoding="utf-8"):
+    def list_objects_by_date_prefix(self, date_prefix):
         """
-        read in an s3 object csv file as dataframe
+        list objects under a prefix, served from the listing cache if possible
+
+        :param date_prefix: prefix to filter with, e.g. '2021-09-17'
+
+        returns:
+            a list of ObjectInfo(key, etag, size)
+        """
+        objects = self.listing.get(date_prefix) if self.listing is not None else None
+        if objects is None:
+            objects = [ObjectInfo(obj.key, obj.etag, obj.size)
+                       for obj in self.storage.list(date_prefix)]
+            if self.listing is not None:
+                self.listing.put(date_prefix, objects, self._is_published(date_prefix, objects))
+        for obj in objects:
+            self._etags[obj.key] = obj.etag
+        return objects
+
+    def list_data_keys(self, date_prefix, columns="all"):
+        """
+        list the objects of a date that hold rows, the header-only objects of non-trading hours
+        are skipped by their listed size, without a GET request
+
+        the header is read once per date from its smallest object and validated against columns
+
+        :param date_prefix: prefix to filter with, e.g. '2021-09-17'
+        :param columns: columns the objects must have, "all" for no check
+
+        returns:
+            a list of object keys
+        """
+        objects = [obj for obj in self.list_objects_by_date_prefix(date_prefix) if obj.size > 0]
+        if not objects:
+            return []
+        header, header_size = self._read_header(date_prefix, objects)
+        if columns != "all":
+            missing = [col for col in columns if col not in header]
+            if missing:
+                raise WrongSourceSchemaException(date_prefix, missing)
+        return [obj.key for obj in objects if obj.size > header_size]
+
+    def _read_header(self, date_prefix, objects):
+        """
+        header columns and size of the objects of a date, read from the smallest object,
+        which is a header-only object on trading days
+
+        :param date_prefix: date of the objects
+        :param objects: non-empty ObjectInfo of the date
+        """
+        with self._headers_lock:
+            if date_prefix in self._headers:
+                self._headers.move_to_end(date_prefix)
+                return self._headers[date_prefix]
+        smallest = min(objects, key=lambda obj: obj.size)
+        self._logger.info(
+            f'reading header of {self.endpoint_url}/{self.bucket_name}/{smallest.key}')
+        with metrics.stage('read_object', bucket=self.bucket_name, key=smallest.key) as current:
+            end = min(smallest.size, self.header_read_bytes)
+            data = bytes(self.storage.get_range(smallest.key, 0, end))
+            while b'\n' not in data and end < smallest.size:
+                end = min(smallest.size, 2 * end)
+                data = bytes(self.storage.get_range(smallest.key, 0, end))
+            current.bytes = len(data)
+        line = data.split(b'\n', 1)[0]
+        # the header ends with a newline unless the object holds nothing else
+        header_size = len(line) + 1 if len(line) < len(data) else len(line)
+        header = next(csv.reader([line.decode('utf-8').rstrip('\r')]))
+        with self._headers_lock:
+            self._headers[date_prefix] = (header, header_size)
+            while len(self._headers) > self.header_cache_dates:
+                self._headers.popitem(last=False)
+        return header, header_size
+
+    def list_dates_range(self, start_date: str, end_date: str):
+        """
+        list the objects of all dates between start_date and end_date with one paginated
+        listing, instead of one listing per date, and store them in the listing cache
+
+        :param start_date: first date of the range, e.g. '2021-09-01'
+        :param end_date: last date of the range
+
+        returns:
+            a dict of date -> list of ObjectInfo, dates without objects are left out
+        """
+        self._logger.info(
+            f'listing {self.endpoint_url}/{self.bucket_name} from {start_date} to {end_date}')
+        dates = {}
+        # keys of a date start with the date, so they sort right after it
+        for obj in self.storage.list(start_after=start_date):
+            date = obj.key.split('/', 1)[0]
+            if date > end_date:
+                break
+            dates.setdefault(date, []).append(ObjectInfo(obj.key, obj.etag, obj.size))
+        if self.listing is not None:
+            for date in list_dates(start_date, self.date_format, single_day=False, end_date=end_date)[1:]:
+                self.listing.put(date, dates.get(date, []), self._is_published(date, dates.get(date)))
+            self.listing.save()
+        return dates
+
+    def list_available_dates(self):
+        """
+        list the date prefixes of the bucket with a single delimiter listing
+
+        returns:
+            a sorted list of dates
+        """
+        return [prefix.rstrip('/') for prefix in self.storage.list_prefixes(delimiter='/')]
+
+    def _is_published(self, date_prefix, objects):
+        """
+        objects of past dates are not added or changed anymore, a past date without objects
+        may still be published late, so its empty listing expires like the listing of today
+        """
+        if not objects:
+            return False
+        try:
+            date = datetime.strptime(date_prefix, self.date_format)
+        except ValueError:
+            return False
+        return date.date() < datetime.today().date()
+
+    def iter_object(self, key, columns, decoding="utf-8", schema=None):
+        """
+        parse an s3 object csv file in chunks, straight from the response stream
 
         :param key: s3 object key
         :param columns: columns to select, passed to pd.read_csv(usecols)
         :param decoding: decoding codes for csv files, default to utf-8
+        :param schema: optional SourceSchema, its column types are applied while parsing
+
+        yields:
+            dataframes of at most chunksize rows with the specified columns,
+            a cached object is yielded as a single dataframe
+        """
+        with metrics.stage('read_object', bucket=self.bucket_name, key=key) as current:
+            current.rows_out = 0
+            for chunk in self._iter_object(key, columns, decoding, schema, current):
+                current.rows_out += len(chunk)
+                yield chunk
+
+    def _iter_object(self, key, columns, decoding, schema, current):
+        """
+        parse an object from the cache or the storage, see iter_object
+        """
+        if self.cache is None:
+            yield from self._iter_csv(key, columns, decoding, schema, current)
+            return
+        cache_key = self._cache_key(key, columns, decoding, schema)
+        if cache_key is None:
+            return
+        df = self.cache.get(cache_key)
+        if df is not None:
+            self._logger.info(f'reading file {key} from the local cache')
+            yield df
+            return
+        chunks = []
+        for chunk in self._iter_csv(key, columns, decoding, schema, current):
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            self.cache.put(cache_key, concat_frames(chunks))
+
+    def _cache_key(self, key, columns, decoding, schema):
+        """
+        address of a parsed object in the cache: bucket, key, ETag and the parse options
 
         returns:
-            a pandas dataframe with specified columns
+            the cache key, None if the object does not exist
+        """
+        etag = self._etags.get(key)
+        if etag is None:
+            try:
+                etag = self.storage.head(key).etag
+            except ObjectNotFoundException:
+                return None
+        schema_options = vars(schema) if schema is not None else None
+        return self.cache.make_key(self.bucket_name, key, etag, columns, decoding, schema_options)
+
+    def _iter_csv(self, key, columns, decoding="utf-8", schema=None, current=None):
+        """
+        parse an s3 object csv file in chunks from the response stream, see iter_object
+
+        :param current: metrics Stage the bytes read from the stream are added to
         """
         self._logger.info(
-            f'reading file {self.endpoint_url}/{self._bucket.name}/{key}')
+            f'reading file {self.endpoint_url}/{self.bucket_name}/{key}')
+        # storage backends are thread safe, so read_objects can call this method from a thread pool
         try:
-            csv_obj = self._bucket.Object(key=key)\
-                .get()\
-                .get("Body")\
-                .read()\
-                .decode(decoding)
-            rows = len(csv_obj.strip().split("\n"))
-            if rows >= 1:
-                data = StringIO(csv_obj)
-                if columns != "all":
-                    df = pd.read_csv(data, usecols=columns)
-                else:
-                    df = pd.read_csv(data)
-                return df
-            else:
-                return None
-        except self.session.client("s3").exceptions.NoSuchKey:
+            body = metrics.CountingReader(self.storage.open(key))
+        except ObjectNotFoundException:
+            return
+        usecols = None if columns == "all" else columns
+        dtype = schema.dtypes if schema is not None else None
+        try:
+            with pd.read_csv(body, usecols=usecols, encoding=decoding, dtype=dtype,
+                             chunksize=self.chunksize) as reader:
+                for chunk in reader:
+                    yield chunk if schema is None else schema.apply(chunk)
+        # an empty object has no header to parse
+        except EmptyDataError:
+            return
+        finally:
+            body.close()
+            if current is not None:
+                current.bytes += body.bytes
+
+    def read_object(self, key, columns, decoding="utf-8", schema=None):
+        """
+        read in an s3 object csv file as dataframe
+
+        :param key: s3 object key
+        :param columns: columns to select, passed to pd.read_csv(usecols)
+        :param decoding: decoding codes for csv files, default to utf-8
+        :param schema: optional SourceSchema, its column types are applied while parsing
+
+        returns:
+            a pandas dataframe with specified columns, None if the object does not exist or is empty
+        """
+        chunks = list(self.iter_object(key, columns, decoding, schema))
+        if not chunks:
             return None
+        return concat_frames(chunks)
 
-    def read_objects(self, input_date: str, columns="all"):
+    def read_objects(self, input_date: str, columns="all", schema=None):
         """
         get all day's objects into a dataframe
         start from a date
 
         :param input_date: start date
         :param columns: columns to select, passed to pd.read_csv(usecols)
+        :param schema: optional SourceSchema, its column types are applied while parsing
 
         returns:
             a dataframe concatting all day' objects
@@ -75,12 +317,240 @@ class SourceBucketConnector(BaseBucketConnector):
 
         dates = list_dates(input_date, self.date_format, single_day=True)
         for date in dates:
-            for key in self.list_keys_by_date_prefix(date):
+            for key in self.list_data_keys(date, columns):
                 all_keys.append(key)
+        return self._read_keys(all_keys, columns, schema)
+
+    def read_day(self, date: str, columns="all", schema=None):
+        """
+        get the objects of a single day into a dataframe, without the previous workday
+
+        :param date: date to read, e.g. '2021-09-17'
+        :param columns: columns to select, passed to pd.read_csv(usecols)
+        :param schema: optional SourceSchema, its column types are applied while parsing
+
+        returns:
+            a dataframe concatting the day's objects
+        """
+        return self._read_keys(self.list_data_keys(date, columns), columns, schema)
+
+    def read_table(self, key, columns, column_types: dict = None):
+        """
+        read an s3 object csv file as an arrow table with the multithreaded pyarrow csv reader
+
+        :param key: s3 object key
+        :param columns: columns to select, "all" for every column
+        :param column_types: arrow types of columns, the others are inferred
+
+        returns:
+            a pyarrow Table, None if the object does not exist or is empty
+        """
+        self._logger.info(
+            f'reading file {self.endpoint_url}/{self.bucket_name}/{key}')
+        with metrics.stage('read_object', bucket=self.bucket_name, key=key) as current:
+            try:
+                data, _ = self.storage.get(key)
+            except ObjectNotFoundException:
+                return None
+            current.bytes = len(data)
+            # same missing values as pd.read_csv, also in string columns
+            convert_options = pa_csv.ConvertOptions(
+                include_columns=None if columns == "all" else columns,
+                column_types=column_types, null_values=sorted(STR_NA_VALUES), strings_can_be_null=True)
+            try:
+                table = pa_csv.read_csv(pa.BufferReader(data), convert_options=convert_options)
+            # an empty object has no header to parse
+            except pa.ArrowInvalid as error:
+                if 'Empty CSV file' not in str(error):
+                    raise
+                return None
+            current.rows_out = table.num_rows
+            return table
+
+    def read_tables(self, dates: list, columns="all", column_types: dict = None):
+        """
+        get the objects of dates into one arrow table
+
+        :param dates: dates to read, e.g. ['2021-09-16', '2021-09-17']
+        :param columns: columns to select, "all" for every column
+        :param column_types: arrow types of columns, the others are inferred
+
+        returns:
+            a pyarrow Table concatting the objects in key order, None if there is no object
+        """
+        keys = [key for date in dates for key in self.list_data_keys(date, columns)]
+        if self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                tables = list(executor.map(metrics.bind_report(
+                    lambda key: self.read_table(key, columns, column_types)), keys))
+        else:
+            tables = [self.read_table(key, columns, column_types) for key in keys]
+        tables = [table for table in tables if table is not None]
+        if not tables:
+            return None
+        return pa.concat_tables(tables)
+
+    def _read_keys(self, keys, columns, schema=None):
+        """
+        read objects and concat them in the order of keys
+
+        :param keys: object keys to read
+        :param columns: columns to select, passed to pd.read_csv(usecols)
+        :param schema: optional SourceSchema, its column types are applied while parsing
+        """
         # return empty dataframe for wrong date
-        if not len(all_keys):
+        if not len(keys):
             return pd.DataFrame()
+        if self.parse_workers > 0:
+            return self._read_keys_pipelined(keys, columns, schema)
+        if self.max_workers > 1:
+            # executor.map yields results in the order of keys,
+            # so rows come out the same as with the serial loop
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                chunks = list(executor.map(metrics.bind_report(
+                    lambda key: list(self.iter_object(key, columns, schema=schema))), keys))
         else:
-            df = pd.concat([self.read_object(key, columns)
-                            for key in all_keys], ignore_index=True)
-            return df
+            chunks = [list(self.iter_object(key, columns, schema=schema)) for key in keys]
+        # a single concat over all chunks, no intermediate per-object frames
+        df = concat_frames(
+            [chunk for object_chunks in chunks for chunk in object_chunks])
+        return df
+
+    def _read_keys_pipelined(self, keys, columns, schema=None, decoding="utf-8"):
+        """
+        read objects with download threads and parser processes connected by a bounded queue,
+        the network and the parsers work at the same time and at most queue_size downloaded
+        objects are held in memory no matter how many objects a day has
+
+        :param keys: object keys to read
+        :param columns: columns to select, passed to pd.read_csv(usecols)
+        :param schema: optional SourceSchema, its column types are applied while parsing
+
+        returns:
+            a dataframe concatting the objects in the order of keys
+        """
+        downloaded = queue.Queue(maxsize=self.queue_size)
+        download = metrics.bind_report(self._download)
+        stop = threading.Event()
+
+        def produce(index, key):
+            if stop.is_set():
+                return
+            try:
+                downloaded.put((index, key) + download(key, columns, decoding, schema))
+            # the consumer re-raises the error instead of waiting for the object forever
+            except Exception as error:
+                downloaded.put((index, key, error, None, None))
+
+        frames = {}
+        stages = {}
+        cache_keys = {}
+        parsing = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as downloaders:
+            producers = [downloaders.submit(produce, index, key) for index, key in enumerate(keys)]
+            try:
+                received = 0
+                while received < len(keys) or parsing:
+                    # only take objects off the queue while a parser is free, the downloads
+                    # wait on the full queue until then
+                    if received < len(keys) and len(parsing) < self.parse_workers:
+                        index, key, data, cache_key, current = downloaded.get()
+                        received += 1
+                        if isinstance(data, Exception):
+                            raise data
+                        stages[index] = current
+                        if isinstance(data, pd.DataFrame) or data is None:
+                            frames[index] = data
+                            continue
+                        cache_keys[index] = cache_key
+                        parsing[self._parse_pool_executor().submit(
+                            _parse_csv, data, columns, decoding, schema)] = index
+                        continue
+                    done, _ = wait(parsing, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = parsing.pop(future)
+                        frames[index] = future.result()
+                        if stages[index] is not None and frames[index] is not None:
+                            stages[index].rows_out = len(frames[index])
+                        if self.cache is not None and cache_keys[index] is not None \
+                                and frames[index] is not None:
+                            self.cache.put(cache_keys[index], frames[index])
+            except BaseException:
+                # unblock the downloads waiting on the full queue, so the thread pool can shut down
+                stop.set()
+                while not all(producer.done() for producer in producers):
+                    try:
+                        downloaded.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                raise
+        return concat_frames([frames[index] for index in range(len(keys)) if frames[index] is not None])
+
+    def _download(self, key, columns, decoding, schema):
+        """
+        download an object for the parser processes, cached objects are returned parsed
+
+        returns:
+            a tuple of the object bytes or the cached dataframe (None if the object does not exist),
+            the cache key and the metrics Stage of the download
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(key, columns, decoding, schema)
+            if cache_key is None:
+                return None, None, None
+            df = self.cache.get(cache_key)
+            if df is not None:
+                self._logger.info(f'reading file {key} from the local cache')
+                return df, cache_key, None
+        self._logger.info(
+            f'reading file {self.endpoint_url}/{self.bucket_name}/{key}')
+        with metrics.stage('read_object', bucket=self.bucket_name, key=key) as current:
+            try:
+                data, _ = self.storage.get(key)
+            except ObjectNotFoundException:
+                return None, None, current
+            current.bytes = len(data)
+            # memory maps of the local storage can not be sent to another process
+            return bytes(data), cache_key, current
+
+    def _parse_pool_executor(self):
+        """
+        the process pool of the parsers, started on first use
+        """
+        if self._parse_pool is None:
+            # forking a process that runs boto3 threads can deadlock the child
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+        return self._parse_pool
+
+    def close(self):
+        """
+        stop the parser processes
+        """
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown()
+            self._parse_pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _parse_csv(data: bytes, columns, decoding="utf-8", schema=None):
+    """
+    parse a downloaded csv object, runs in the parser processes of SourceBucketConnector
+
+    returns:
+        a dataframe, None if the object is empty
+    """
+    usecols = None if columns == "all" else columns
+    dtype = schema.dtypes if schema is not None else None
+    try:
+        df = pd.read_csv(BytesIO(data), usecols=usecols, encoding=decoding, dtype=dtype)
+    # an empty object has no header to parse
+    except EmptyDataError:
+        return None
+    return df if schema is None else schema.apply(df)
@@ -0,0 +1,574 @@
+"""
+storage backends behind the bucket connectors: s3 and a local directory
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+from io import BytesIO
+import io
+import mmap
+import os
+import threading
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from xetra_jobs.common.constants import S3TargetConfig
+from xetra_jobs.common.exceptions import ObjectNotFoundException
+
+StorageObject = namedtuple('StorageObject', ['key', 'etag', 'size', 'last_modified'])
+
+
+class BaseStorage():
+    """
+    interface of a flat key-value object store
+
+    keys are '/' separated paths, listings are sorted by key
+    """
+
+    def list(self, prefix: str = '', start_after: str = None):
+        """
+        iterate over the objects whose key starts with prefix
+
+        :param prefix: key prefix
+        :param start_after: only list keys sorting after this key
+
+        yields:
+            StorageObject in key order
+        """
+        raise NotImplementedError
+
+    def list_prefixes(self, prefix: str = '', delimiter: str = '/'):
+        """
+        list the common prefixes below prefix up to the next delimiter, e.g. date directories
+
+        returns:
+            a sorted list of prefixes including the delimiter
+        """
+        raise NotImplementedError
+
+    def head(self, key: str):
+        """
+        metadata of an object, raises ObjectNotFoundException if it does not exist
+
+        returns:
+            a StorageObject
+        """
+        raise NotImplementedError
+
+    def open(self, key: str):
+        """
+        open an object for streaming reads, raises ObjectNotFoundException if it does not exist
+
+        returns:
+            a binary file-like object, the caller closes it
+        """
+        raise NotImplementedError
+
+    def get(self, key: str, if_none_match: str = None):
+        """
+        read a whole object, raises ObjectNotFoundException if it does not exist
+
+        :param key: object key
+        :param if_none_match: an ETag, nothing is read if the object still has it
+
+        returns:
+            a tuple of a bytes-like object, None if not modified, and the ETag
+        """
+        raise NotImplementedError
+
+    def get_range(self, key: str, start: int, end: int):
+        """
+        read the bytes [start, end) of an object, raises ObjectNotFoundException if it does not exist
+
+        returns:
+            bytes, shorter than end - start at the end of the object
+        """
+        raise NotImplementedError
+
+    def put(self, key: str, data: bytes):
+        """
+        write an object, readers never see a partially written object
+        """
+        raise NotImplementedError
+
+    def open_write(self, key: str):
+        """
+        open an object for streaming writes, the object is only visible once the writer
+        is closed, leaving a with block with an exception discards it
+
+        returns:
+            a binary writable file-like object
+        """
+        raise NotImplementedError
+
+    def delete(self, keys: list):
+        """
+        delete objects, missing keys are ignored
+        """
+        raise NotImplementedError
+
+
+class S3Storage(BaseStorage):
+    """
+    objects of an s3 bucket
+    """
+
+    def __init__(self, session, endpoint_url: str, bucket_name: str, max_pool_connections: int = 10,
+                 part_size: int = S3TargetConfig.MULTIPART_PART_SIZE.value,
+                 upload_workers: int = S3TargetConfig.MULTIPART_UPLOAD_WORKERS.value):
+        """
+        Constructor for S3Storage
+
+        :param session: a boto3 session
+        :param endpoint_url: s3 endpoint url
+        :param bucket_name: s3 bucket name
+        :param max_pool_connections: size of the http connection pool of the s3 client
+        :param part_size: size of the parts of multipart uploads, s3 requires at least 5 MiB
+        :param upload_workers: number of parts of a multipart upload sent in parallel
+        """
+        self._s3_client = session.resource(
+            service_name='s3', endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=max_pool_connections))
+        self._bucket = self._s3_client.Bucket(bucket_name)
+        # the low-level client is thread safe, unlike the bucket resource
+        self.client = self._bucket.meta.client
+        self.bucket_name = bucket_name
+        self.part_size = part_size
+        self.upload_workers = upload_workers
+
+    def list(self, prefix='', start_after=None):
+        kwargs = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if start_after is not None:
+            kwargs["StartAfter"] = start_after
+        for page in self.client.get_paginator('list_objects_v2').paginate(**kwargs):
+            for obj in page.get('Contents', []):
+                yield StorageObject(obj['Key'], obj['ETag'], obj['Size'], obj['LastModified'])
+
+    def list_prefixes(self, prefix='', delimiter='/'):
+        prefixes = []
+        pages = self.client.get_paginator('list_objects_v2').paginate(
+            Bucket=self.bucket_name, Prefix=prefix, Delimiter=delimiter)
+        for page in pages:
+            prefixes.extend(common['Prefix'] for common in page.get('CommonPrefixes', []))
+        return sorted(prefixes)
+
+    def head(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise ObjectNotFoundException(key)
+            raise
+        return StorageObject(key, response['ETag'], response['ContentLength'], response['LastModified'])
+
+    def open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket_name, Key=key)["Body"]
+        except self.client.exceptions.NoSuchKey:
+            raise ObjectNotFoundException(key)
+
+    def get(self, key, if_none_match=None):
+        kwargs = {"Bucket": self.bucket_name, "Key": key}
+        if if_none_match is not None:
+            kwargs["IfNoneMatch"] = if_none_match
+        try:
+            response = self.client.get_object(**kwargs)
+        except self.client.exceptions.NoSuchKey:
+            raise ObjectNotFoundException(key)
+        except ClientError as error:
+            # 304 Not Modified
+            if error.response["Error"]["Code"] != "304":
+                raise
+            return None, if_none_match
+        return response["Body"].read(), response["ETag"]
+
+    def get_range(self, key, start, end):
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key,
+                                              Range=f'bytes={start}-{end - 1}')
+        except self.client.exceptions.NoSuchKey:
+            raise ObjectNotFoundException(key)
+        return response["Body"].read()
+
+    def put(self, key, data):
+        self._bucket.put_object(Body=data, Key=key)
+
+    def open_write(self, key):
+        return MultipartWriter(self.client, self.bucket_name, key, self.part_size, self.upload_workers)
+
+    def delete(self, keys):
+        # at most 1000 keys are sent per request
+        for i in range(0, len(keys), 1000):
+            self._bucket.delete_objects(
+                Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]]})
+
+
+class LocalStorage(BaseStorage):
+    """
+    objects stored as files below a root directory, e.g. a local mirror of a bucket
+
+    reads are served from memory-mapped files, writes go to a temporary file
+    that is renamed over the target so they are atomic
+    """
+
+    def __init__(self, root: str):
+        """
+        Constructor for LocalStorage
+
+        :param root: directory standing in for the bucket
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def _walk(self, prefix='', start_after=None):
+        """
+        keys starting with prefix, skipping temporary files of unfinished writes
+        only the directories that can hold such keys are scanned, not the whole root
+
+        :param prefix: key prefix
+        :param start_after: directories whose keys all sort before it are skipped
+        """
+        directory = prefix.rpartition('/')[0]
+        for dirpath, dirnames, filenames in os.walk(self._path(directory) if directory else self.root):
+            relpath = os.path.relpath(dirpath, self.root)
+            base = '' if relpath == os.curdir else relpath.replace(os.sep, '/') + '/'
+            dirnames[:] = [name for name in dirnames
+                           if self._may_hold(f'{base}{name}/', prefix, start_after)]
+            for name in filenames:
+                key = base + name
+                if name.endswith('.tmp') or not key.startswith(prefix):
+                    continue
+                yield key
+
+    @staticmethod
+    def _may_hold(directory, prefix, start_after):
+        """
+        if keys below a directory, e.g. '2021-09-17/', can start with prefix and sort after start_after
+        """
+        if not (directory.startswith(prefix) or prefix.startswith(directory)):
+            return False
+        return start_after is None or directory > start_after or start_after.startswith(directory)
+
+    @staticmethod
+    def _object(key, stat):
+        # modification time and size change whenever the file is replaced
+        return StorageObject(key, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', stat.st_size,
+                             datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc))
+
+    def list(self, prefix='', start_after=None):
+        keys = sorted(self._walk(prefix, start_after))
+        for key in keys:
+            if start_after is not None and key <= start_after:
+                continue
+            try:
+                stat = os.stat(self._path(key))
+            # deleted in the meantime
+            except FileNotFoundError:
+                continue
+            yield self._object(key, stat)
+
+    def list_prefixes(self, prefix='', delimiter='/'):
+        if delimiter == '/':
+            # the prefixes are the subdirectories holding at least one key
+            directory, _, name = prefix.rpartition('/')
+            base = f'{directory}/' if directory else ''
+            try:
+                with os.scandir(self._path(directory) if directory else self.root) as entries:
+                    names = [entry.name for entry in entries
+                             if entry.is_dir() and entry.name.startswith(name)]
+            except (FileNotFoundError, NotADirectoryError):
+                return []
+            return sorted(f'{base}{subdir}/' for subdir in names
+                          if next(self._walk(f'{base}{subdir}/'), None) is not None)
+        prefixes = set()
+        for key in self._walk(prefix):
+            rest = key[len(prefix):]
+            if delimiter in rest:
+                prefixes.add(prefix + rest.split(delimiter, 1)[0] + delimiter)
+        return sorted(prefixes)
+
+    def head(self, key):
+        try:
+            return self._object(key, os.stat(self._path(key)))
+        except (FileNotFoundError, NotADirectoryError):
+            raise ObjectNotFoundException(key)
+
+    def _map(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                # empty files can not be memory-mapped
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise ObjectNotFoundException(key)
+
+    def open(self, key):
+        mapped = self._map(key)
+        return mapped if mapped is not None else BytesIO()
+
+    def get(self, key, if_none_match=None):
+        etag = self.head(key).etag
+        if if_none_match is not None and if_none_match == etag:
+            return None, etag
+        mapped = self._map(key)
+        return (memoryview(mapped) if mapped is not None else b''), etag
+
+    def get_range(self, key, start, end):
+        mapped = self._map(key)
+        if mapped is None:
+            return b''
+        with mapped:
+            return mapped[start:end]
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+
+    def open_write(self, key):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return AtomicFileWriter(path)
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+class MultipartWriter(io.RawIOBase):
+    """
+    writable stream uploaded to s3 in parts of part_size bytes
+
+    only the part being filled and the parts in flight are held in memory, a filled part
+    is handed to the upload as is and a new one is started, so the peak memory is
+    part_size * (upload_workers + 1), objects smaller than one part are sent with a single put_object
+    """
+
+    def __init__(self, client, bucket_name: str, key: str, part_size: int, upload_workers: int):
+        super().__init__()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.upload_workers = upload_workers
+        self._buffer = bytearray()
+        self._position = 0
+        self._upload_id = None
+        self._executor = None
+        self._pending = set()
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        view = memoryview(data).cast('B')
+        size = len(view)
+        while view:
+            free = self.part_size - len(self._buffer)
+            self._buffer += view[:free]
+            view = view[free:]
+            if len(self._buffer) >= self.part_size:
+                part, self._buffer = self._buffer, bytearray()
+                self._send_part(part)
+        self._position += size
+        return size
+
+    def _send_part(self, part: bytearray):
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key)["UploadId"]
+            self._executor = ThreadPoolExecutor(max_workers=self.upload_workers)
+        # wait for a free worker, so at most upload_workers parts are held in memory
+        if len(self._pending) >= self.upload_workers:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._parts.append(future.result())
+        part_number = len(self._parts) + len(self._pending) + 1
+        self._pending.add(self._executor.submit(self._upload_part, part_number, part))
+
+    def _upload_part(self, part_number, part):
+        response = self.client.upload_part(Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+                                           PartNumber=part_number, Body=part)
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self.client.put_object(Bucket=self.bucket_name, Key=self.key, Body=self._buffer)
+            else:
+                # the last part may be smaller than part_size
+                if self._buffer:
+                    self._send_part(self._buffer)
+                self._parts.extend(future.result() for future in self._pending)
+                self._pending = set()
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+                    MultipartUpload={"Parts": sorted(self._parts, key=lambda part: part["PartNumber"])})
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            if self._executor is not None:
+                self._executor.shutdown()
+            super().close()
+
+    def abort(self):
+        """
+        discard the written data and the uploaded parts
+        """
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+        if self._upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class RangeReader(io.RawIOBase):
+    """
+    seekable read-only view of an object, reads are served with ranged GETs
+
+    ranges fetched with prefetch are kept in memory, so a parquet reader decoding
+    known row groups does not send a request per column chunk
+    """
+
+    def __init__(self, storage: BaseStorage, key: str, size: int, hole_size: int = 8 * 1024):
+        """
+        Constructor for RangeReader
+
+        :param storage: storage holding the object
+        :param key: object key
+        :param size: object size in bytes
+        :param hole_size: prefetched ranges less than hole_size bytes apart are fetched together
+        """
+        super().__init__()
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.hole_size = hole_size
+        self.requests = 0
+        self.bytes_read = 0
+        self._position = 0
+        self._buffers = []
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def prefetch(self, ranges: list):
+        """
+        fetch byte ranges into memory, neighbouring ranges are merged into one request
+
+        :param ranges: (start, end) tuples, end excluded
+        """
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start - merged[-1][1] < self.hole_size:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        for start, end in merged:
+            self._buffers.append((start, self._get(start, min(end, self.size))))
+
+    def _get(self, start, end):
+        data = self.storage.get_range(self.key, start, end)
+        self.requests += 1
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer):
+        end = min(self._position + len(buffer), self.size)
+        size = end - self._position
+        if size <= 0:
+            return 0
+        for start, data in self._buffers:
+            if start <= self._position and end <= start + len(data):
+                chunk = data[self._position - start:end - start]
+                break
+        else:
+            chunk = self._get(self._position, end)
+        buffer[:size] = chunk
+        self._position = end
+        return size
+
+
+class AtomicFileWriter(io.RawIOBase):
+    """
+    writable file renamed over its target path on close
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self._file = open(self._tmp_path, 'wb')
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._file.tell()
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        super().close()
+
+    def abort(self):
+        """
+        discard the written data
+        """
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
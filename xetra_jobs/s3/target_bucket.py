@@ -1,8 +1,15 @@
 from xetra_jobs.s3.base_bucket import BaseBucketConnector
-from xetra_jobs.common.constants import MetaFileConfig,  S3FileFormats
-from xetra_jobs.common.exceptions import WrongFileFormatException
-from io import StringIO, BytesIO
+from xetra_jobs.common.constants import MetaFileConfig,  S3FileFormats, S3TargetConfig, TargetLayout
+from xetra_jobs.common.exceptions import WrongFileFormatException, ObjectNotFoundException
+from xetra_jobs.s3.storage import BaseStorage, RangeReader
+from xetra_jobs.common import metrics
+from datetime import datetime
+from contextlib import contextmanager
+from io import StringIO, BytesIO, TextIOWrapper
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import re
 
 
@@ -12,6 +19,7 @@ class TargetBucketConnector(BaseBucketConnector):
     """
 
     meta_key = MetaFileConfig.META_KEY.value
+    meta_snapshot_key = MetaFileConfig.META_SNAPSHOT_KEY.value
     meta_date_col = MetaFileConfig.META_DATE_COL.value
     meta_timestamp_col = MetaFileConfig.META_TIMESTAMP_COL.value
 
@@ -20,12 +28,34 @@ class TargetBucketConnector(BaseBucketConnector):
 
     prefix = "daily/"
 
-    def __init__(self, access_key_name, secret_access_key_name, endpoint_url, bucket_name):
-        super().__init__(access_key_name, secret_access_key_name, endpoint_url, bucket_name)
+    flat_layout = TargetLayout.FLAT.value
+    hive_layout = TargetLayout.HIVE.value
+
+    def __init__(self, access_key_name, secret_access_key_name, endpoint_url, bucket_name, session=None,
+                 storage: BaseStorage = None, part_size=S3TargetConfig.MULTIPART_PART_SIZE.value,
+                 upload_workers=S3TargetConfig.MULTIPART_UPLOAD_WORKERS.value):
+        """
+        Constructor for TargetBucketConnector
+
+        :param session: a boto3 session shared with other connectors
+        :param storage: storage backend, e.g. a local directory, s3 if not given
+        :param part_size: size of the parts of multipart uploads to s3, at least 5 MiB
+        :param upload_workers: number of parts of a multipart upload sent in parallel
+        """
+        super().__init__(access_key_name, secret_access_key_name, endpoint_url, bucket_name, session=session,
+                         storage=storage, part_size=part_size, upload_workers=upload_workers)
+        # parsed meta file of the last download: (etag, dataframe, set of dates)
+        self._meta_cache = None
+        # parsed meta snapshot of the markers layout, same shape as _meta_cache
+        self._snapshot_cache = None
+        self.meta_cache_hits = 0
+        self.meta_cache_misses = 0
 
     def read_meta_file(self, decoding="utf-8"):
         """
         retrieve meta file
+        the parsed meta file is kept in memory and revalidated with its ETag,
+        it is only downloaded again when it changed in s3
 
         :param decoding: decoding codes
 
@@ -34,23 +64,75 @@ class TargetBucketConnector(BaseBucketConnector):
         """
 
         self._logger.info(
-            f'reading meta file at {self.endpoint_url}/{self._bucket.name}/{self.meta_key}')
+            f'reading meta file at {self.endpoint_url}/{self.bucket_name}/{self.meta_key}')
+        cached_etag = self._meta_cache[0] if self._meta_cache is not None else None
         try:
-            csv_obj = self._bucket.Object(key=self.meta_key)\
-                .get()\
-                .get("Body")\
-                .read()\
-                .decode(decoding)
-            data = StringIO(csv_obj)
-            df = pd.read_csv(data)
+            data, etag = self.storage.get(self.meta_key, if_none_match=cached_etag)
         # if there is not meta file, return an empty dataframe with specified columns
-        except self.session.client("s3").exceptions.NoSuchKey:
-            df = pd.DataFrame(columns=[
+        except ObjectNotFoundException:
+            self._meta_cache = None
+            return pd.DataFrame(columns=[
                 self.meta_date_col,
                 self.meta_timestamp_col])
-        return df
+        # not modified: the cached meta file is still current
+        if data is None:
+            self.meta_cache_hits += 1
+            return self._meta_cache[1].copy()
+        df = pd.read_csv(StringIO(str(data, decoding)))
+        self.meta_cache_misses += 1
+        self._meta_cache = (etag, df,
+                            set(df[self.meta_date_col]) if self.meta_date_col in df.columns else set())
+        return df.copy()
+
+    def meta_dates(self):
+        """
+        dates recorded in the meta file, revalidated against s3 on every call
+
+        returns:
+            a set of dates
+        """
+        self.read_meta_file()
+        if self._meta_cache is None:
+            return set()
+        return self._meta_cache[2]
+
+    def read_meta_snapshot(self):
+        """
+        retrieve the parquet snapshot of the markers layout
+        cached and revalidated with its ETag like the meta file
+
+        returns:
+            the snapshot in dataframe, returns empty dataframe if the snapshot does not exist
+        """
+        cached_etag = self._snapshot_cache[0] if self._snapshot_cache is not None else None
+        try:
+            data, etag = self.storage.get(self.meta_snapshot_key, if_none_match=cached_etag)
+        except ObjectNotFoundException:
+            self._snapshot_cache = None
+            return pd.DataFrame(columns=[
+                self.meta_date_col,
+                self.meta_timestamp_col])
+        if data is None:
+            self.meta_cache_hits += 1
+            return self._snapshot_cache[1].copy()
+        df = pd.read_parquet(pa.BufferReader(data))
+        self.meta_cache_misses += 1
+        self._snapshot_cache = (etag, df, set(df[self.meta_date_col]))
+        return df.copy()
+
+    def snapshot_dates(self):
+        """
+        dates recorded in the meta snapshot, revalidated against s3 on every call
+
+        returns:
+            a set of dates
+        """
+        self.read_meta_snapshot()
+        if self._snapshot_cache is None:
+            return set()
+        return self._snapshot_cache[2]
 
-    def read_object(self, key: str, file_format: str, decoding="utf-8"):
+    def read_object(self, key: str, file_format: str, decoding="utf-8", columns: list = None):
         """
         read in an s3 object as a pandas dataframe
         used as a caching layer when input date exists in meta file
@@ -58,46 +140,229 @@ class TargetBucketConnector(BaseBucketConnector):
         :param key: object key
         :param file_format: object file format, support csv or parquet
         :param decoding: file decoding for csv files
+        :param columns: columns to read, all columns if None
 
         returns:
             a dataframe
         """
         self._logger.info(
-            f'reading file {self.endpoint_url}/{self._bucket.name}/{key}')
-        if file_format == self.csv_format:
-            csv_obj = self._bucket.Object(key=key)\
-                .get()\
-                .get("Body")\
-                .read()\
-                .decode(decoding)
-            df = pd.read_csv(StringIO(csv_obj))
-        if file_format == self.parquet_format:
-            parquet_obj = self._bucket.Object(key=key)\
-                .get()\
-                .get("Body")\
-                .read()
-            df = pd.read_parquet(BytesIO(parquet_obj))
+            f'reading file {self.endpoint_url}/{self.bucket_name}/{key}')
+        with metrics.stage('read_object', bucket=self.bucket_name, key=key) as current:
+            data, _ = self.storage.get(key)
+            current.bytes = len(data)
+            if file_format == self.csv_format:
+                df = pd.read_csv(StringIO(str(data, decoding)), usecols=columns)
+            if file_format == self.parquet_format:
+                df = pd.read_parquet(pa.BufferReader(data), columns=columns)
+            current.rows_out = len(df)
+        return df
+
+    @classmethod
+    def data_key(cls, prefix: str, date: datetime, key_date_format: str, file_format: str,
+                 layout: str = flat_layout):
+        """
+        key of the transformed data of a date
+
+        :param prefix: target prefix, e.g. daily/
+        :param date: date of the data
+        :param key_date_format: format of the date in the file name
+        :param file_format: csv or parquet
+        :param layout: flat or hive, see common.constants.TargetLayout
+        """
+        name = f'{date.strftime(key_date_format)}.{file_format}'
+        if layout == cls.hive_layout:
+            return f'{prefix}{cls.partition_prefix(date)}{name}'
+        return f'{prefix}{name}'
+
+    @staticmethod
+    def partition_prefix(date: datetime):
+        """
+        hive partition of the month of a date, e.g. year=2021/month=09/
+        """
+        return f'year={date.year}/month={date.month:02d}/'
+
+    def list_partitioned_keys(self, prefix: str, start_date: datetime, end_date: datetime,
+                              key_date_format: str):
+        """
+        list keys of the hive layout between two dates, only the month partitions
+        in the range are listed
+
+        :param prefix: target prefix, e.g. daily/
+        :param start_date: first date of the range
+        :param end_date: last date of the range
+        :param key_date_format: format of the date in the file name
+
+        returns:
+            a list of keys in date order
+        """
+        keys = []
+        for month in pd.date_range(start_date.replace(day=1), end_date, freq='MS'):
+            month_prefix = f'{prefix}{self.partition_prefix(month)}'
+            for key, _ in self.list_objects(month_prefix):
+                name = key[len(month_prefix):].rsplit('.', 1)[0]
+                try:
+                    date = datetime.strptime(name, key_date_format)
+                except ValueError:
+                    continue
+                if start_date <= date <= end_date:
+                    keys.append((date, key))
+        return [key for _, key in sorted(keys)]
+
+    def read_partitioned(self, keys: list, filter_expression: ds.Expression = None, columns: list = None):
+        """
+        read parquet objects as one pyarrow dataset with ranged GETs: the footer of each object
+        is read first, the filter is checked against the row group statistics and only the
+        matching row groups are downloaded
+
+        statistics are only used for comparisons, e.g. (ds.field('isin') == 'A') | (...),
+        pyarrow does not prune row groups with Expression.isin
+
+        :param keys: parquet object keys
+        :param filter_expression: pyarrow.dataset expression, e.g. ds.field('isin') == 'DE0005190003'
+        :param columns: columns to read, all columns if None
+
+        returns:
+            a dataframe, empty if no object matched
+        """
+        # reads are served from the prefetched row groups on the calling thread
+        file_format = ds.ParquetFileFormat(
+            default_fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=False))
+        fragments = []
+        readers = []
+        with metrics.stage('read_partitioned', bucket=self.bucket_name) as current:
+            for key in keys:
+                self._logger.info(
+                    f'reading row groups of {self.endpoint_url}/{self.bucket_name}/{key}')
+                reader = RangeReader(self.storage, key, self.storage.head(key).size)
+                fragment = file_format.make_fragment(reader)
+                selected = fragment.split_by_row_group(filter_expression) \
+                    if filter_expression is not None else fragment.split_by_row_group()
+                reader.prefetch([self._row_group_range(fragment.metadata.row_group(row_group.id))
+                                 for part in selected for row_group in part.row_groups])
+                fragments.extend(selected)
+                readers.append(reader)
+            if not fragments:
+                return pd.DataFrame(columns=columns)
+            dataset = ds.FileSystemDataset(
+                fragments, fragments[0].physical_schema, file_format)
+            df = dataset.to_table(columns=columns, filter=filter_expression, use_threads=False).to_pandas()
+            current.bytes = sum(reader.bytes_read for reader in readers)
+            current.rows_out = len(df)
         return df
 
+    @staticmethod
+    def _row_group_range(group: pq.RowGroupMetaData):
+        """
+        byte range of the column chunks of a row group
+
+        returns:
+            a tuple of start and end offset, end excluded
+        """
+        chunks = [group.column(i) for i in range(group.num_columns)]
+        starts = [chunk.dictionary_page_offset if chunk.has_dictionary_page else chunk.data_page_offset
+                  for chunk in chunks]
+        return min(starts), max(start + chunk.total_compressed_size for start, chunk in zip(starts, chunks))
+
+    def read_table(self, key: str, columns: list = None):
+        """
+        read a parquet object as an arrow table
+
+        :param key: object key
+        :param columns: columns to read, all columns if None
+
+        returns:
+            a pyarrow Table
+        """
+        self._logger.info(
+            f'reading file {self.endpoint_url}/{self.bucket_name}/{key}')
+        with metrics.stage('read_object', bucket=self.bucket_name, key=key) as current:
+            data, _ = self.storage.get(key)
+            current.bytes = len(data)
+            table = pq.read_table(pa.BufferReader(data), columns=columns)
+            current.rows_out = table.num_rows
+        return table
+
+    def write_table(self, table: pa.Table, key: str, file_format: str, row_group_size: int = None,
+                    index_column: str = None, index_key: str = None):
+        """
+        write an arrow table to S3, parquet is written from the table without pandas
+        supported formats: .csv, .parquet
+
+        :param table: the table that should be written
+        :param key: key of the saved file in s3
+        :param file_format: saving format
+        :param row_group_size: rows per parquet row group, None keeps the pyarrow default
+        :param index_column: column of the row group index written to index_key, see write_index
+        :param index_key: key of the row group index of a parquet object, no index if None
+        """
+        if file_format != self.parquet_format:
+            # csv output keeps the formatting of pandas
+            return self.write_s3(table.to_pandas(), key, file_format)
+        if table.num_rows == 0:
+            self._logger.info(
+                'The dataframe is empty! No file will be written!')
+            return None
+        collector = []
+        with self._open_write(key, rows=table.num_rows) as out_stream:
+            pq.write_table(table, out_stream, row_group_size=row_group_size,
+                           metadata_collector=collector)
+            size = out_stream.tell()
+        if index_key is not None:
+            self.write_index(table.column(index_column).to_pandas(), index_column, key,
+                             collector[0], size, index_key)
+        return True
+
+    def list_objects(self, prefix: str):
+        """
+        list objects under a prefix
+
+        :param prefix: key prefix
+
+        returns:
+            a list of (key, last modified datetime) tuples
+        """
+        return [(obj.key, obj.last_modified) for obj in self.storage.list(prefix)]
+
+    def object_exists(self, key: str):
+        """
+        check if an object exists with a HEAD request
+
+        :param key: object key
+        """
+        try:
+            self.storage.head(key)
+        except ObjectNotFoundException:
+            return False
+        return True
+
+    def delete_objects(self, keys: list):
+        """
+        delete objects
+
+        :param keys: object keys
+        """
+        self._logger.info(
+            f'deleting {len(keys)} files from {self.endpoint_url}/{self.bucket_name}')
+        self.storage.delete(keys)
+        return True
+
     def list_existing_dates(self):
         """
         list dates whose xetra data has been loaded to target bucket
+        keys may hold dates as YYYY-MM-DD or YYYYMMDD, e.g. daily/20210917.parquet
 
         returns:
-            a list of dates, without target prefix
+            a sorted list of dates in MetaFileConfig.META_DATE_FORMAT, without target prefix
         """
+        existing_dates = set()
+        for obj in self.storage.list(self.prefix):
+            m = re.search(r'(\d{4})-?(\d{2})-?(\d{2})', obj.key.rsplit('/', 1)[-1])
+            if m is not None:
+                existing_dates.add(f'{m.group(1)}-{m.group(2)}-{m.group(3)}')
+        return sorted(existing_dates)
 
-        existing_keys = [
-            obj.key for obj in self._bucket.objects.filter(Prefix=self.prefix)]
-        existing_dates = []
-        for key in existing_keys:
-            m = re.search(r'(\d+-\d+-\d+)', key)
-            date = m.group(1)
-            if date not in existing_dates:
-                existing_dates.append(date)
-        return existing_dates
-
-    def write_s3(self, df: pd.DataFrame, key: str, file_format: str):
+    def write_s3(self, df: pd.DataFrame, key: str, file_format: str, row_group_size: int = None,
+                 index_column: str = None, index_key: str = None):
         """
         write a dataframe to S3
         supported formats: .csv, .parquet
@@ -105,23 +370,162 @@ class TargetBucketConnector(BaseBucketConnector):
         :param df: the dataframe that should be written
         :param key: key of the saved file in s3
         :param format: saving format
+        :param row_group_size: rows per parquet row group, None keeps the pyarrow default
+        :param index_column: column of the row group index written to index_key, see write_index
+        :param index_key: key of the row group index of a parquet object, no index if None
         """
         if df.empty:
             self._logger.info(
                 'The dataframe is empty! No file will be written!')
             return None
         if file_format == self.csv_format:
-            out_buffer = StringIO()
-            df.to_csv(out_buffer, index=False)
-            return self._put_object(out_buffer, key)
+            with self._open_write(key, rows=len(df)) as out_stream:
+                text_stream = TextIOWrapper(out_stream, encoding='utf-8', newline='')
+                df.to_csv(text_stream, index=False)
+                text_stream.flush()
+                # the output stream is closed by _open_write
+                text_stream.detach()
+            return True
         if file_format == self.parquet_format:
-            out_buffer = BytesIO()
-            df.to_parquet(out_buffer, index=False)
-            return self._put_object(out_buffer, key)
+            # row groups are serialized straight into the upload stream
+            collector = []
+            with self._open_write(key, rows=len(df)) as out_stream:
+                df.to_parquet(out_stream, index=False,
+                              row_group_size=row_group_size, metadata_collector=collector)
+                size = out_stream.tell()
+            if index_key is not None:
+                self.write_index(df[index_column], index_column, key, collector[0], size, index_key)
+            return True
         self._logger.info(f'file format {file_format} is not '
                           'supported to be written to s3!')
         raise WrongFileFormatException(file_format)
 
+    def write_index(self, values: pd.Series, index_column: str, key: str,
+                    metadata: pq.FileMetaData, size: int, index_key: str):
+        """
+        write the row group index of a parquet object: one row per value and row group holding it,
+        with the byte range of the row group and the offset of the footer, so the row groups
+        of a value are read with ranged GETs, see read_row_groups
+
+        :param values: the index column of the written rows, in row order
+        :param index_column: name of the index column, e.g. isin
+        :param key: key of the parquet object
+        :param metadata: parquet metadata collected while writing the object
+        :param size: size of the object in bytes
+        :param index_key: key of the index object
+        """
+        rows = []
+        first_row = 0
+        footer_offset = 0
+        for row_group in range(metadata.num_row_groups):
+            group = metadata.row_group(row_group)
+            start, end = self._row_group_range(group)
+            footer_offset = max(footer_offset, end)
+            for value in pd.unique(values.iloc[first_row:first_row + group.num_rows]):
+                rows.append((value, key, row_group, start, end - start))
+            first_row += group.num_rows
+        index = pd.DataFrame(rows, columns=[index_column, 'key', 'row_group', 'offset', 'length'])
+        index['footer_offset'] = footer_offset
+        index['size'] = size
+        return self.write_s3(index, index_key, self.parquet_format)
+
+    def read_index(self, prefix: str):
+        """
+        read the row group indexes of a month: the compacted index {prefix}.parquet and
+        the indexes written since under prefix, the latest index of an object wins
+
+        :param prefix: index prefix of the month, e.g. index/2021-09/
+
+        returns:
+            a dataframe of index rows, empty if the month has no index
+        """
+        frames = []
+        try:
+            frames.append(self.read_object(f'{prefix.rstrip("/")}.{self.parquet_format}',
+                                           self.parquet_format))
+        except ObjectNotFoundException:
+            pass
+        for key, _ in self.list_objects(prefix):
+            frames.append(self.read_object(key, self.parquet_format))
+        if not frames:
+            return pd.DataFrame(columns=['key', 'row_group', 'offset', 'length', 'footer_offset', 'size'])
+        # the row groups of a rewritten object replace its compacted rows
+        latest = pd.concat([frame.assign(_index=i) for i, frame in enumerate(frames)], ignore_index=True)
+        latest = latest[latest['_index'] == latest.groupby('key')['_index'].transform('max')]
+        return latest.drop(columns='_index').reset_index(drop=True)
+
+    def compact_index(self, prefix: str):
+        """
+        merge the indexes written under prefix into the compacted index of the month
+
+        :param prefix: index prefix of the month, e.g. index/2021-09/
+
+        returns:
+            True if the month had indexes to merge
+        """
+        keys = [key for key, _ in self.list_objects(prefix)]
+        if not keys:
+            return False
+        index = self.read_index(prefix)
+        self.write_s3(index, f'{prefix.rstrip("/")}.{self.parquet_format}', self.parquet_format)
+        self.delete_objects(keys)
+        return True
+
+    def read_row_groups(self, index: pd.DataFrame, columns: list = None):
+        """
+        read the row groups listed in index rows of read_index, each object costs
+        one ranged GET of its footer and one per run of neighbouring row groups
+
+        :param index: index rows of the row groups to read
+        :param columns: columns to read, all columns if None
+
+        returns:
+            a dataframe of all rows of the row groups, in index order
+        """
+        frames = []
+        with metrics.stage('read_row_groups', bucket=self.bucket_name) as current:
+            current.bytes = 0
+            for key, rows in index.groupby('key', sort=False):
+                row_groups = sorted(set(rows['row_group']))
+                size = int(rows['size'].iloc[0])
+                footer_offset = int(rows['footer_offset'].iloc[0])
+                self._logger.info(
+                    f'reading row groups {row_groups} of {self.endpoint_url}/{self.bucket_name}/{key}')
+                reader = RangeReader(self.storage, key, size)
+                reader.prefetch([(footer_offset, size)] + [
+                    (int(offset), int(offset + length))
+                    for offset, length in rows.drop_duplicates('row_group')[['offset', 'length']].values])
+                # the footer ends with its length and the magic bytes
+                reader.seek(footer_offset)
+                tail = reader.read(size - footer_offset)
+                footer_length = int.from_bytes(tail[-8:-4], 'little')
+                metadata = pq.read_metadata(pa.BufferReader(b'PAR1' + tail[-8 - footer_length:]))
+                frames.append(pq.ParquetFile(reader, metadata=metadata)
+                              .read_row_groups(row_groups, columns=columns).to_pandas())
+                current.bytes += reader.bytes_read
+            current.rows_out = sum(len(frame) for frame in frames)
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    @contextmanager
+    def _open_write(self, key: str, rows: int = None):
+        """
+        Helper function for streaming writes to s3, large objects are sent as multipart uploads
+
+        :param key: target key of the saved file
+        :param rows: number of rows written, recorded in the write_s3 stage metrics
+        """
+        self._logger.info(
+            f'writing file to {self.endpoint_url}/{self.bucket_name}/{key}')
+        with metrics.stage('write_s3', bucket=self.bucket_name, key=key) as current:
+            current.rows_in = rows
+            with self.storage.open_write(key) as out_stream:
+                yield out_stream
+                current.bytes = out_stream.tell()
+        if key == self.meta_key:
+            self._meta_cache = None
+
     def _put_object(self, out_buffer: StringIO or BytesIO, key: str):
         """
         Helper function for writing to s3
@@ -130,6 +534,8 @@ class TargetBucketConnector(BaseBucketConnector):
         :param key: target key of the saved file
         """
         self._logger.info(
-            f'writing file to {self.endpoint_url}/{self._bucket.name}/{key}')
-        self._bucket.put_object(Body=out_buffer.getvalue(), Key=key)
+            f'writing file to {self.endpoint_url}/{self.bucket_name}/{key}')
+        self.storage.put(key, out_buffer.getvalue())
+        if key == self.meta_key:
+            self._meta_cache = None
         return True
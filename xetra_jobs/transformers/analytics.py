@@ -0,0 +1,195 @@
+"""
+rolling multi-day metrics per ISIN, computed incrementally from the daily target dataset
+"""
+from xetra_jobs.meta.meta_file import MetaFile
+from xetra_jobs.s3.target_bucket import TargetBucketConnector
+from xetra_jobs.transformers.config import ETLTargetConfig
+from xetra_jobs.common.constants import MetaFileConfig, S3FileFormats, TargetLayout
+from xetra_jobs.common.exceptions import ObjectNotFoundException
+from datetime import datetime
+import json
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+class RollingAnalytics():
+    """
+    n-day returns, volatility, moving averages and VWAP of the closing prices per ISIN
+
+    windows count the trading days of an ISIN, like a rolling window over its rows. the state
+    keeps the last max(windows) + 1 closing prices, volumes and price * volume of every ISIN
+    in ring buffers, so a new day is added in O(instruments) without reading the history again
+    """
+
+    state_name = 'state.parquet'
+
+    def __init__(self, trg_bucket: TargetBucketConnector, trg_args: ETLTargetConfig):
+        """
+        Constructor for RollingAnalytics
+
+        :param trg_bucket: connection to the target bucket, holding the daily dataset,
+            the analytics dataset and the state
+        :param trg_args: target configuration, trg_analytics_prefix and trg_analytics_windows
+        """
+        self._logger = logging.getLogger(__name__)
+        self.trg_bucket = trg_bucket
+        self.trg_args = trg_args
+        self.windows = sorted(trg_args.trg_analytics_windows)
+        self.prefix = trg_args.trg_analytics_prefix
+        self.state_key = f'{self.prefix}{self.state_name}'
+        self.reset()
+
+    def reset(self):
+        """
+        forget all ISINs and days
+        """
+        # ring buffers hold the current day and the max window days before it
+        self.length = max(self.windows) + 1
+        self.isins = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.close = np.empty((0, self.length))
+        self.volume = np.empty((0, self.length))
+        self.turnover = np.empty((0, self.length))
+        self.last_date = None
+
+    def update(self, df: pd.DataFrame):
+        """
+        add a day of the daily dataset to the state and compute its metrics
+
+        :param df: rows of one date with the isin, date, closing, min and max price and volume columns
+
+        returns:
+            a dataframe with isin, date and return_{n}d, volatility_{n}d, ma_{n}d, vwap_{n}d for
+            every window n, metrics of ISINs with too few trading days are missing
+        """
+        args = self.trg_args
+        df = df.dropna(subset=[args.trg_col_clos_price])
+        rows = self._rows(df[args.trg_col_isin])
+        close = df[args.trg_col_clos_price].to_numpy(dtype=np.float64)
+        volume = df[args.trg_col_dail_trad_vol].to_numpy(dtype=np.float64)
+        # typical price of the day, the minute prices are not in the daily dataset
+        typical = (df[args.trg_col_max_price].to_numpy(dtype=np.float64) +
+                   df[args.trg_col_min_price].to_numpy(dtype=np.float64) + close) / 3
+        position = self.count[rows] % self.length
+        self.close[rows, position] = close
+        self.volume[rows, position] = volume
+        self.turnover[rows, position] = typical * volume
+        self.count[rows] += 1
+        count = self.count[rows]
+        # column k is the k-th trading day before the current one
+        offsets = (count[:, None] - 1 - np.arange(self.length)) % self.length
+        closes = self.close[rows[:, None], offsets]
+        volumes = self.volume[rows[:, None], offsets]
+        turnovers = self.turnover[rows[:, None], offsets]
+        returns = closes[:, :-1] / closes[:, 1:] - 1
+        result = {args.trg_col_isin: df[args.trg_col_isin].to_numpy(),
+                  args.trg_col_date: df[args.trg_col_date].to_numpy()}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for n in self.windows:
+                full = count >= n
+                result[f'return_{n}d'] = np.where(
+                    count > n, (closes[:, 0] / closes[:, n] - 1) * 100, np.nan)
+                result[f'volatility_{n}d'] = np.where(
+                    count > n, returns[:, :n].std(axis=1, ddof=1) * 100, np.nan)
+                result[f'ma_{n}d'] = np.where(full, closes[:, :n].mean(axis=1), np.nan)
+                result[f'vwap_{n}d'] = np.where(
+                    full, turnovers[:, :n].sum(axis=1) / volumes[:, :n].sum(axis=1), np.nan)
+        return pd.DataFrame(result).round(2)
+
+    def _rows(self, isins: pd.Series):
+        """
+        state rows of ISINs, new ISINs get empty rows
+        """
+        new = [isin for isin in pd.unique(isins) if isin not in self.isins]
+        if new:
+            for isin in new:
+                self.isins[isin] = len(self.isins)
+            empty = np.full((len(new), self.length), np.nan)
+            self.count = np.concatenate([self.count, np.zeros(len(new), dtype=np.int64)])
+            self.close = np.vstack([self.close, empty])
+            self.volume = np.vstack([self.volume, empty])
+            self.turnover = np.vstack([self.turnover, empty])
+        return np.array([self.isins[isin] for isin in isins], dtype=np.int64)
+
+    def load_state(self):
+        """
+        read the state from the target bucket, a state of other windows is not used
+
+        returns:
+            True if a state was loaded
+        """
+        self.reset()
+        try:
+            table = self.trg_bucket.read_table(self.state_key)
+        except ObjectNotFoundException:
+            return False
+        meta = json.loads(table.schema.metadata[b'xetra_analytics'])
+        if meta['windows'] != self.windows:
+            self._logger.info(
+                f'analytics state has windows {meta["windows"]}, rebuilding for {self.windows}')
+            return False
+        isins = table.column('isin').to_pylist()
+        self.isins = {isin: row for row, isin in enumerate(isins)}
+        self.count = table.column('count').to_numpy().copy()
+        for name in ['close', 'volume', 'turnover']:
+            values = table.column(name).combine_chunks().flatten().to_numpy(zero_copy_only=False)
+            setattr(self, name, values.reshape(len(isins), self.length).copy())
+        self.last_date = meta['last_date']
+        return True
+
+    def save_state(self):
+        """
+        write the state to the target bucket as parquet
+        """
+        def buffers(values):
+            return pa.FixedSizeListArray.from_arrays(pa.array(values.ravel()), self.length)
+        table = pa.table({'isin': list(self.isins), 'count': self.count,
+                          'close': buffers(self.close), 'volume': buffers(self.volume),
+                          'turnover': buffers(self.turnover)})
+        table = table.replace_schema_metadata({'xetra_analytics': json.dumps(
+            {'windows': self.windows, 'last_date': self.last_date})})
+        return self.trg_bucket.write_table(table, self.state_key, S3FileFormats.PARQUET.value)
+
+    def run(self, end_date: str = None, rebuild=False):
+        """
+        compute the metrics of the dates in the meta file after the last date of the state
+        and write them to trg_analytics_prefix, one parquet object per date
+
+        dates loaded into the daily dataset before the last date of the state are not added,
+        run with rebuild=True to compute the whole history again
+
+        :param end_date: last date to compute, in MetaFileConfig.META_DATE_FORMAT, all dates if None
+        :param rebuild: ignore the stored state
+
+        returns:
+            the computed dates
+        """
+        if not rebuild:
+            self.load_state()
+        else:
+            self.reset()
+        dates = sorted(date for date in MetaFile.meta_dates(self.trg_bucket, self.trg_args.trg_meta_layout)
+                       if (self.last_date is None or date > self.last_date) and
+                       (end_date is None or date <= end_date))
+        args = self.trg_args
+        columns = [args.trg_col_isin, args.trg_col_date, args.trg_col_clos_price,
+                   args.trg_col_min_price, args.trg_col_max_price, args.trg_col_dail_trad_vol]
+        for date in dates:
+            day = datetime.strptime(date, MetaFileConfig.META_DATE_FORMAT.value)
+            df = self.trg_bucket.read_object(
+                self.trg_bucket.data_key(args.trg_prefix, day, args.trg_key_date_format,
+                                         args.trg_format, args.trg_layout),
+                args.trg_format, columns=columns)
+            metrics = self.update(df)
+            self.trg_bucket.write_s3(
+                metrics, self.trg_bucket.data_key(self.prefix, day, args.trg_key_date_format,
+                                                  S3FileFormats.PARQUET.value, TargetLayout.FLAT.value),
+                S3FileFormats.PARQUET.value)
+            self.last_date = date
+        if dates:
+            self.save_state()
+            self._logger.info(
+                f'computed analytics of {len(dates)} dates up to {self.last_date}')
+        return dates
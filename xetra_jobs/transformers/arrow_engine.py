@@ -0,0 +1,147 @@
+"""
+arrow implementation of the daily aggregation, used with src_engine: arrow
+"""
+from xetra_jobs.transformers.config import ETLSourceConfig, ETLTargetConfig
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def source_column_types(src_args: ETLSourceConfig):
+    """
+    arrow types of the source columns, the same types pd.read_csv infers for them
+
+    :param src_args: source configuration
+    """
+    types = {
+        src_args.src_col_isin: pa.string(),
+        src_args.src_col_mnemonic: pa.string(),
+        src_args.src_col_date: pa.string(),
+        src_args.src_col_time: pa.string(),
+        src_args.src_col_start_price: pa.float64(),
+        src_args.src_col_end_price: pa.float64(),
+        src_args.src_col_min_price: pa.float64(),
+        src_args.src_col_max_price: pa.float64(),
+        src_args.src_col_traded_vol: pa.int64()
+    }
+    return {col: dtype for col, dtype in types.items() if col in src_args.src_columns}
+
+
+def round_half_even(values, decimals: int):
+    """
+    round like np.round, scale, round half to even and scale back
+    """
+    factor = 10.0 ** decimals
+    return pc.divide(pc.round(pc.multiply(values, factor), round_mode='half_to_even'), factor)
+
+
+def aggregate_daily(table: pa.Table, src_args: ETLSourceConfig, trg_args: ETLTargetConfig,
+                    input_date: str, prev_day: pa.Table = None):
+    """
+    the arrow equivalent of ETL.transform for a non-empty table
+
+    :param table: source rows of the input date and, without prev_day, of the previous workday
+    :param src_args: source configuration
+    :param trg_args: target configuration
+    :param input_date: the date to keep
+    :param prev_day: isin and opening price of the previous workday, read from the target bucket
+
+    returns:
+        a pyarrow Table with the target columns, sorted by isin
+    """
+    table = table.drop_null()
+    # a stable sort, rows with the same time keep their source order
+    table = table.take(pc.sort_indices(table, [(src_args.src_col_time, 'ascending')]))
+    # ordered aggregations like first and last need a single thread
+    grouped = table.group_by([src_args.src_col_isin, src_args.src_col_date], use_threads=False)\
+        .aggregate([(src_args.src_col_start_price, 'first'),
+                    (src_args.src_col_start_price, 'last'),
+                    (src_args.src_col_min_price, 'min'),
+                    (src_args.src_col_max_price, 'max'),
+                    (src_args.src_col_traded_vol, 'sum')])
+    grouped = grouped.take(pc.sort_indices(
+        grouped, [(src_args.src_col_isin, 'ascending'), (src_args.src_col_date, 'ascending')]))
+    isins = grouped[src_args.src_col_isin]
+    op_prices = grouped[f'{src_args.src_col_start_price}_first']
+    # Change of current day's closing price compared to the
+    # previous trading day's closing price in %
+    if prev_day is not None:
+        positions = pc.index_in(isins, value_set=prev_day[trg_args.trg_col_isin])
+        prev_prices = pc.take(prev_day[trg_args.trg_col_op_price], positions)
+    else:
+        # rows are sorted by isin and date, the previous row of the same isin is the previous day
+        shifted = pa.concat_arrays([pa.nulls(1, pa.float64()), op_prices.combine_chunks()[:-1]]) \
+            if len(op_prices) else op_prices
+        same_isin = pa.concat_arrays([pa.array([False]),
+                                      pc.equal(isins[1:], isins[:-1]).combine_chunks()]) \
+            if len(isins) else pa.array([], pa.bool_())
+        prev_prices = pc.if_else(same_isin, shifted, pa.scalar(None, pa.float64()))
+    pct = pc.multiply(pc.divide(pc.subtract(op_prices, prev_prices), prev_prices), 100.0)
+    result = pa.table({
+        trg_args.trg_col_isin: isins,
+        trg_args.trg_col_date: grouped[src_args.src_col_date],
+        trg_args.trg_col_op_price: op_prices,
+        trg_args.trg_col_clos_price: grouped[f'{src_args.src_col_start_price}_last'],
+        trg_args.trg_col_min_price: grouped[f'{src_args.src_col_min_price}_min'],
+        trg_args.trg_col_max_price: grouped[f'{src_args.src_col_max_price}_max'],
+        # int64 like the pandas engine, whatever the type the volume was read with
+        trg_args.trg_col_dail_trad_vol: pc.cast(grouped[f'{src_args.src_col_traded_vol}_sum'], pa.int64()),
+        trg_args.trg_col_ch_prev_clos: pct
+    })
+    # select only data of input data, and rouding
+    result = result.filter(pc.equal(result[trg_args.trg_col_date], input_date))
+    for col in [trg_args.trg_col_op_price, trg_args.trg_col_clos_price, trg_args.trg_col_min_price,
+                trg_args.trg_col_max_price, trg_args.trg_col_ch_prev_clos]:
+        result = result.set_column(result.schema.get_field_index(col), col,
+                                   round_half_even(result[col], 2))
+    return result
+
+
+def aggregate_bars(table: pa.Table, src_args: ETLSourceConfig, trg_args: ETLTargetConfig,
+                   input_date: str, intervals: list):
+    """
+    the arrow equivalent of bars.resample_bars
+
+    :param table: extracted source rows
+    :param src_args: source configuration
+    :param trg_args: target configuration
+    :param input_date: the date of the bars
+    :param intervals: bar lengths in minutes, e.g. [5, 15, 60]
+
+    returns:
+        a dict of interval -> pyarrow Table, sorted by isin and time
+    """
+    table = table.drop_null()
+    table = table.filter(pc.equal(table[src_args.src_col_date], input_date))
+    table = table.take(pc.sort_indices(table, [(src_args.src_col_time, 'ascending')]))
+    times = table[src_args.src_col_time]
+    minutes = pc.add(pc.multiply(pc.cast(pc.utf8_slice_codeunits(times, 0, 2), pa.int64()), 60),
+                     pc.cast(pc.utf8_slice_codeunits(times, 3, 5), pa.int64()))
+    close_col = src_args.src_col_end_price if src_args.src_col_end_price in table.column_names \
+        else src_args.src_col_start_price
+    bars = {}
+    for interval in intervals:
+        # integer division of int64 arrays truncates
+        start = pc.multiply(pc.divide(minutes, interval), interval)
+        grouped = table.append_column('bar_start', start)\
+            .group_by([src_args.src_col_isin, 'bar_start'], use_threads=False)\
+            .aggregate([(src_args.src_col_start_price, 'first'),
+                        (src_args.src_col_max_price, 'max'),
+                        (src_args.src_col_min_price, 'min'),
+                        (close_col, 'last'),
+                        (src_args.src_col_traded_vol, 'sum')])
+        grouped = grouped.take(pc.sort_indices(
+            grouped, [(src_args.src_col_isin, 'ascending'), ('bar_start', 'ascending')]))
+        hours = pc.utf8_lpad(pc.cast(pc.divide(grouped['bar_start'], 60), pa.string()), 2, '0')
+        mins = pc.utf8_lpad(pc.cast(pc.subtract(grouped['bar_start'], pc.multiply(
+            pc.divide(grouped['bar_start'], 60), 60)), pa.string()), 2, '0')
+        bars[interval] = pa.table({
+            trg_args.trg_col_isin: grouped[src_args.src_col_isin],
+            trg_args.trg_col_date: pa.array([input_date] * grouped.num_rows, pa.string()),
+            trg_args.trg_col_time: pc.binary_join_element_wise(hours, mins, ':'),
+            trg_args.trg_col_op_price: grouped[f'{src_args.src_col_start_price}_first'],
+            trg_args.trg_col_max_price: grouped[f'{src_args.src_col_max_price}_max'],
+            trg_args.trg_col_min_price: grouped[f'{src_args.src_col_min_price}_min'],
+            trg_args.trg_col_clos_price: grouped[f'{close_col}_last'],
+            trg_args.trg_col_dail_trad_vol: grouped[f'{src_args.src_col_traded_vol}_sum']
+        })
+    return bars
@@ -0,0 +1,141 @@
+"""
+run the ETL job for a range of dates
+"""
+from xetra_jobs.meta.meta_file import MetaFile
+from xetra_jobs.transformers.transformers import ETL
+from xetra_jobs.common.constants import MetaFileLayout
+from xetra_jobs.common.utils import list_dates, concat_frames
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import math
+
+
+def run_dates(etl: ETL, dates: list):
+    """
+    transform and load workdays, each source day is read only once and kept as
+    the previous day of the next date, unless there is a gap between the two
+
+    :param etl: an ETL instance, its input date is ignored
+    :param dates: workdays in ascending order
+
+    returns:
+        dates whose transformed data was written to the target bucket
+    """
+    logger = logging.getLogger(__name__)
+    # marker objects are written independently by each worker, the csv meta file
+    # is updated once at the end of the backfill
+    update_meta = etl.trg_args.trg_meta_layout == MetaFileLayout.MARKERS.value
+    columns = etl.src_args.src_columns
+    date_format = etl.input_date_format
+    prev_date, df_prev = None, None
+    processed = []
+    for date in dates:
+        # dates already in the meta file leave gaps, the workday before a gap is read again
+        if list_dates(date, date_format)[0] != prev_date:
+            prev_date = list_dates(date, date_format)[0]
+            df_prev = etl.src_bucekt.read_day(prev_date, columns, etl.src_schema)
+        df_day = etl.src_bucekt.read_day(date, columns, etl.src_schema)
+        df = concat_frames([df_prev, df_day])
+        etl_day = etl.for_date(date)
+        df, loaded = etl_day.transform(df)
+        if df.empty:
+            logger.info(f'no source data for {date}, skip loading')
+        else:
+            etl_day.load(df, loaded, update_meta=update_meta)
+            processed.append(date)
+        prev_date, df_prev = date, df_day
+    return processed
+
+
+def _run_dates_from_config(config: dict, dates: list):
+    """
+    entry of a worker process, connectors can not be pickled so they are created in the worker
+    """
+    with ETL.from_config(config) as etl:
+        return run_dates(etl, dates)
+
+
+class Backfill():
+    """
+    run the ETL job for all dates in a range that are missing from the meta file
+    """
+
+    def __init__(self, etl: ETL, max_workers=1, config: dict = None):
+        """
+        Constructor for Backfill
+
+        :param etl: an ETL instance, its input date is ignored
+        :param max_workers: number of worker processes, 1 runs all dates in the current process
+        :param config: parsed content of configs/config.yaml, required when max_workers > 1
+        """
+        if max_workers > 1 and config is None:
+            raise ValueError('config is required to run a backfill in worker processes')
+        self._logger = logging.getLogger(__name__)
+        self.etl = etl
+        self.max_workers = max_workers
+        self.config = config
+
+    def missing_dates(self, start_date: str, end_date: str):
+        """
+        list workdays between start_date and end_date that are not in the meta file
+
+        :param start_date: first date of the range
+        :param end_date: last date of the range
+        """
+        # the first element is the workday before start_date
+        dates = list_dates(start_date, self.etl.input_date_format,
+                           single_day=False, end_date=end_date)[1:]
+        existing_dates = MetaFile.meta_dates(
+            self.etl.trg_bucket, self.etl.trg_args.trg_meta_layout)
+        return [date for date in dates if date not in existing_dates]
+
+    def split_dates(self, dates: list):
+        """
+        split dates into at most max_workers chunks of neighbouring dates,
+        each chunk reads the previous day of its first date only once
+        """
+        size = math.ceil(len(dates) / self.max_workers)
+        return [dates[i:i + size] for i in range(0, len(dates), size)]
+
+    def run(self, start_date: str, end_date: str):
+        """
+        process all missing dates and commit them to the meta file in one write,
+        with the markers layout the markers are compacted into the snapshot instead
+
+        :param start_date: first date of the range
+        :param end_date: last date of the range
+
+        returns:
+            the processed dates
+        """
+        dates = self.missing_dates(start_date, end_date)
+        if not dates:
+            self._logger.info(
+                f'all dates between {start_date} and {end_date} are in the meta file')
+            return []
+        self._logger.info(f'backfilling {len(dates)} dates')
+        if self.etl.src_bucekt.listing is not None:
+            # one paginated listing for the whole range instead of one per date,
+            # worker processes share it through the persisted index
+            self.etl.src_bucekt.list_dates_range(
+                list_dates(dates[0], self.etl.input_date_format)[0], dates[-1])
+        chunks = self.split_dates(dates)
+        if self.max_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                results = executor.map(_run_dates_from_config,
+                                       [self.config] * len(chunks), chunks)
+                processed = [date for result in results for date in result]
+        else:
+            processed = [date for chunk in chunks
+                         for date in run_dates(self.etl, chunk)]
+        if not processed:
+            return processed
+        if self.etl.trg_args.trg_meta_layout == MetaFileLayout.MARKERS.value:
+            MetaFile.compact_meta_file(self.etl.trg_bucket)
+            self._logger.info('compacted meta file markers')
+        else:
+            MetaFile.update_meta_file(processed, self.etl.trg_bucket)
+            self._logger.info(f'updated meta file with {len(processed)} dates')
+        if self.etl.index_key() is not None:
+            self.etl.compact_index(processed)
+        return processed
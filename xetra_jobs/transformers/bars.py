@@ -0,0 +1,67 @@
+"""
+intraday OHLCV bars of the extracted source data, written next to the daily dataset
+"""
+from xetra_jobs.transformers.config import ETLSourceConfig, ETLTargetConfig
+import pandas as pd
+
+
+def time_to_minutes(times: pd.Series):
+    """
+    minutes since midnight of 'HH:MM' times, times parsed by SourceSchema are minutes already
+    """
+    if pd.api.types.is_numeric_dtype(times):
+        return times.astype('int64')
+    return pd.to_numeric(times.str.slice(0, 2)) * 60 + pd.to_numeric(times.str.slice(3, 5))
+
+
+def minutes_to_time(minutes: pd.Series):
+    """
+    'HH:MM' of minutes since midnight
+    """
+    return (minutes // 60).astype(str).str.zfill(2) + ':' + (minutes % 60).astype(str).str.zfill(2)
+
+
+def resample_bars(df: pd.DataFrame, src_args: ETLSourceConfig, trg_args: ETLTargetConfig,
+                  input_date: str, intervals: list):
+    """
+    bars of the input date for every interval
+
+    :param df: extracted source rows without missing values, sorted by time
+    :param src_args: source configuration
+    :param trg_args: target configuration
+    :param input_date: the date of the bars
+    :param intervals: bar lengths in minutes, e.g. [5, 15, 60]
+
+    returns:
+        a dict of interval -> dataframe with isin, date, bar start time, open, high, low, close
+        and volume, sorted by isin and time
+    """
+    dates = df[src_args.src_col_date]
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        dates = dates.dt.strftime(src_args.src_input_date_format)
+    df = df[dates == input_date]
+    minutes = time_to_minutes(df[src_args.src_col_time])
+    # the closing price of a minute is its end price, if it was extracted
+    close_col = src_args.src_col_end_price if src_args.src_col_end_price in df.columns \
+        else src_args.src_col_start_price
+    bars = {}
+    for interval in intervals:
+        start = (minutes // interval * interval).rename(trg_args.trg_col_time)
+        bar = df.groupby([df[src_args.src_col_isin], start], observed=True).agg(**{
+            trg_args.trg_col_op_price: (src_args.src_col_start_price, 'first'),
+            trg_args.trg_col_max_price: (src_args.src_col_max_price, 'max'),
+            trg_args.trg_col_min_price: (src_args.src_col_min_price, 'min'),
+            trg_args.trg_col_clos_price: (close_col, 'last'),
+            trg_args.trg_col_dail_trad_vol: (src_args.src_col_traded_vol, 'sum')}).reset_index()
+        bar = bar.rename(columns={src_args.src_col_isin: trg_args.trg_col_isin})
+        bar[trg_args.trg_col_isin] = bar[trg_args.trg_col_isin].astype(object)
+        bar[trg_args.trg_col_time] = minutes_to_time(bar[trg_args.trg_col_time])
+        bar.insert(1, trg_args.trg_col_date, input_date)
+        price_cols = [trg_args.trg_col_op_price, trg_args.trg_col_max_price,
+                      trg_args.trg_col_min_price, trg_args.trg_col_clos_price]
+        bar[price_cols] = bar[price_cols].astype('float64')
+        bar[trg_args.trg_col_dail_trad_vol] = bar[trg_args.trg_col_dail_trad_vol].astype('int64')
+        # categorical ISINs are grouped in category order, not sorted by value
+        bars[interval] = bar.sort_values(by=[trg_args.trg_col_isin, trg_args.trg_col_time])\
+            .reset_index(drop=True)
+    return bars
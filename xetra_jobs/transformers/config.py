@@ -16,6 +16,14 @@ class ETLSourceConfig:
     src_col_min_price: str
     src_col_max_price: str
     src_col_traded_vol: str
+    src_col_end_price: str = "EndPrice"
+    src_col_mnemonic: str = "Mnemonic"
+    # parse source columns into compact types, see transformers.schema.SourceSchema
+    src_compact_dtypes: bool = False
+    # store prices as float32 instead of float64, only used with src_compact_dtypes
+    src_float32_prices: bool = False
+    # 'pandas' or 'arrow', see common.constants.PipelineEngine
+    src_engine: str = "pandas"
 
 
 @dataclass
@@ -34,3 +42,25 @@ class ETLTargetConfig:
     trg_col_max_price: str
     trg_col_dail_trad_vol: str
     trg_col_ch_prev_clos: str
+    # meta file layout, 'csv' or 'markers', see common.constants.MetaFileLayout
+    trg_meta_layout: str = "csv"
+    # a single-day job of the markers layout compacts the markers once there are this many
+    trg_meta_compact_markers: int = 30
+    # key layout, 'flat' or 'hive', see common.constants.TargetLayout
+    trg_layout: str = "flat"
+    # rows per parquet row group, None keeps the pyarrow default
+    trg_row_group_size: int = None
+    # prefix of the rolling analytics dataset and its state, see transformers.analytics
+    trg_analytics_prefix: str = "analytics/"
+    # rolling windows of the analytics in trading days
+    trg_analytics_windows: tuple = (5, 20, 60)
+    # lengths in minutes of the intraday bars written by load, no bars if empty
+    trg_bar_intervals: tuple = ()
+    # prefix of the bars, the bars of an interval are written under {trg_bar_prefix}{interval}m/
+    trg_bar_prefix: str = "bars/"
+    # bar start time column of the bars
+    trg_col_time: str = "time"
+    # write a row group index of the ISINs of every parquet object, see ETL.lookup
+    trg_isin_index: bool = False
+    # prefix of the ISIN index, one compacted index per month under {trg_index_prefix}YYYY-MM.parquet
+    trg_index_prefix: str = "index/"
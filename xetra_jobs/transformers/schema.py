@@ -0,0 +1,70 @@
+"""
+compact column types for extracted source data
+"""
+from xetra_jobs.transformers.config import ETLSourceConfig
+import pandas as pd
+
+
+class SourceSchema():
+    """
+    column types applied while parsing source csv files
+
+    ISIN and Mnemonic become categoricals, the date is parsed, time is stored as
+    minutes since midnight and prices/volume use narrow numeric types
+    """
+
+    def __init__(self, dtypes: dict, date_columns: dict, time_columns: list):
+        """
+        Constructor for SourceSchema
+
+        :param dtypes: column types passed to pd.read_csv(dtype)
+        :param date_columns: date columns mapped to their date format
+        :param time_columns: 'HH:MM' columns converted to minutes since midnight
+        """
+        self.dtypes = dtypes
+        self.date_columns = date_columns
+        self.time_columns = time_columns
+
+    @classmethod
+    def from_config(cls, src_args: ETLSourceConfig):
+        """
+        build the schema of the columns listed in src_args.src_columns
+
+        :param src_args: source configuration
+        """
+        price_type = 'float32' if src_args.src_float32_prices else 'float64'
+        types = {
+            src_args.src_col_isin: 'category',
+            src_args.src_col_mnemonic: 'category',
+            src_args.src_col_start_price: price_type,
+            src_args.src_col_end_price: price_type,
+            src_args.src_col_min_price: price_type,
+            src_args.src_col_max_price: price_type,
+            # nullable, a missing volume must not fail the parse, those rows are dropped in transform
+            src_args.src_col_traded_vol: 'UInt32'
+        }
+        columns = src_args.src_columns
+        dtypes = {col: dtype for col, dtype in types.items() if col in columns}
+        date_columns = {src_args.src_col_date: src_args.src_input_date_format} \
+            if src_args.src_col_date in columns else {}
+        time_columns = [src_args.src_col_time] if src_args.src_col_time in columns else []
+        return cls(dtypes, date_columns, time_columns)
+
+    def apply(self, chunk: pd.DataFrame):
+        """
+        convert the columns that pd.read_csv can not type at parse time
+
+        :param chunk: a parsed chunk of a source object
+
+        returns:
+            the converted chunk
+        """
+        for col, date_format in self.date_columns.items():
+            chunk[col] = pd.to_datetime(chunk[col], format=date_format)
+        for col in self.time_columns:
+            minutes = pd.to_numeric(chunk[col].str.slice(0, 2)) * 60 \
+                + pd.to_numeric(chunk[col].str.slice(3, 5))
+            # int16 can not hold missing values, those rows are dropped in transform anyway
+            chunk[col] = minutes.astype('float32') if minutes.isna().any() \
+                else minutes.astype('int16')
+        return chunk
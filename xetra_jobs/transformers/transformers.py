@@ -2,8 +2,24 @@ from xetra_jobs.meta.meta_file import MetaFile
 from xetra_jobs.s3.target_bucket import TargetBucketConnector
 from xetra_jobs.s3.source_bucket import SourceBucketConnector
 from xetra_jobs.transformers.config import ETLSourceConfig, ETLTargetConfig
+from xetra_jobs.transformers.schema import SourceSchema
+from xetra_jobs.transformers.arrow_engine import source_column_types, aggregate_daily, aggregate_bars
+from xetra_jobs.transformers.bars import resample_bars
+from xetra_jobs.common.constants import MetaFileConfig, TargetLayout, PipelineEngine, S3TargetConfig
+from xetra_jobs.common.cache import FrameCache
+from xetra_jobs.s3.listing import ListingCache
+from xetra_jobs.s3.storage import LocalStorage
+from xetra_jobs.s3.async_bucket import AsyncBucket
+from xetra_jobs.common.utils import list_dates, concat_frames
+from xetra_jobs.common import metrics
+from dataclasses import replace
+from functools import reduce
+import asyncio
 import logging
+import operator
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from datetime import datetime
 
 
@@ -33,6 +49,198 @@ class ETL():
         # just for convenience, since we are going to use the input date multiple times
         self.input_date = self.src_args.src_input_date
         self.input_date_format = self.src_args.src_input_date_format
+        # compact column types for the extracted source data, None keeps pandas defaults
+        self.src_schema = SourceSchema.from_config(self.src_args) \
+            if self.src_args.src_compact_dtypes else None
+        # ISIN and opening price of the previous workday read from the target bucket by extract(),
+        # None when the previous workday is aggregated from source data together with the input date
+        self.prev_day = None
+        # intraday bars of the input date computed by transform() and written by load(),
+        # interval -> dataframe or pyarrow Table
+        self.bars = {}
+        # directory of the json run reports written by run(), no report is written if None
+        self.report_dir = None
+        # RunReport of the last run()
+        self.last_report = None
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """
+        create an ETL instance together with its bucket connectors
+
+        :param config: parsed content of configs/config.yaml
+
+        returns:
+            an ETL instance
+        """
+        s3_config = config['s3']
+        # a bucket mirrored to a local directory is read from disk instead of s3
+        src_storage = LocalStorage(s3_config['src_local_dir']) if s3_config.get('src_local_dir') else None
+        trg_storage = LocalStorage(s3_config['trg_local_dir']) if s3_config.get('trg_local_dir') else None
+        # both connectors share one session
+        session = SourceBucketConnector.create_session(
+            s3_config['access_key_name'], s3_config['secret_access_key_name']) \
+            if src_storage is None or trg_storage is None else None
+        cache = FrameCache(s3_config['src_cache_dir'], s3_config.get('src_cache_max_bytes')) \
+            if s3_config.get('src_cache_dir') else None
+        listing = ListingCache(s3_config['src_listing_ttl'], s3_config.get('src_listing_index')) \
+            if s3_config.get('src_listing_ttl') else None
+        src_bucket = SourceBucketConnector(access_key_name=s3_config['access_key_name'],
+                                           secret_access_key_name=s3_config['secret_access_key_name'],
+                                           endpoint_url=s3_config['src_endpoint_url'],
+                                           bucket_name=s3_config['src_bucket'],
+                                           max_workers=s3_config.get('src_max_workers', 1),
+                                           session=session, cache=cache, listing=listing,
+                                           storage=src_storage,
+                                           parse_workers=s3_config.get('src_parse_workers', 0),
+                                           queue_size=s3_config.get('src_queue_size'))
+        trg_bucket = TargetBucketConnector(access_key_name=s3_config['access_key_name'],
+                                           secret_access_key_name=s3_config['secret_access_key_name'],
+                                           endpoint_url=s3_config['trg_endpoint_url'],
+                                           bucket_name=s3_config['trg_bucket'],
+                                           session=session, storage=trg_storage,
+                                           part_size=s3_config.get(
+                                               'trg_part_size', S3TargetConfig.MULTIPART_PART_SIZE.value),
+                                           upload_workers=s3_config.get(
+                                               'trg_upload_workers', S3TargetConfig.MULTIPART_UPLOAD_WORKERS.value))
+        src_config = ETLSourceConfig(**config['source'])
+        trg_config = ETLTargetConfig(**config['target'])
+        etl = cls(src_bucket, trg_bucket, MetaFileConfig.META_KEY.value, src_config, trg_config)
+        etl.report_dir = config.get('metrics', {}).get('report_dir')
+        return etl
+
+    def for_date(self, input_date: str):
+        """
+        create an ETL instance for another input date, sharing the bucket connectors
+
+        :param input_date: the new input date
+
+        returns:
+            an ETL instance
+        """
+        etl = ETL(self.src_bucekt, self.trg_bucket, self.meta_key,
+                  replace(self.src_args, src_input_date=input_date), self.trg_args)
+        etl.report_dir = self.report_dir
+        return etl
+
+    def close(self):
+        """
+        stop the parser processes of the source connector, instances created by for_date share them
+        """
+        self.src_bucekt.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def target_key(self, input_date: str = None):
+        """
+        key of the transformed data of a date in the target bucket
+
+        :param input_date: date in input_date_format, defaults to the input date
+        """
+        date = datetime.strptime(input_date or self.input_date, self.input_date_format)
+        return self.trg_bucket.data_key(self.trg_args.trg_prefix, date, self.trg_args.trg_key_date_format,
+                                        self.trg_args.trg_format, self.trg_args.trg_layout)
+
+    def query(self, start_date: str, end_date: str, isins: list = None, columns: list = None):
+        """
+        read transformed data of a date range from the hive layout, only the month
+        partitions in the range are listed and the ISIN filter is pushed down to the row groups
+
+        :param start_date: first date of the range in input_date_format
+        :param end_date: last date of the range in input_date_format
+        :param isins: ISINs to keep, all ISINs if None
+        :param columns: target columns to read, all columns if None
+
+        returns:
+            a dataframe of the matching rows
+        """
+        if self.trg_args.trg_layout != TargetLayout.HIVE.value \
+                or self.trg_args.trg_format != self.trg_bucket.parquet_format:
+            raise ValueError('query requires trg_layout hive and trg_format parquet')
+        keys = self.trg_bucket.list_partitioned_keys(
+            self.trg_args.trg_prefix,
+            datetime.strptime(start_date, self.input_date_format),
+            datetime.strptime(end_date, self.input_date_format),
+            self.trg_args.trg_key_date_format)
+        # comparisons are checked against the row group statistics, isin() is not
+        filter_expression = reduce(operator.or_, [ds.field(self.trg_args.trg_col_isin) == isin
+                                                  for isin in isins], ds.scalar(False)) \
+            if isins is not None else None
+        return self.trg_bucket.read_partitioned(keys, filter_expression, columns)
+
+    def index_prefix(self, input_date: str = None):
+        """
+        prefix of the ISIN indexes of the month of a date, e.g. index/2021-09/
+
+        :param input_date: date in input_date_format, defaults to the input date
+        """
+        date = datetime.strptime(input_date or self.input_date, self.input_date_format)
+        return f'{self.trg_args.trg_index_prefix}{date.strftime("%Y-%m")}/'
+
+    def index_key(self, input_date: str = None):
+        """
+        key of the ISIN index of the transformed data of a date, None if no index is written
+        the indexes of a month are merged into one object by compact_index
+
+        :param input_date: date in input_date_format, defaults to the input date
+        """
+        if not self.trg_args.trg_isin_index or self.trg_args.trg_format != self.trg_bucket.parquet_format:
+            return None
+        date = datetime.strptime(input_date or self.input_date, self.input_date_format)
+        return f'{self.index_prefix(input_date)}{date.strftime(self.trg_args.trg_key_date_format)}' \
+            f'.{self.trg_bucket.parquet_format}'
+
+    def compact_index(self, dates: list):
+        """
+        merge the ISIN indexes of the months of dates into one object per month
+
+        :param dates: dates in input_date_format
+        """
+        for prefix in sorted({self.index_prefix(date) for date in dates}):
+            if self.trg_bucket.compact_index(prefix):
+                self._logger.info(f'compacted ISIN index {prefix}')
+
+    def lookup(self, isin: str, start_date: str, end_date: str = None, columns: list = None):
+        """
+        read the rows of one ISIN in a date range through the ISIN index, only the row groups
+        holding the ISIN are downloaded with ranged GETs, dates without index are missing
+
+        :param isin: the ISIN
+        :param start_date: first date of the range in input_date_format
+        :param end_date: last date of the range in input_date_format, defaults to start_date
+        :param columns: target columns to read, all columns if None
+
+        returns:
+            a dataframe of the rows of the ISIN sorted by date
+        """
+        if self.index_key(start_date) is None:
+            raise ValueError('lookup requires trg_isin_index and trg_format parquet')
+        start = datetime.strptime(start_date, self.input_date_format)
+        end = datetime.strptime(end_date or start_date, self.input_date_format)
+        dates = [date.strftime(self.input_date_format) for date in pd.date_range(start, end)]
+        keys = {self.target_key(date) for date in dates}
+        isin_col = self.trg_args.trg_col_isin
+        read_columns = None if columns is None else list(dict.fromkeys([isin_col, *columns]))
+        frames = []
+        for prefix in sorted({self.index_prefix(date) for date in dates}):
+            index = self.trg_bucket.read_index(prefix)
+            if index.empty:
+                continue
+            index = index[(index[isin_col] == isin) & index['key'].isin(keys)]
+            frames.append(self.trg_bucket.read_row_groups(index, read_columns))
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True)
+        # row groups hold the neighbouring ISINs too
+        df = df[df[isin_col] == isin]
+        if self.trg_args.trg_col_date in df.columns:
+            df = df.sort_values(by=self.trg_args.trg_col_date)
+        return (df if columns is None else df[columns]).reset_index(drop=True)
 
     def extract(self):
         """
@@ -47,25 +255,44 @@ class ETL():
         self._logger.info('extracting xetra source data')
         # if the input date is recorded in meta file, skip extract and transform steps
         # read directly from target bucket
-        if MetaFile.date_in_meta_file(self.input_date, self.trg_bucket):
+        if MetaFile.date_in_meta_file(self.input_date, self.trg_bucket, self.trg_args.trg_meta_layout):
             self._logger.info(
                 'input date exists in meta file, reading from target bucket')
-            key = (
-                f'{self.trg_args.trg_prefix}'
-                f'{datetime.strptime(self.input_date, self.input_date_format).strftime(self.trg_args.trg_key_date_format)}.'
-                f'{self.trg_args.trg_format}'
-            )
-            df = self.trg_bucket.read_object(key, self.trg_args.trg_format)
+            df = self.trg_bucket.read_object(
+                self.target_key(), self.trg_args.trg_format)
             self._logger.info('read data from target bucket')
             return (df, True)
         else:
             self._logger.info(
                 'input date does not exist in meta file, reading from source bucket')
-            df = self.src_bucekt.read_objects(
-                input_date=self.input_date, columns=self.src_args.src_columns)
+            self.prev_day = self.extract_previous_day()
+            if self.prev_day is not None:
+                df = self.src_bucekt.read_day(
+                    self.input_date, columns=self.src_args.src_columns, schema=self.src_schema)
+            else:
+                df = self.src_bucekt.read_objects(
+                    input_date=self.input_date, columns=self.src_args.src_columns, schema=self.src_schema)
             self._logger.info('extracted data from source bucket')
             return (df, False)
 
+    def extract_previous_day(self):
+        """
+        read the previous workday's ISINs and opening prices from the target bucket,
+        transform only needs those to compute the change in %
+
+        returns:
+            a dataframe with the isin and opening price columns, None if the
+            previous workday is not in the meta file
+        """
+        prev_date = list_dates(self.input_date, self.input_date_format)[0]
+        if not MetaFile.date_in_meta_file(prev_date, self.trg_bucket, self.trg_args.trg_meta_layout):
+            return None
+        self._logger.info(
+            f'previous workday {prev_date} exists in meta file, reading its opening prices from target bucket')
+        return self.trg_bucket.read_object(
+            self.target_key(prev_date), self.trg_args.trg_format,
+            columns=[self.trg_args.trg_col_isin, self.trg_args.trg_col_op_price])
+
     def transform(self, df: pd.DataFrame, transformed=False):
         """
         apply transformations to extracted df
@@ -90,47 +317,45 @@ class ETL():
             return (df, True)
         # start transformation
         # drop rows with missing values
-        df.dropna(inplace=True)
-        # compute opening and closing price
-        df[self.trg_args.trg_col_op_price] = df\
-            .sort_values(by=[self.src_args.src_col_time])\
-            .groupby([
-                self.src_args.src_col_isin,
-                self.src_args.src_col_date
-            ])[self.src_args.src_col_start_price]\
-            .transform('first')
-        df[self.trg_args.trg_col_clos_price] = df\
-            .sort_values(by=[self.src_args.src_col_time])\
-            .groupby([
+        df = df.dropna()
+        # a stable sort keeps the source order of rows with the same time,
+        # the intraday bars and the daily aggregation share it
+        df = df.sort_values(by=[self.src_args.src_col_time], kind='mergesort')
+        if self.trg_args.trg_bar_intervals:
+            self.bars = resample_bars(df, self.src_args, self.trg_args, self.input_date,
+                                      self.trg_args.trg_bar_intervals)
+        # Aggregating per ISIN and day in one pass over the frame sorted by time
+        # -> opening price, closing price, minimum price, maximum price, traded volume
+        df = df.groupby([
                 self.src_args.src_col_isin,
-                self.src_args.src_col_date
-            ])[self.src_args.src_col_start_price]\
-            .transform('last')
+                self.src_args.src_col_date], as_index=False, observed=True)\
+            .agg(**{
+                self.trg_args.trg_col_op_price: (self.src_args.src_col_start_price, 'first'),
+                self.trg_args.trg_col_clos_price: (self.src_args.src_col_start_price, 'last'),
+                self.trg_args.trg_col_min_price: (self.src_args.src_col_min_price, 'min'),
+                self.trg_args.trg_col_max_price: (self.src_args.src_col_max_price, 'max'),
+                self.trg_args.trg_col_dail_trad_vol: (self.src_args.src_col_traded_vol, 'sum')})
         # rename columns
         df.rename(columns={
             self.src_args.src_col_isin: self.trg_args.trg_col_isin,
-            self.src_args.src_col_date: self.trg_args.trg_col_date,
-            self.src_args.src_col_min_price: self.trg_args.trg_col_min_price,
-            self.src_args.src_col_max_price: self.trg_args.trg_col_max_price,
-            self.src_args.src_col_traded_vol: self.trg_args.trg_col_dail_trad_vol
+            self.src_args.src_col_date: self.trg_args.trg_col_date
         }, inplace=True)
-        # Aggregating per ISIN and day -> opening price, closing price,
-        # minimum price, maximum price, traded volume
-        df = df.groupby([
-            self.trg_args.trg_col_isin,
-            self.trg_args.trg_col_date], as_index=False)\
-            .agg({
-                self.trg_args.trg_col_op_price: 'min',
-                self.trg_args.trg_col_clos_price: 'min',
-                self.trg_args.trg_col_min_price: 'min',
-                self.trg_args.trg_col_max_price: 'max',
-                self.trg_args.trg_col_dail_trad_vol: 'sum'})
+        # rows without volume are dropped, the sum is integer whatever the source column type,
+        # e.g. float64 when the csv had a missing volume, so every engine writes the same schema
+        df[self.trg_args.trg_col_dail_trad_vol] = \
+            df[self.trg_args.trg_col_dail_trad_vol].astype('int64')
+        if self.src_schema is not None:
+            df = self._restore_target_types(df)
         # Change of current day's closing price compared to the
         # previous trading day's closing price in %
-        df[self.trg_args.trg_col_ch_prev_clos] = df\
-            .sort_values(by=[self.trg_args.trg_col_date])\
-            .groupby([self.trg_args.trg_col_isin])[self.trg_args.trg_col_op_price]\
-            .shift(1)
+        if self.prev_day is not None:
+            df[self.trg_args.trg_col_ch_prev_clos] = df[self.trg_args.trg_col_isin].map(
+                self.prev_day.set_index(self.trg_args.trg_col_isin)[self.trg_args.trg_col_op_price])
+        else:
+            df[self.trg_args.trg_col_ch_prev_clos] = df\
+                .sort_values(by=[self.trg_args.trg_col_date])\
+                .groupby([self.trg_args.trg_col_isin])[self.trg_args.trg_col_op_price]\
+                .shift(1)
         df[self.trg_args.trg_col_ch_prev_clos] = (
             df[self.trg_args.trg_col_op_price]
             - df[self.trg_args.trg_col_ch_prev_clos]
@@ -143,12 +368,31 @@ class ETL():
             'applied transformations to source data')
         return (df, False)
 
-    def load(self, df: pd.DataFrame, loaded=False):
+    def _restore_target_types(self, df: pd.DataFrame):
+        """
+        cast columns of the aggregated dataframe from the compact source types
+        back to the types of the target dataset
+
+        :param df: the aggregated dataframe
+        """
+        price_cols = [self.trg_args.trg_col_op_price, self.trg_args.trg_col_clos_price,
+                      self.trg_args.trg_col_min_price, self.trg_args.trg_col_max_price]
+        isin_col = self.trg_args.trg_col_isin
+        date_col = self.trg_args.trg_col_date
+        df[isin_col] = df[isin_col].astype(object)
+        if pd.api.types.is_datetime64_any_dtype(df[date_col]):
+            df[date_col] = df[date_col].dt.strftime(self.input_date_format)
+        df[price_cols] = df[price_cols].astype('float64')
+        # groups of categorical columns come in category order, not sorted by value
+        return df.sort_values(by=[isin_col, date_col]).reset_index(drop=True)
+
+    def load(self, df: pd.DataFrame, loaded=False, update_meta=True):
         """
         save transformed dataframe to target bucket
 
         :param df: the dataframe to be saved
         :param loaded: if the dataframe has been loaded
+        :param update_meta: if the meta file should be updated, a backfill commits all dates at the end instead
 
         returns:
             the transformed dataframe
@@ -158,29 +402,257 @@ class ETL():
                 "dataframe has been loaded or is empty, skip loading")
             return df
         else:
-            target_key = (f'{self.trg_args.trg_prefix}'
-                          f'{datetime.strptime(self.input_date, self.input_date_format).strftime(self.trg_args.trg_key_date_format)}.'
-                          f'{self.trg_args.trg_format}'
-                          )
+            target_key = self.target_key()
+            if self.trg_args.trg_layout == TargetLayout.HIVE.value:
+                # row group statistics of sorted ISINs let readers skip most row groups
+                df = df.sort_values(by=self.trg_args.trg_col_isin).reset_index(drop=True)
             self._logger.info(
                 f'saving transformed data into target bucket {target_key}')
-            self.trg_bucket.write_s3(df, target_key, self.trg_args.trg_format)
+            self.trg_bucket.write_s3(df, target_key, self.trg_args.trg_format,
+                                     row_group_size=self.trg_args.trg_row_group_size,
+                                     index_column=self.trg_args.trg_col_isin, index_key=self.index_key())
             self._logger.info(
                 f'saved transformed data into target bucket {target_key}')
+            self.load_bars()
             # Updating meta file
+            if update_meta:
+                MetaFile.update_meta_file(
+                    self.input_date, self.trg_bucket, self.trg_args.trg_meta_layout)
+                self._logger.info('updated meta file')
+            return df
+
+    def bar_key(self, interval: int, input_date: str = None):
+        """
+        key of the intraday bars of an interval next to the daily data, always parquet
+
+        :param interval: bar length in minutes
+        :param input_date: date in input_date_format, defaults to the input date
+        """
+        date = datetime.strptime(input_date or self.input_date, self.input_date_format)
+        return self.trg_bucket.data_key(f'{self.trg_args.trg_bar_prefix}{interval}m/', date,
+                                        self.trg_args.trg_key_date_format,
+                                        self.trg_bucket.parquet_format, self.trg_args.trg_layout)
+
+    def load_bars(self):
+        """
+        write the bars computed by transform() as ISIN-sorted parquet
+        """
+        for interval, bars in self.bars.items():
+            key = self.bar_key(interval)
+            self._logger.info(f'saving {interval}m bars into target bucket {key}')
+            if isinstance(bars, pa.Table):
+                self.trg_bucket.write_table(bars, key, self.trg_bucket.parquet_format,
+                                            row_group_size=self.trg_args.trg_row_group_size)
+            else:
+                self.trg_bucket.write_s3(bars, key, self.trg_bucket.parquet_format,
+                                         row_group_size=self.trg_args.trg_row_group_size)
+        self.bars = {}
+
+    def extract_table(self):
+        """
+        arrow version of extract(), source objects are parsed by the pyarrow csv reader
+
+        returns:
+            a tuple with two elements
+                1. table: the extracted pyarrow Table, None if there is no source data
+                2. transformed: should the table been transformed
+        """
+        self._logger.info('extracting xetra source data')
+        if MetaFile.date_in_meta_file(self.input_date, self.trg_bucket, self.trg_args.trg_meta_layout):
+            self._logger.info(
+                'input date exists in meta file, reading from target bucket')
+            if self.trg_args.trg_format == self.trg_bucket.parquet_format:
+                table = self.trg_bucket.read_table(self.target_key())
+            else:
+                table = pa.Table.from_pandas(self.trg_bucket.read_object(
+                    self.target_key(), self.trg_args.trg_format), preserve_index=False)
+            self._logger.info('read data from target bucket')
+            return (table, True)
+        self._logger.info(
+            'input date does not exist in meta file, reading from source bucket')
+        prev_day = self.extract_previous_day()
+        self.prev_day = pa.Table.from_pandas(prev_day, preserve_index=False) \
+            if prev_day is not None else None
+        dates = [self.input_date] if self.prev_day is not None \
+            else list_dates(self.input_date, self.input_date_format)
+        table = self.src_bucekt.read_tables(dates, columns=self.src_args.src_columns,
+                                           column_types=source_column_types(self.src_args))
+        self._logger.info('extracted data from source bucket')
+        return (table, False)
+
+    def transform_table(self, table: pa.Table, transformed=False):
+        """
+        arrow version of transform(), aggregated with pyarrow.compute
+
+        :param table: result table from extract_table()
+        :param transformed: if the table has been transformed
+
+        returns:
+            a tuple contaning two elements:
+                table: the transformed table
+                loaded: should the table be loaded
+        """
+        if transformed:
+            self._logger.info(
+                'transformed dataframe, skip transformation')
+            return (table, True)
+        if table is None or table.num_rows == 0:
+            self._logger.info(
+                'empty dataframe, skip transformation')
+            return (table, True)
+        if self.trg_args.trg_bar_intervals:
+            self.bars = aggregate_bars(table, self.src_args, self.trg_args, self.input_date,
+                                       self.trg_args.trg_bar_intervals)
+        table = aggregate_daily(table, self.src_args, self.trg_args, self.input_date, self.prev_day)
+        self._logger.info(
+            'applied transformations to source data')
+        return (table, False)
+
+    def load_table(self, table: pa.Table, loaded=False, update_meta=True):
+        """
+        arrow version of load(), parquet is written straight from the table
+
+        :param table: the table to be saved
+        :param loaded: if the table has been loaded
+        :param update_meta: if the meta file should be updated
+
+        returns:
+            the transformed table
+        """
+        if loaded:
+            self._logger.info(
+                "dataframe has been loaded or is empty, skip loading")
+            return table
+        # aggregate_daily returns the rows sorted by isin, as the hive layout expects
+        target_key = self.target_key()
+        self._logger.info(
+            f'saving transformed data into target bucket {target_key}')
+        self.trg_bucket.write_table(table, target_key, self.trg_args.trg_format,
+                                    row_group_size=self.trg_args.trg_row_group_size,
+                                    index_column=self.trg_args.trg_col_isin, index_key=self.index_key())
+        self._logger.info(
+            f'saved transformed data into target bucket {target_key}')
+        self.load_bars()
+        if update_meta:
             MetaFile.update_meta_file(
-                self.input_date, self.trg_bucket)
+                self.input_date, self.trg_bucket, self.trg_args.trg_meta_layout)
             self._logger.info('updated meta file')
-            return df
+        return table
 
     def run(self):
         """
         combine extract, transform, and load
+        with src_engine arrow the whole job runs on arrow tables
+        the stages are recorded in a RunReport, kept as last_report and written to report_dir
+
+        returns:
+            the dataframe saved to target bucket
+        """
+        if self.src_args.src_engine == PipelineEngine.ARROW.value:
+            extract, transform, load = self.extract_table, self.transform_table, self.load_table
+        else:
+            extract, transform, load = self.extract, self.transform, self.load
+        with metrics.run_report(input_date=self.input_date, engine=self.src_args.src_engine) as report:
+            with metrics.stage('extract') as current:
+                data, transformed = extract()
+                current.rows_out = _rows(data)
+            with metrics.stage('transform') as current:
+                current.rows_in = _rows(data)
+                data, loaded = transform(data, transformed)
+                current.rows_out = _rows(data)
+            with metrics.stage('load') as current:
+                current.rows_in = _rows(data)
+                data = load(data, loaded)
+        self._finish_report(report)
+        if self.src_args.src_engine == PipelineEngine.ARROW.value:
+            return data.to_pandas() if data is not None else pd.DataFrame()
+        return data
+
+    async def arun(self):
+        """
+        asyncio version of run(), the blocking s3 calls run on the thread pool of the event loop
+
+        the meta file checks and the listings of the input date and the previous workday are sent
+        together, objects are parsed as soon as they are downloaded while others are still downloading,
+        and the opening prices of the previous workday are read from the target bucket at the same time
 
         returns:
             the dataframe saved to target bucket
         """
-        df, transformed = self.extract()
-        df, loaded = self.transform(df, transformed)
-        df = self.load(df, loaded)
-        return df
+        arrow = self.src_args.src_engine == PipelineEngine.ARROW.value
+        source = AsyncBucket(self.src_bucekt, max(self.src_bucekt.max_workers, 2))
+        target = AsyncBucket(self.trg_bucket)
+        prev_date = list_dates(self.input_date, self.input_date_format)[0]
+        layout = self.trg_args.trg_meta_layout
+        with metrics.run_report(input_date=self.input_date, engine=self.src_args.src_engine) as report:
+            with metrics.stage('extract') as current:
+                # the listing of the input date is sent before the meta file is known, it is cheap and
+                # cached by the listing cache, and a day missing from the meta file needs it
+                in_meta, prev_in_meta, keys = await asyncio.gather(
+                    target.run(MetaFile.date_in_meta_file, self.input_date, self.trg_bucket, layout),
+                    target.run(MetaFile.date_in_meta_file, prev_date, self.trg_bucket, layout),
+                    source.list_data_keys(self.input_date, self.src_args.src_columns))
+                if in_meta:
+                    self._logger.info(
+                        'input date exists in meta file, reading from target bucket')
+                    data = await target.read_object(self.target_key(), self.trg_args.trg_format)
+                    data = pa.Table.from_pandas(data, preserve_index=False) if arrow else data
+                else:
+                    # like extract, the previous workday is only read from the source if it is not loaded
+                    if not prev_in_meta:
+                        keys = await source.list_data_keys(prev_date, self.src_args.src_columns) + keys
+                    if arrow:
+                        reads = source.map(self.src_bucekt.read_table, keys, self.src_args.src_columns,
+                                           source_column_types(self.src_args))
+                    else:
+                        reads = source.map(self.src_bucekt.read_object, keys, self.src_args.src_columns,
+                                           schema=self.src_schema)
+                    prev_read = target.read_object(
+                        self.target_key(prev_date), self.trg_args.trg_format,
+                        columns=[self.trg_args.trg_col_isin, self.trg_args.trg_col_op_price]) \
+                        if prev_in_meta else asyncio.sleep(0)
+                    frames, prev_day = await asyncio.gather(reads, prev_read)
+                    if arrow:
+                        self.prev_day = pa.Table.from_pandas(prev_day, preserve_index=False) \
+                            if prev_day is not None else None
+                        tables = [table for table in frames if table is not None]
+                        data = pa.concat_tables(tables) if tables else None
+                    else:
+                        self.prev_day = prev_day
+                        frames = [frame for frame in frames if frame is not None]
+                        data = concat_frames(frames) if frames else pd.DataFrame()
+                    self._logger.info('extracted data from source bucket')
+                current.rows_out = _rows(data)
+            transform, load = (self.transform_table, self.load_table) if arrow \
+                else (self.transform, self.load)
+            with metrics.stage('transform') as current:
+                current.rows_in = _rows(data)
+                data, loaded = await source.run(transform, data, in_meta)
+                current.rows_out = _rows(data)
+            with metrics.stage('load') as current:
+                current.rows_in = _rows(data)
+                data = await target.run(load, data, loaded)
+        self._finish_report(report)
+        if arrow:
+            return data.to_pandas() if data is not None else pd.DataFrame()
+        return data
+
+    def _finish_report(self, report: metrics.RunReport):
+        """
+        keep the report of a run as last_report, log its stages and write it to report_dir
+        """
+        self.last_report = report
+        totals = report.totals()
+        self._logger.info(
+            f'run of {self.input_date} took {report.wall_seconds:.3f}s: ' +
+            ', '.join(f"{name} {total['wall_seconds']:.3f}s" for name, total in totals.items()))
+        if self.report_dir is not None:
+            path = report.write(self.report_dir)
+            self._logger.info(f'wrote run report to {path}')
+
+
+def _rows(data):
+    """
+    number of rows of a dataframe or table, 0 for None
+    """
+    return len(data) if data is not None else 0